@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""ActionStack scaling benchmark
+
+   Pushes, removes and updates layers on an ActionStack with the null output
+   backend and a synthetic topology of many devices and LEDs, for layer counts
+   from 1 to 10,000. Every scenario is timed per phase, and reports the operations
+   per second, the memory allocated per operation (its peak above what was in use
+   before it, measured in a separate, traced run) and the writes (SDK packets) per
+   operation. With `--baseline`, it fails when a phase got more than
+   `--threshold` slower than in an earlier run on the same machine, on top of the
+   noise between the rounds of either run.
+
+   Usage: python -m benchmarks.action_stack --layers 1 10 100 1000 10000 --output stack.json
+"""
+
+import abc
+import argparse
+import gc
+import json
+import math
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from openrgbdbus.actions import ActionStack, BaseAction, ZoneAction
+from openrgbdbus.backends import DeviceInfo, NullBackend, ZoneInfo
+from openrgbdbus.selection import LedRanges
+from openrgbdbus.utils import Context
+
+
+def build_devices(devices: int, zones: int, leds: int):
+    return [
+        DeviceInfo(
+            f"Device {device}",
+            [ZoneInfo(f"Zone {zone}", leds) for zone in range(zones)],
+        )
+        for device in range(devices)
+    ]
+
+
+def random_color(rng: random.Random) -> list:
+    return [rng.randrange(256) for _ in range(3)]
+
+
+class Scenario(metaclass=abc.ABCMeta):
+    """Builds the layers of a run, and the phases that time what is done with them"""
+
+    def __init__(self, args, rng: random.Random, repeats: int = 1):
+        self.args = args
+        self.rng = rng
+        # How many times the phases run to reach `--min-operations`
+        self.repeats = repeats
+
+    @abc.abstractmethod
+    def layers(self, count: int) -> list:
+        pass
+
+    def phases(self, stack: ActionStack, context: Context, actions: list):
+        """Yields the name of every phase with its operations, as functions
+
+           The operations of a phase are only created once the previous phase ran.
+        """
+        cookies = []
+        yield "push", [
+            lambda action=action: cookies.append(action.act(context))
+            for action in actions
+        ]
+        yield "remove", [
+            lambda index=index: actions[index].reset(cookies[index], context)
+            for index in self.removal_order(len(cookies))
+        ]
+
+    def removal_order(self, count: int) -> list:
+        order = list(range(count))
+        self.rng.shuffle(order)
+        return order
+
+
+class StackedScenario(Scenario):
+    """Every layer colors the same zone, and they are removed top-down"""
+
+    name = "stacked"
+
+    def layers(self, count: int) -> list:
+        return [
+            ZoneAction(BaseAction(), zones=[0], color=random_color(self.rng), device=0)
+            for _ in range(count)
+        ]
+
+    def removal_order(self, count: int) -> list:
+        return list(reversed(range(count)))
+
+
+class RandomOrderScenario(Scenario):
+    """Every layer colors a random zone, and they are removed in a random order"""
+
+    name = "random_order"
+
+    def layers(self, count: int) -> list:
+        args, rng = self.args, self.rng
+        return [
+            ZoneAction(
+                BaseAction(),
+                zones=[rng.randrange(args.zones)],
+                color=random_color(rng),
+                device=rng.randrange(args.devices),
+            )
+            for _ in range(count)
+        ]
+
+
+class OverlappingScenario(Scenario):
+    """Layers of several zones, or of LED ranges across zone boundaries, that overlap
+
+       Layers that only cover part of an update make the stack look further down.
+    """
+
+    name = "overlapping"
+
+    def layers(self, count: int) -> list:
+        args, rng = self.args, self.rng
+        device_leds = args.zones * args.leds
+        actions = []
+        for _ in range(count):
+            device = rng.randrange(args.devices)
+            if rng.random() < 0.5:
+                count = rng.randint(1, min(4, args.zones))
+                zones = rng.sample(range(args.zones), count)
+                action = ZoneAction(
+                    BaseAction(), zones=zones, color=random_color(rng), device=device
+                )
+            else:
+                start = rng.randrange(device_leds)
+                end = min(device_leds, start + rng.randint(1, args.leds * 2))
+                action = ZoneAction(
+                    BaseAction(),
+                    leds=LedRanges([(start, end)]),
+                    color=random_color(rng),
+                    device=device,
+                )
+            actions.append(action)
+        return actions
+
+
+class ChainedScenario(Scenario):
+    """Every layer is a hook with `--chain` actions, whose states are merged
+
+       The actions wrap each other like those of an `actions:` list, so that every
+       push merges their states with `dict_merge`.
+    """
+
+    name = "chained"
+
+    def layers(self, count: int) -> list:
+        args, rng = self.args, self.rng
+        layers = []
+        for _ in range(count):
+            action = BaseAction()
+            for _ in range(args.chain):
+                action = ZoneAction(
+                    action,
+                    zones=[rng.randrange(args.zones)],
+                    color=random_color(rng),
+                    device=rng.randrange(args.devices),
+                )
+            layers.append(action)
+        return layers
+
+
+class EffectScenario(Scenario):
+    """An effect that gives every LED of a device a new color each frame
+
+       The effect is the top layer, above the static layers of `random_order`. The
+       `--frames` are spread over the repeats.
+    """
+
+    name = "effect"
+
+    def __init__(self, args, rng: random.Random, repeats: int = 1):
+        super().__init__(args, rng, repeats)
+        leds = args.zones * args.leds
+        # A moving color wheel, computed up front so that only the stack is timed
+        hues = np.arange(leds) * 2 * math.pi / leds
+        self.frames = [
+            np.stack(
+                [
+                    np.sin(hues + frame / 10 + shift) * 127 + 128
+                    for shift in (0, 2 * math.pi / 3, 4 * math.pi / 3)
+                ],
+                axis=1,
+            ).astype(np.uint8)
+            for frame in range(max(1, args.frames // repeats))
+        ]
+
+    def layers(self, count: int) -> list:
+        return RandomOrderScenario(self.args, self.rng).layers(count)
+
+    def phases(self, stack: ActionStack, context: Context, actions: list):
+        cookies = []
+        effect = ZoneAction(BaseAction(), colors=[[0, 0, 0]], device=0)
+        stack.selectors.add(effect.selector)
+
+        yield "push", [
+            lambda action=action: cookies.append(action.act(context))
+            for action in actions + [effect]
+        ]
+        yield "update", [
+            lambda colors=colors: stack.update_state(
+                cookies[-1], {"targets": [(effect.selector, "colors", colors)]}
+            )
+            for colors in self.frames
+        ]
+        yield "remove", [
+            lambda action=action, cookie=cookie: action.reset(cookie, context)
+            for action, cookie in zip(actions + [effect], cookies)
+        ]
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        StackedScenario,
+        RandomOrderScenario,
+        OverlappingScenario,
+        ChainedScenario,
+        EffectScenario,
+    )
+}
+
+
+def run_scenario(
+    args, scenario_class, layers: int, traced: bool, scale: int = 1
+) -> dict:
+    """Runs the scenario (repeatedly, for small layer counts) and measures each phase
+
+       `scale` multiplies the number of repeats, so that short phases run for long
+       enough to be timed reliably. Like `timeit`, timed runs disable the garbage
+       collector.
+    """
+    backend = NullBackend(build_devices(args.devices, args.zones, args.leds))
+    stack = ActionStack()
+    context = Context({"action_stack": stack})
+    repeats = max(1, math.ceil(args.min_operations / layers))
+    scenario = scenario_class(args, random.Random(args.seed), repeats)
+    runs = [scenario.layers(layers) for _ in range(repeats * scale)]
+    for actions in runs:
+        for action in actions:
+            stack.selectors.add(*action.selectors())
+    stack.set_backend(backend)
+
+    results = {}
+    if traced:
+        tracemalloc.start()
+    else:
+        gc.collect()
+        gc.disable()
+    try:
+        for actions in runs:
+            for phase, operations in scenario.phases(stack, context, actions):
+                result = results.setdefault(
+                    phase, {"operations": 0, "seconds": 0.0, "writes": 0, "bytes": 0}
+                )
+                writes = backend.writes
+                if traced:
+                    for operation in operations:
+                        tracemalloc.reset_peak()
+                        before = tracemalloc.get_traced_memory()[0]
+                        operation()
+                        result["bytes"] += tracemalloc.get_traced_memory()[1] - before
+                else:
+                    start = time.perf_counter()
+                    for operation in operations:
+                        operation()
+                    result["seconds"] += time.perf_counter() - start
+                result["operations"] += len(operations)
+                result["writes"] += backend.writes - writes
+    finally:
+        if traced:
+            tracemalloc.stop()
+        else:
+            gc.enable()
+    return results
+
+
+def measure(args, scenario_name: str, layers: int) -> list:
+    scenario_class = SCENARIOS[scenario_name]
+    first = run_scenario(args, scenario_class, layers, traced=False)
+    # Phases of a few milliseconds are mostly noise, so those are run for longer
+    shortest = min(result["seconds"] for result in first.values())
+    scale = max(1, math.ceil(args.min_time / shortest))
+    rounds = [first] if scale == 1 else []
+    while len(rounds) < args.rounds:
+        rounds.append(run_scenario(args, scenario_class, layers, False, scale))
+    traced = run_scenario(args, scenario_class, layers, traced=True)
+
+    runs = []
+    for phase in first:
+        results = [r[phase] for r in rounds]
+        per_op = [r["seconds"] / r["operations"] * 1e6 for r in results]
+        # The fastest round counts, as the slower ones were disturbed by something
+        # else. How much slower the median is tells how noisy the phase is.
+        best, median = min(per_op), statistics.median(per_op)
+        runs.append(
+            {
+                "scenario": scenario_name,
+                "layers": layers,
+                "phase": phase,
+                "operations": results[0]["operations"],
+                "ops_per_second": 1e6 / best,
+                "us_per_op": best,
+                "median_us_per_op": median,
+                "noise": median / best - 1,
+                "alloc_bytes_per_op": traced[phase]["bytes"]
+                / traced[phase]["operations"],
+                "writes_per_op": results[0]["writes"] / results[0]["operations"],
+            }
+        )
+    return runs
+
+
+def compare(runs: list, baseline: dict, threshold: float) -> list:
+    """The phases that got slower than in the baseline by more than `threshold`
+
+       The noise of the phase, in either run, is added to the threshold, so that a
+       phase that varies a lot between rounds does not fail on its own variance.
+    """
+    previous = {
+        (run["scenario"], run["layers"], run["phase"]): run
+        for run in baseline.get("runs", [])
+    }
+    regressions = []
+    for run in runs:
+        before = previous.get((run["scenario"], run["layers"], run["phase"]))
+        if before is None:
+            continue
+        slowdown = run["us_per_op"] / before["us_per_op"] - 1
+        allowed = threshold + max(run["noise"], before.get("noise", 0.0))
+        if slowdown > allowed:
+            regressions.append(
+                {
+                    "scenario": run["scenario"],
+                    "layers": run["layers"],
+                    "phase": run["phase"],
+                    "us_per_op": run["us_per_op"],
+                    "baseline_us_per_op": before["us_per_op"],
+                    "slowdown": slowdown,
+                    "allowed": allowed,
+                }
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario",
+        nargs="+",
+        choices=sorted(SCENARIOS),
+        default=sorted(SCENARIOS),
+    )
+    parser.add_argument(
+        "--layers", type=int, nargs="+", default=[1, 10, 100, 1000, 10000]
+    )
+    parser.add_argument("--devices", type=int, default=16)
+    parser.add_argument("--zones", type=int, default=8, help="Zones per device")
+    parser.add_argument("--leds", type=int, default=60, help="LEDs per zone")
+    parser.add_argument(
+        "--frames", type=int, default=500, help="Frames of the effect scenario"
+    )
+    parser.add_argument(
+        "--chain", type=int, default=8, help="Actions per layer of the chained scenario"
+    )
+    parser.add_argument(
+        "--min-operations",
+        type=int,
+        default=2000,
+        help="Small layer counts are repeated until a phase has this many operations",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="Seconds that every phase runs for at least, in each round",
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=5, help="Timed runs, of which the fastest counts"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="The JSON results of an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="How much slower than the baseline a phase may be, e.g. 0.25 for 25%%",
+    )
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for scenario_name in args.scenario:
+        for layers in args.layers:
+            for run in measure(args, scenario_name, layers):
+                print(
+                    f"{run['scenario']:>13} layers={run['layers']:<6}"
+                    f" {run['phase']:>6} {run['ops_per_second']:>10.0f} ops/s"
+                    f" {run['us_per_op']:>9.1f} us/op (+{run['noise']:>4.0%})"
+                    f" {run['alloc_bytes_per_op']:>9.0f} B/op"
+                    f" {run['writes_per_op']:>5.2f} writes/op",
+                    file=sys.stderr,
+                )
+                runs.append(run)
+
+    report = {
+        "benchmark": "action_stack",
+        "topology": {"devices": args.devices, "zones": args.zones, "leds": args.leds},
+        "runs": runs,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(runs, json.load(f), args.threshold)
+        report["threshold"] = args.threshold
+        report["regressions"] = regressions
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['scenario']} layers={regression['layers']}"
+                f" {regression['phase']}: {regression['baseline_us_per_op']:.1f}"
+                f" -> {regression['us_per_op']:.1f} us/op"
+                f" (+{regression['slowdown']:.0%},"
+                f" allowed +{regression['allowed']:.0%})",
+                file=sys.stderr,
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    sys.exit(1 if report.get("regressions") else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""Synthetic D-Bus event-storm benchmark
+
+   Starts a private session bus, loads a configuration with N hooks into a real
+   Connector (in its own process) and floods the bus with signals at a controlled
+   rate from a separate generator process. For every run it reports the accepted
+   event throughput, the end-to-end latency percentiles (signal sent -> action
+   applied), and the CPU time and RSS of the connector process as JSON.
+
+   Usage: python -m benchmarks.dbus_storm --hooks 1 10 100 --rate 2000 --output results.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+
+from .fake_openrgb import FakeOpenRGBServer
+from .private_bus import PrivateBus
+
+NOTIFICATIONS_NAME = "org.freedesktop.Notifications"
+NOTIFICATIONS_PATH = "/org/freedesktop/Notifications"
+PROPERTIES_PATH = "/io/github/openrgbdbus/Benchmark"
+
+
+class NotifyScenario:
+    """Eavesdropped `Notify` method calls, like a chatty messaging application"""
+
+    name = "notify"
+
+    def signal_definition(self, hook_id: int) -> dict:
+        return {
+            "path": NOTIFICATIONS_PATH,
+            "interface": NOTIFICATIONS_NAME,
+            "name": "Notify",
+            "eavesdrop": True,
+            "arguments": [f"bench-{hook_id}"],
+        }
+
+    def prepare(self, connection):
+        from gi.repository import Gio, GLib
+
+        # Nobody receives eavesdropped messages for a name without an owner
+        connection.call_sync(
+            "org.freedesktop.DBus",
+            "/org/freedesktop/DBus",
+            "org.freedesktop.DBus",
+            "RequestName",
+            GLib.Variant("(su)", (NOTIFICATIONS_NAME, 4)),
+            None,
+            Gio.DBusCallFlags.NONE,
+            -1,
+            None,
+        )
+
+    def emit(self, connection, hook_id: int, payload: str):
+        from gi.repository import Gio, GLib
+
+        message = Gio.DBusMessage.new_method_call(
+            NOTIFICATIONS_NAME, NOTIFICATIONS_PATH, NOTIFICATIONS_NAME, "Notify"
+        )
+        message.set_flags(Gio.DBusMessageFlags.NO_REPLY_EXPECTED)
+        message.set_body(
+            GLib.Variant(
+                "(susssasa{sv}i)",
+                (
+                    f"bench-{hook_id}",
+                    0,
+                    "",
+                    repr(time.monotonic()),
+                    payload,
+                    [],
+                    {},
+                    -1,
+                ),
+            )
+        )
+        connection.send_message(message, Gio.DBusSendMessageFlags.NONE)
+
+    # The argument that carries the time at which the signal was sent
+    timestamp_field = "sig_arg3"
+
+    @staticmethod
+    def timestamp(context) -> float:
+        return float(context["sig_arg3"])
+
+
+class PropertiesScenario:
+    """`PropertiesChanged` broadcasts with a (large) payload, like a media player"""
+
+    name = "properties"
+
+    def signal_definition(self, hook_id: int) -> dict:
+        return {
+            "path": PROPERTIES_PATH,
+            "interface": "org.freedesktop.DBus.Properties",
+            "name": "PropertiesChanged",
+            "arguments": [f"io.github.openrgbdbus.Benchmark{hook_id}"],
+        }
+
+    def prepare(self, connection):
+        pass
+
+    def emit(self, connection, hook_id: int, payload: str):
+        from gi.repository import GLib
+
+        changed = {
+            "Timestamp": GLib.Variant("d", time.monotonic()),
+            "Payload": GLib.Variant("s", payload),
+        }
+        connection.emit_signal(
+            None,
+            PROPERTIES_PATH,
+            "org.freedesktop.DBus.Properties",
+            "PropertiesChanged",
+            GLib.Variant(
+                "(sa{sv}as)",
+                (f"io.github.openrgbdbus.Benchmark{hook_id}", changed, []),
+            ),
+        )
+
+    timestamp_field = "sig_arg1"
+
+    @staticmethod
+    def timestamp(context) -> float:
+        return context["sig_arg1"]["Timestamp"]
+
+
+SCENARIOS = {
+    scenario.name: scenario for scenario in (NotifyScenario, PropertiesScenario)
+}
+
+
+def build_configuration(scenario, hooks: int, server: dict, backend: str) -> dict:
+    """Constructs a configuration where every hook listens for its own signal"""
+    return {
+        "version": "0.4.0",
+        "server": server,
+        "output": {"backend": backend},
+        "hooks": {
+            f"bench_{i}": {
+                "bus": "session",
+                "actions": [{"device_id": 0, "zones": [0], "color": [255, 0, 0]}],
+                "trigger": {"signal": scenario.signal_definition(i)},
+                "until": {"sleep": {"duration": "10ms"}},
+            }
+            for i in range(hooks)
+        },
+    }
+
+
+def read_rss() -> int:
+    """Current resident set size of this process in KiB"""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+
+    def at(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000
+
+    return {
+        "p50": at(0.50),
+        "p90": at(0.90),
+        "p99": at(0.99),
+        "p999": at(0.999),
+        "max": samples[-1] * 1000,
+        "mean": sum(samples) / len(samples) * 1000,
+    }
+
+
+class LatencyProbe:
+    """Wraps a hook's action to record when the connector finished applying it"""
+
+    def __init__(self, scenario, counter):
+        self.scenario = scenario
+        self.counter = counter
+        self.latencies = []
+        self.first = None
+        self.last = None
+
+    def wrap(self, action):
+        from openrgbdbus.utils import referenced_names
+
+        probe = self
+
+        class ProbedAction:
+            continuous = action.continuous
+
+            def act(self, context):
+                cookie = action.act(context)
+                now = time.monotonic()
+                probe.latencies.append(now - probe.scenario.timestamp(context))
+                probe.first = probe.first or now
+                probe.last = now
+                probe.counter.value += 1
+                return cookie
+
+            def reset(self, *args, **kwargs):
+                return action.reset(*args, **kwargs)
+
+            def references(self):
+                return referenced_names(action) | {probe.scenario.timestamp_field}
+
+        return ProbedAction()
+
+
+def run_connector(configuration, scenario_name, counter, ready, stop, results):
+    """Entry point of the connector process"""
+    import asyncio
+
+    from gi.repository import GLib
+
+    from openrgbdbus import Connector
+
+    connector = Connector.fromConfig(configuration)
+    probe = LatencyProbe(SCENARIOS[scenario_name](), counter)
+    for hook in connector.hooks:
+        hook.action = probe.wrap(hook.action)
+
+    event_loop = asyncio.get_event_loop()
+    start = {}
+
+    def on_ready():
+        start["usage"] = resource.getrusage(resource.RUSAGE_SELF)
+        start["rss"] = read_rss()
+        ready.set()
+
+    def wait_for_stop():
+        stop.wait()
+        event_loop.call_soon_threadsafe(event_loop.stop)
+        GLib.idle_add(connector.loop.quit)
+
+    # Measuring starts once the hooks have been attached and the output is ready
+    connector.when_ready(on_ready)
+    threading.Thread(target=wait_for_stop, daemon=True).start()
+    connector.start()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    user = usage.ru_utime - start["usage"].ru_utime
+    system = usage.ru_stime - start["usage"].ru_stime
+    window = (probe.last - probe.first) if probe.first else 0
+    results.put(
+        {
+            "accepted": len(probe.latencies),
+            "throughput": (len(probe.latencies) - 1) / window if window else None,
+            "latency_ms": percentiles(probe.latencies),
+            "cpu_seconds": {"user": user, "system": system},
+            "rss_kib": {
+                "start": start["rss"],
+                "end": read_rss(),
+                "peak": usage.ru_maxrss,
+            },
+        }
+    )
+
+
+def run_generator(scenario_name, hooks, rate, count, payload_size, results):
+    """Entry point of the generator process: emits `count` events at `rate` per second"""
+    from gi.repository import Gio
+
+    scenario = SCENARIOS[scenario_name]()
+    connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+    scenario.prepare(connection)
+    payload = "x" * payload_size
+
+    interval = 1 / rate if rate else 0
+    start = time.monotonic()
+    for i in range(count):
+        deadline = start + i * interval
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        scenario.emit(connection, i % hooks, payload)
+    connection.flush_sync(None)
+    elapsed = time.monotonic() - start
+    results.put({"sent": count, "send_rate": count / elapsed if elapsed else None})
+
+
+def run_once(args, scenario_name, hooks, server=None):
+    mp = multiprocessing.get_context("spawn")
+    counter = mp.Value("Q", 0, lock=False)
+    ready, stop = mp.Event(), mp.Event()
+    connector_results, generator_results = mp.Queue(), mp.Queue()
+
+    if server:
+        host, port = server.address
+    else:
+        host, port = args.host, args.port
+    configuration = build_configuration(
+        SCENARIOS[scenario_name](), hooks, {"host": host, "port": port}, args.backend
+    )
+    connector = mp.Process(
+        target=run_connector,
+        args=(configuration, scenario_name, counter, ready, stop, connector_results),
+    )
+    connector.start()
+    if not ready.wait(args.timeout):
+        connector.terminate()
+        raise RuntimeError("The connector did not start in time")
+
+    if server:
+        server.reset_packets()
+    generator = mp.Process(
+        target=run_generator,
+        args=(
+            scenario_name,
+            hooks,
+            args.rate,
+            args.count,
+            args.payload_size,
+            generator_results,
+        ),
+    )
+    generator.start()
+    sent = generator_results.get(timeout=args.timeout)
+    generator.join()
+
+    # Drain: wait until everything arrived, or nothing arrived for a while
+    last_value, last_change = counter.value, time.monotonic()
+    while counter.value < args.count and time.monotonic() - last_change < args.drain:
+        time.sleep(0.05)
+        if counter.value != last_value:
+            last_value, last_change = counter.value, time.monotonic()
+
+    stop.set()
+    result = connector_results.get(timeout=args.timeout)
+    connector.join()
+
+    cpu_time = result["cpu_seconds"]["user"] + result["cpu_seconds"]["system"]
+    if server and result["accepted"]:
+        result["packets_per_event"] = server.packet_count() / result["accepted"]
+        result["bytes_per_event"] = server.bytes_received() / result["accepted"]
+    return {
+        "scenario": scenario_name,
+        "hooks": hooks,
+        "backend": args.backend,
+        "rate": args.rate,
+        "payload_size": args.payload_size,
+        **sent,
+        **result,
+        "dropped": sent["sent"] - result["accepted"],
+        "cpu_per_event_us": (
+            cpu_time / result["accepted"] * 1e6 if result["accepted"] else None
+        ),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario",
+        nargs="+",
+        choices=sorted(SCENARIOS),
+        default=sorted(SCENARIOS),
+        help="The kind(s) of storm to generate",
+    )
+    parser.add_argument(
+        "--hooks", type=int, nargs="+", default=[1, 10, 100], help="Hook counts to test"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=1000, help="Events per second (0 = unthrottled)"
+    )
+    parser.add_argument("--count", type=int, default=5000, help="Events per run")
+    parser.add_argument(
+        "--payload-size",
+        type=int,
+        default=64,
+        help="Size of the payload string in bytes",
+    )
+    parser.add_argument(
+        "--host", default="localhost", help="OpenRGB SDK host (requires --port)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        help="OpenRGB SDK port. Without it, a fake SDK server is used instead",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["openrgb", "null"],
+        default="openrgb",
+        help="Output backend of the connector. 'null' measures the dispatch cost only",
+    )
+    parser.add_argument(
+        "--drain", type=float, default=2, help="Seconds to wait for stragglers"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=60, help="Seconds before a run is aborted"
+    )
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    runs = []
+    server = FakeOpenRGBServer().start() if args.port is None else None
+    with PrivateBus("session"):
+        for scenario_name in args.scenario:
+            for hooks in args.hooks:
+                run = run_once(args, scenario_name, hooks, server)
+                print(
+                    f"{scenario_name:>10} hooks={hooks:<5} accepted={run['accepted']}/{run['sent']}"
+                    f" p50={run['latency_ms'].get('p50', 0):.2f}ms"
+                    f" p99={run['latency_ms'].get('p99', 0):.2f}ms",
+                    file=sys.stderr,
+                )
+                runs.append(run)
+    if server:
+        server.stop()
+
+    report = {
+        "benchmark": "dbus_storm",
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
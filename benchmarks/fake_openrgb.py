@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""Local stand-in for the OpenRGB SDK server
+
+   Speaks the SDK wire protocol over TCP, so the real `OpenRGBClient` (and thus the
+   whole connector) can talk to it without any RGB hardware. It serves a virtual
+   device topology, records every packet it receives with a timestamp, keeps track
+   of the resulting per-LED colors and can inject latency and disconnects.
+
+   Usage: python -m benchmarks.fake_openrgb --port 6742
+"""
+
+import argparse
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import namedtuple
+from typing import List
+
+from openrgb.utils import DeviceType, PacketType
+
+HEADER = struct.Struct("4sIII")
+MAGIC = b"ORGB"
+# The highest protocol version this server knows how to describe devices with
+PROTOCOL_VERSION = 1
+
+# Mode flags/color mode of the only mode every virtual device has: 'Direct'
+MODE_FLAG_HAS_PER_LED_COLOR = 1 << 5
+MODE_COLORS_PER_LED = 1
+
+Packet = namedtuple("Packet", ["timestamp", "device", "type", "payload"])
+
+
+class VirtualZone:
+    def __init__(self, name: str, leds: int, zone_type: int = 1):
+        self.name = name
+        self.leds = leds
+        self.zone_type = zone_type
+
+
+class VirtualDevice:
+    def __init__(
+        self,
+        name: str,
+        zones: List[VirtualZone],
+        device_type: DeviceType = DeviceType.LEDSTRIP,
+    ):
+        self.name = name
+        self.zones = zones
+        self.device_type = device_type
+        self.active_mode = 0
+        self.colors = [(0, 0, 0)] * self.led_count
+
+    @property
+    def led_count(self) -> int:
+        return sum(zone.leds for zone in self.zones)
+
+    def zone_offset(self, zone_id: int) -> int:
+        return sum(zone.leds for zone in self.zones[:zone_id])
+
+    def describe(self, version: int) -> bytes:
+        """Serializes the device the way OpenRGB answers REQUEST_CONTROLLER_DATA"""
+        data = struct.pack("i", self.device_type) + _pack_string(self.name)
+        if version >= 1:
+            data += _pack_string("Virtual")
+        data += b"".join(
+            _pack_string(s) for s in ("Virtual device", "1.0", "", "benchmark")
+        )
+
+        data += struct.pack("H", 1) + struct.pack("i", self.active_mode)
+        data += _pack_string("Direct") + struct.pack(
+            "iIIIIIIIIH",
+            0,
+            MODE_FLAG_HAS_PER_LED_COLOR,
+            0,
+            0,
+            0,
+            0,
+            0,
+            0,
+            MODE_COLORS_PER_LED,
+            0,
+        )
+
+        data += struct.pack("H", len(self.zones))
+        for zone in self.zones:
+            data += _pack_string(zone.name) + struct.pack(
+                "iIIIH", zone.zone_type, zone.leds, zone.leds, zone.leds, 0
+            )
+
+        data += struct.pack("H", self.led_count)
+        for zone in self.zones:
+            for i in range(zone.leds):
+                data += _pack_string(f"{zone.name} LED {i}") + struct.pack("I", 0)
+
+        data += struct.pack("H", self.led_count)
+        data += b"".join(struct.pack("BBBx", *color) for color in self.colors)
+        return struct.pack("I", len(data) + 4) + data
+
+
+def default_topology() -> List[VirtualDevice]:
+    """A small but representative desktop: a keyboard, two fans and an LED strip"""
+    return [
+        VirtualDevice(
+            "Virtual Keyboard", [VirtualZone("Keys", 104, 2)], DeviceType.KEYBOARD
+        ),
+        VirtualDevice(
+            "Virtual Motherboard",
+            [VirtualZone(f"Fan {i}", 8) for i in range(2)] + [VirtualZone("Strip", 60)],
+            DeviceType.MOTHERBOARD,
+        ),
+        VirtualDevice("Virtual Mouse", [VirtualZone("Logo", 1, 0)], DeviceType.MOUSE),
+    ]
+
+
+def _pack_string(string: str) -> bytes:
+    encoded = string.encode() + b"\0"
+    return struct.pack("H", len(encoded)) + encoded
+
+
+def _unpack_colors(payload: bytes, offset: int) -> list:
+    (count,) = struct.unpack_from("H", payload, offset)
+    return [
+        struct.unpack_from("BBB", payload, offset + 2 + 4 * i) for i in range(count)
+    ]
+
+
+class _SDKRequestHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.server.owner._register_client(self.request)
+        self.version = 0
+
+    def finish(self):
+        self.server.owner._unregister_client(self.request)
+
+    def handle(self):
+        owner = self.server.owner
+        try:
+            while True:
+                header = self._receive(HEADER.size)
+                magic, device, packet_type, size = HEADER.unpack(header)
+                if magic != MAGIC:
+                    return
+                payload = self._receive(size)
+                if not owner._record(
+                    Packet(time.monotonic(), device, packet_type, payload)
+                ):
+                    return
+                self._handle_packet(device, packet_type, payload)
+        except (ConnectionError, OSError):
+            return
+
+    def _receive(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Client disconnected")
+            data += chunk
+        return data
+
+    def _reply(self, device: int, packet_type: int, payload: bytes):
+        self.request.sendall(
+            HEADER.pack(MAGIC, device, packet_type, len(payload)) + payload
+        )
+
+    def _handle_packet(self, device_id: int, packet_type: int, payload: bytes):
+        owner = self.server.owner
+        if packet_type == PacketType.REQUEST_PROTOCOL_VERSION:
+            (requested,) = struct.unpack("I", payload)
+            self.version = min(requested, owner.protocol_version)
+            self._reply(0, packet_type, struct.pack("I", owner.protocol_version))
+        elif packet_type == PacketType.REQUEST_CONTROLLER_COUNT:
+            self._reply(0, packet_type, struct.pack("I", len(owner.devices)))
+        elif packet_type == PacketType.REQUEST_CONTROLLER_DATA:
+            with owner.lock:
+                description = owner.devices[device_id].describe(self.version)
+            self._reply(device_id, packet_type, description)
+        elif packet_type == PacketType.RGBCONTROLLER_UPDATELEDS:
+            with owner.lock:
+                device = owner.devices[device_id]
+                device.colors = _unpack_colors(payload, 4)[: device.led_count]
+        elif packet_type == PacketType.RGBCONTROLLER_UPDATEZONELEDS:
+            (zone_id,) = struct.unpack_from("I", payload, 4)
+            colors = _unpack_colors(payload, 8)
+            with owner.lock:
+                device = owner.devices[device_id]
+                offset = device.zone_offset(zone_id)
+                count = min(len(colors), device.zones[zone_id].leds)
+                device.colors[offset : offset + count] = colors[:count]
+        elif packet_type == PacketType.RGBCONTROLLER_UPDATESINGLELED:
+            led_id, r, g, b = struct.unpack("iBBBx", payload)
+            with owner.lock:
+                owner.devices[device_id].colors[led_id] = (r, g, b)
+        elif packet_type == PacketType.RGBCONTROLLER_UPDATEMODE:
+            (mode_id,) = struct.unpack_from("i", payload, 4)
+            with owner.lock:
+                owner.devices[device_id].active_mode = mode_id
+        # Everything else (client name, custom mode, ...) only gets recorded
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class FakeOpenRGBServer:
+    """A fake OpenRGB SDK server running on a background thread
+
+       Use it as a context manager. Pass port 0 to pick a free port and read `port`.
+
+       :param devices: the virtual devices to serve (defaults to `default_topology()`)
+       :param latency: seconds to wait before handling each received packet
+       :param disconnect_after: drop the connection after receiving this many packets
+    """
+
+    def __init__(
+        self,
+        devices: List[VirtualDevice] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        protocol_version: int = PROTOCOL_VERSION,
+        latency: float = 0,
+        disconnect_after: int = None,
+    ):
+        self.devices = devices if devices is not None else default_topology()
+        self.protocol_version = protocol_version
+        self.latency = latency
+        self.disconnect_after = disconnect_after
+        self.packets: List[Packet] = []
+        self.lock = threading.RLock()
+        self._clients = set()
+        self._server = _ThreadingServer((host, port), _SDKRequestHandler)
+        self._server.owner = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self.disconnect()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def settle(self, idle: float = 0.05, timeout: float = 5):
+        """Waits until no packets arrived for `idle` seconds
+
+           Writes do not wait for a response, so they can still be underway.
+        """
+        deadline = time.monotonic() + timeout
+        count = self.packet_count()
+        while time.monotonic() < deadline:
+            time.sleep(idle)
+            new_count = self.packet_count()
+            if new_count == count:
+                return
+            count = new_count
+
+    def reset_packets(self):
+        with self.lock:
+            self.packets = []
+
+    def packet_count(self, packet_type: int = None) -> int:
+        with self.lock:
+            return sum(1 for p in self.packets if packet_type in (None, p.type))
+
+    def bytes_received(self, packet_type: int = None) -> int:
+        """Bytes on the wire (header included) of every recorded packet of this type"""
+        with self.lock:
+            return sum(
+                HEADER.size + len(p.payload)
+                for p in self.packets
+                if packet_type in (None, p.type)
+            )
+
+    def colors(self, device_id: int) -> list:
+        """The current per-LED colors of a device as (r, g, b) tuples"""
+        with self.lock:
+            return list(self.devices[device_id].colors)
+
+    def set_devices(self, devices: List[VirtualDevice]):
+        """Replaces the topology and notifies the clients, like a USB replug would"""
+        with self.lock:
+            self.devices = devices
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.sendall(HEADER.pack(MAGIC, 0, PacketType.DEVICE_LIST_UPDATED, 0))
+            except OSError:
+                pass
+
+    def disconnect(self):
+        """Drops every connected client"""
+        with self.lock:
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _register_client(self, client):
+        with self.lock:
+            self._clients.add(client)
+
+    def _unregister_client(self, client):
+        with self.lock:
+            self._clients.discard(client)
+
+    def _record(self, packet: Packet) -> bool:
+        """Stores the packet; returns False when the connection should be dropped"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.packets.append(packet)
+            if (
+                self.disconnect_after is not None
+                and len(self.packets) >= self.disconnect_after
+            ):
+                self.disconnect_after = None
+                return False
+        return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6742)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Seconds of delay per packet"
+    )
+    args = parser.parse_args(argv)
+
+    with FakeOpenRGBServer(
+        host=args.host, port=args.port, latency=args.latency
+    ) as server:
+        print(
+            "Serving %d virtual devices on %s:%d"
+            % (len(server.devices), *server.address)
+        )
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        print(
+            "Received %d packets (%d bytes)"
+            % (server.packet_count(), server.bytes_received())
+        )
+
+
+if __name__ == "__main__":
+    main()
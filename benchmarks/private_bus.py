@@ -0,0 +1,57 @@
+import os
+import shutil
+import subprocess
+
+# Environment variables consulted by GIO (and thus pydbus) to locate each bus
+_ADDRESS_VARIABLES = {
+    "session": "DBUS_SESSION_BUS_ADDRESS",
+    "system": "DBUS_SYSTEM_BUS_ADDRESS",
+}
+
+
+class PrivateBus:
+    """Runs a throwaway dbus-daemon for the duration of a with-block
+
+       The daemon always uses the session bus policy (which permits eavesdropping),
+       but can stand in for either the session or the system bus. The address is
+       exported through the environment, so processes started inside the block
+       connect to the private daemon instead of the user's real bus.
+    """
+
+    def __init__(self, kind: str = "session"):
+        if kind not in _ADDRESS_VARIABLES:
+            raise ValueError(f"Unknown bus kind '{kind}'")
+        self.kind = kind
+        self.address = None
+        self._process = None
+        self._previous_address = None
+
+    def __enter__(self):
+        executable = shutil.which("dbus-daemon")
+        if not executable:
+            raise RuntimeError("dbus-daemon is required to run the benchmarks")
+
+        self._process = subprocess.Popen(
+            [executable, "--session", "--nofork", "--print-address=1"],
+            stdout=subprocess.PIPE,
+        )
+        self.address = self._process.stdout.readline().decode().strip()
+        if not self.address:
+            self._process.kill()
+            raise RuntimeError("dbus-daemon did not report its address")
+
+        variable = _ADDRESS_VARIABLES[self.kind]
+        self._previous_address = os.environ.get(variable)
+        os.environ[variable] = self.address
+        return self
+
+    def __exit__(self, *exc_info):
+        variable = _ADDRESS_VARIABLES[self.kind]
+        if self._previous_address is None:
+            os.environ.pop(variable, None)
+        else:
+            os.environ[variable] = self._previous_address
+
+        self._process.terminate()
+        self._process.wait()
+        self._process.stdout.close()
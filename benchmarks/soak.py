@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Soak test: the memory of a connector has to stay flat under a stream of events
+
+   Feeds a real Connector (with the null output backend) a long stream of
+   synthetic signals through a `ReplayBus`, so no D-Bus daemon is needed. Some
+   hooks end after a delay, others when a matching signal arrives. At every
+   checkpoint the connector is allowed to settle, after which its RSS and its live
+   objects (layers, subscriptions, contexts, timers) are sampled. The first
+   checkpoint is the baseline. The test fails when the RSS grew by more than
+   `--max-growth` KiB after it, or when objects were left behind.
+
+   Usage: python -m benchmarks.soak --events 1000000 --output soak.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import time
+
+from gi.repository import Gio, GLib
+
+from openrgbdbus import Connector
+from openrgbdbus.dispatch import BusDispatcher
+from openrgbdbus.trace import TraceReplayer
+
+from .dbus_storm import read_rss
+from .fake_openrgb import FakeOpenRGBServer
+
+NOTIFICATIONS = "org.freedesktop.Notifications"
+SOAK_INTERFACE = "io.github.openrgbdbus.Soak"
+SOAK_PATH = "/io/github/openrgbdbus/Soak"
+
+# The live objects that have to be back at their baseline at the end
+STABLE_OBJECTS = ("layers", "subscriptions", "signal matches", "contexts")
+
+
+def build_configuration(hooks: int, server: dict) -> dict:
+    """Hooks that end after a delay, and one that ends on a signal of its own"""
+    configuration = {
+        "version": "0.4.0",
+        "logging": "warning",
+        "server": server,
+        # The devices are only read from the server once
+        "output": {"backend": "null"},
+        "hooks": {
+            f"notify_{i}": {
+                "actions": [{"device_id": 0, "zones": [0], "color": [255, 0, 0]}],
+                "trigger": {
+                    "signal": {
+                        "path": "/org/freedesktop/Notifications",
+                        "interface": NOTIFICATIONS,
+                        "name": "Notify",
+                        "arguments": [f"soak-{i}"],
+                    }
+                },
+                "until": {"sleep": {"duration": "5ms"}},
+            }
+            for i in range(hooks)
+        },
+    }
+    configuration["hooks"]["toggle"] = {
+        "actions": [{"device_id": 1, "zones": [0], "color": [0, 0, 255]}],
+        "trigger": {
+            "signal": {"path": SOAK_PATH, "interface": SOAK_INTERFACE, "name": "Start"}
+        },
+        "until": {
+            "signal": {
+                "path": SOAK_PATH,
+                "interface": SOAK_INTERFACE,
+                "name": "Stop",
+                "arguments": ["${sig_arg0}"],
+            }
+        },
+    }
+    return configuration
+
+
+def notify(hook: int, payload: str):
+    message = Gio.DBusMessage.new_signal(
+        "/org/freedesktop/Notifications", NOTIFICATIONS, "Notify"
+    )
+    message.set_body(
+        GLib.Variant(
+            "(susssasa{sv}i)",
+            (f"soak-{hook}", 0, "", "Soak", payload, [], {}, -1),
+        )
+    )
+    return message
+
+
+def toggle(member: str, token: str):
+    message = Gio.DBusMessage.new_signal(SOAK_PATH, SOAK_INTERFACE, member)
+    message.set_body(GLib.Variant("(s)", (token,)))
+    return message
+
+
+class SoakReplayer(TraceReplayer):
+    """Replays generated signals instead of a trace, and samples at checkpoints"""
+
+    def __init__(self, connector, loop, args):
+        super().__init__(path=None, speed=0)
+        self.connector = connector
+        self.loop = loop
+        self.args = args
+        self.samples = []
+
+    def replay(self):
+        args = self.args
+        bus = self.buses["session"]
+        payload = "x" * args.payload_size
+        interval = max(1, args.events // args.checkpoints)
+        start = time.monotonic()
+        for i in range(args.events):
+            if i % 8 == 6:
+                message = toggle("Start", f"token-{i}")
+            elif i % 8 == 7:
+                # Its 'until' trigger is only subscribed once 'Start' activated it
+                self.settle()
+                message = toggle("Stop", f"token-{i - 1}")
+            else:
+                message = notify(i % args.hooks, payload)
+            bus.con.dispatch(message)
+            self.count += 1
+            if self.count % interval == 0:
+                self.checkpoint()
+        self.elapsed = time.monotonic() - start
+
+    def settle(self):
+        """Waits until the event loop has handled every replayed message"""
+        BusDispatcher.join_all()
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), self.loop).result()
+
+    def checkpoint(self):
+        BusDispatcher.join_all()
+        sample = asyncio.run_coroutine_threadsafe(self._sample(), self.loop).result()
+        self.samples.append(sample)
+        print(
+            f"{sample['events']:>9} events  rss={sample['rss_kib']} KiB"
+            f"  {sample['objects']}",
+            file=sys.stderr,
+        )
+
+    async def _sample(self) -> dict:
+        # Let the pending 'until' triggers expire
+        await asyncio.sleep(0.05)
+        gc.collect()
+        return {
+            "events": self.count,
+            "rss_kib": read_rss(),
+            "objects": self.connector.profiler.live_objects(),
+        }
+
+
+def run(args) -> dict:
+    with FakeOpenRGBServer() as server:
+        server_address = {"host": "127.0.0.1", "port": server.port}
+        configuration = build_configuration(args.hooks, server_address)
+        connector = Connector.fromConfig(configuration)
+        replayer = SoakReplayer(connector, asyncio.get_event_loop(), args)
+        connector.replay(replayer)
+        connector.start()
+
+    baseline, last = replayer.samples[0], replayer.samples[-1]
+    growth = last["rss_kib"] - baseline["rss_kib"]
+    leaked = {
+        name: last["objects"][name] - baseline["objects"][name]
+        for name in STABLE_OBJECTS
+        if last["objects"][name] != baseline["objects"][name]
+    }
+    return {
+        "benchmark": "soak",
+        "events": replayer.count,
+        "hooks": args.hooks + 1,
+        "payload_size": args.payload_size,
+        "events_per_second": replayer.count / replayer.elapsed,
+        "rss_growth_kib": growth,
+        "max_growth_kib": args.max_growth,
+        "leaked_objects": leaked,
+        "passed": growth <= args.max_growth and not leaked,
+        "samples": replayer.samples,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument(
+        "--hooks", type=int, default=10, help="Hooks that end after a delay"
+    )
+    parser.add_argument(
+        "--payload-size",
+        type=int,
+        default=1024,
+        help="Size of an argument that no hook uses, in bytes",
+    )
+    parser.add_argument("--checkpoints", type=int, default=10)
+    parser.add_argument(
+        "--max-growth",
+        type=int,
+        default=2048,
+        help="KiB that the RSS may grow after the first checkpoint",
+    )
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print(
+        f"{report['events']} events at {report['events_per_second']:.0f}/s:"
+        f" RSS grew {report['rss_growth_kib']} KiB after the first checkpoint,"
+        f" leaked {report['leaked_objects'] or 'nothing'}"
+        f" -> {'PASS' if report['passed'] else 'FAIL'}",
+        file=sys.stderr,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
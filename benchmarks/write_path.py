@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Write-path benchmark against the fake OpenRGB SDK server
+
+   Activates and resets `ZoneAction`s on an `ActionStack` that is connected to a
+   `FakeOpenRGBServer`, and reports the time, packets and bytes each activation
+   costs. After every run it checks that the LEDs ended up in their original colors.
+
+   Usage: python -m benchmarks.write_path --activations 200 --output write_path.json
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from openrgb import OpenRGBClient
+from openrgb.utils import PacketType
+
+from openrgbdbus.actions import ActionStack, BaseAction, ZoneAction
+from openrgbdbus.backends import OpenRGBBackend
+from openrgbdbus.utils import Context
+
+from .fake_openrgb import FakeOpenRGBServer
+
+# (device id, zones) of every scenario, matching the default topology of the server
+SCENARIOS = {
+    "single_zone": (1, [0]),
+    "multi_zone": (1, [0, 1, 2]),
+    "large_zone": (0, [0]),
+}
+
+
+def run_scenario(name, activations, latency):
+    device, zones = SCENARIOS[name]
+    with FakeOpenRGBServer(latency=latency) as server:
+        client = OpenRGBClient("127.0.0.1", server.port, "Write-path benchmark")
+        context = Context({"action_stack": ActionStack(OpenRGBBackend(client))})
+        action = ZoneAction(BaseAction(), zones=zones, color=[255, 0, 0], device=device)
+        initial = server.colors(device)
+        server.reset_packets()
+
+        start = time.perf_counter()
+        for _ in range(activations):
+            cookie = action.act(context)
+            action.reset(cookie, context)
+        elapsed = time.perf_counter() - start
+        server.settle()
+
+        packets = {
+            packet_type.name: server.packet_count(packet_type)
+            for packet_type in PacketType
+            if server.packet_count(packet_type)
+        }
+        client.disconnect()
+        return {
+            "scenario": name,
+            "activations": activations,
+            "latency": latency,
+            "activation_ms": elapsed / activations * 1000,
+            "packets_per_activation": server.packet_count() / activations,
+            "bytes_per_activation": server.bytes_received() / activations,
+            "packets": packets,
+            "restored": server.colors(device) == initial,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario",
+        nargs="+",
+        choices=sorted(SCENARIOS),
+        default=sorted(SCENARIOS),
+    )
+    parser.add_argument("--activations", type=int, default=100)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Server delay per packet in seconds"
+    )
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for name in args.scenario:
+        run = run_scenario(name, args.activations, args.latency)
+        print(
+            f"{name:>12} {run['activation_ms']:.2f}ms/activation"
+            f" {run['packets_per_activation']:.1f} packets"
+            f" {run['bytes_per_activation']:.0f} bytes"
+            f" restored={run['restored']}",
+            file=sys.stderr,
+        )
+        runs.append(run)
+
+    report = {"benchmark": "write_path", "runs": runs}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
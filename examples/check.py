@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Loads every example, to check that it still matches the configuration format
+
+   Full configurations are loaded into a `Connector`, hook files (in `hooks/`) into
+   a `Hook`. Nothing is attached or connected, so neither D-Bus nor OpenRGB is
+   needed. Exits with 1 when an example could not be loaded.
+
+   Usage: python -m examples.check [FILE ...]
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+from openrgbdbus import Connector
+from openrgbdbus.configuration import load_configuration
+from openrgbdbus.configuration.object_factories import HookFactory
+
+EXAMPLES = os.path.dirname(os.path.abspath(__file__))
+
+
+def check(path: str):
+    """Loads the example, and raises whatever made that fail"""
+    if os.path.basename(os.path.dirname(os.path.abspath(path))) == "hooks":
+        name = os.path.splitext(os.path.basename(path))[0]
+        HookFactory.create(load_configuration(path), name=name)
+    else:
+        Connector.fromConfig(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    examples = glob.glob(os.path.join(EXAMPLES, "**", "*.yaml"), recursive=True)
+    parser.add_argument("files", nargs="*", default=sorted(examples))
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for path in args.files:
+        try:
+            check(path)
+        except Exception as ex:
+            failed += 1
+            print(f"FAIL {os.path.relpath(path)}: {type(ex).__name__}: {ex}")
+        else:
+            print(f"ok   {os.path.relpath(path)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 
+import time
+
+started = time.perf_counter()
+
 import argparse
 import atexit
-
-from openrgbdbus import Connector
+import json
+import sys
 
 parser = argparse.ArgumentParser(description="Process some integers.")
 parser.add_argument(
@@ -13,10 +17,93 @@ parser.add_argument(
     default="./configuration.yaml",
     help="The location of the configuration file",
 )
+parser.add_argument(
+    "--backend",
+    choices=["openrgb", "null", "recording"],
+    help="Override the output backend of the configuration",
+)
+trace_group = parser.add_mutually_exclusive_group()
+trace_group.add_argument(
+    "--record",
+    metavar="TRACE",
+    help="Record the incoming D-Bus messages to a trace file ('.gz' to compress)",
+)
+trace_group.add_argument(
+    "--replay",
+    metavar="TRACE",
+    help="Replay a recorded trace instead of listening to the live D-Bus",
+)
+parser.add_argument(
+    "--replay-speed",
+    type=float,
+    default=1,
+    help="Replay speed relative to the recording. 0 replays as fast as possible",
+)
+
+parser.add_argument(
+    "--profile-startup",
+    action="store_true",
+    help="Print how long each phase of the startup takes",
+)
+parser.add_argument(
+    "--profile-window",
+    type=float,
+    default=30,
+    help="How many seconds a profile started with SIGUSR1 runs",
+)
+parser.add_argument(
+    "--control-socket",
+    nargs="?",
+    const="",
+    metavar="PATH",
+    help="Accept commands on a Unix socket (default: in $XDG_RUNTIME_DIR)",
+)
+parser.add_argument(
+    "--control",
+    nargs="+",
+    metavar=("COMMAND", "KEY=VALUE"),
+    help="Send a command, e.g. 'profile duration=10', to a running connector",
+)
 
 args = parser.parse_args()
 
-connector = Connector.fromConfig(args.configuration)
+if args.control:
+    from openrgbdbus.control import send_command
+    from openrgbdbus.expressions import parse_literal
+
+    command, *arguments = args.control
+    arguments = dict(argument.split("=", 1) for argument in arguments)
+    result = send_command(
+        command,
+        path=args.control_socket or None,
+        **{key: parse_literal(value) for key, value in arguments.items()},
+    )
+    print(result if isinstance(result, str) else json.dumps(result, indent=2))
+    sys.exit(0)
+
+# Imported after parsing the arguments, so that e.g. '--help' does not wait for them
+importing = time.perf_counter()
+from openrgbdbus import Connector
+from openrgbdbus.control import ControlServer
+from openrgbdbus.startup import StartupProfile
+from openrgbdbus.trace import TraceRecorder, TraceReplayer
+
+profile = StartupProfile(started)
+profile.record("imports", importing)
+
+with profile.phase("configuration"):
+    connector = Connector.fromConfig(args.configuration, backend=args.backend)
+
+if args.profile_startup:
+    connector.profile_startup(profile)
+connector.profiler.window = args.profile_window
+if args.control_socket is not None:
+    connector.serve_control(ControlServer(args.control_socket or None))
+
+if args.record:
+    connector.record(TraceRecorder(args.record))
+elif args.replay:
+    connector.replay(TraceReplayer(args.replay, speed=args.replay_speed))
 
 
 def close():
@@ -1,43 +1,160 @@
+import asyncio
+import logging
 import math
 import os
 import struct
-from typing import List
+from string import Template
+from typing import Dict, List, Set, Tuple, Union
 
-import numpy as np
-from openrgb import OpenRGBClient
-from openrgb.orgb import Device, Zone
-from openrgb.utils import DeviceType, RGBColor
+from .backends import DeviceInfo, OutputBackend
+from .postprocessing import PostProcessor
+from .scenes import Scene, SceneStore
+from .selection import DeviceSelector, LedRanges, SelectorIndex
+from .utils import Context, dict_merge, lazy_import, substitute_all
 
-from .utils import Context, dict_merge
+np = lazy_import("numpy")
 
 ActionCookie = int
 StackState = dict
 
+# With more separate changes than this, writing the span that holds them all is cheaper
+MAX_WRITES_PER_DEVICE = 8
+
+# The bytes of the SDK packets that update a single LED, or all LEDs of a zone or a
+# device, without their colors (4 bytes each)
+LED_PACKET_SIZE = 24
+ZONE_PACKET_SIZE = 26
+DEVICE_PACKET_SIZE = 22
+
+# Continuous actions write their state at most this many times per second
+MAX_FRAME_RATE = 60
+
+# The number of colors that a gradient is sampled at
+GRADIENT_SIZE = 256
+
 
 class ActionStack:
-    def __init__(self, client: OpenRGBClient):
-        self.client = client
+    def __init__(
+        self, backend: OutputBackend = None, postprocessor: PostProcessor = None
+    ):
+        self.backend = None
+        self.postprocessor = postprocessor or PostProcessor()
         self.states = []
-        self._initialize()
+        self.devices: List[DeviceInfo] = []
+        # The composited colors of every device, as (LEDs x 3) uint8 arrays
+        self.frames: List[np.ndarray] = []
+        # The spans of LEDs [start, end) per device that changed since the last flush
+        self._dirty: Dict[int, List[Tuple[int, int]]] = {}
+        # The devices that a state set entirely since the last flush
+        self._whole: Set[int] = set()
+        # The number of states that were pushed while there was no backend yet
+        self.buffered_states = 0
+        self.selectors = SelectorIndex()
+        self.base_state = None
+        if backend:
+            self.set_backend(backend)
+
+    def set_backend(self, backend: OutputBackend, devices: List[DeviceInfo] = None):
+        """Starts sending the frames to the backend
+
+           Until there is a backend, states are only kept on the stack. Those are all
+           composited and written at once here. `devices` can be passed when they
+           have already been read from the backend.
+        """
+        self.backend = backend
+        self.update_devices(backend.devices() if devices is None else devices)
 
-    def _initialize(self):
-        base_state = {"cookie": None, "devices": []}
-        for key, device in enumerate(self.client.devices):
-            device_state = {"id": key, "colors": device.colors}
-            base_state["devices"].append(device_state)
+    def update_devices(self, devices: List[DeviceInfo]):
+        """Takes over a new device list, e.g. after OpenRGB re-enumerated its devices
 
-        self.states.append(base_state)
+           The selectors are only matched against the devices that changed. Devices
+           that did not change keep their frame, so they are only written to when
+           the states that target them changed.
+        """
+        changed = self.selectors.update(devices)
+        recalibrated = self.postprocessor.update_devices(devices)
+        # The original colors of devices that merely got another id are kept
+        original_colors = {
+            device.topology(): self.base_state["devices"][key]["colors"]
+            for key, device in enumerate(self.devices)
+        }
+        self.devices = devices
+
+        base_state = {"cookie": None, "devices": []}
+        frames = []
+        for key, device in enumerate(self.devices):
+            if key in changed:
+                colors = original_colors.get(device.topology(), device.colors)
+                frames.append(device.colors.copy())
+            else:
+                colors = self.base_state["devices"][key]["colors"]
+                frames.append(self.frames[key])
+            base_state["devices"].append({"id": key, "colors": colors.copy()})
+        self.frames = frames
+        self._dirty = {d: spans for d, spans in self._dirty.items() if d < len(frames)}
+        for device in recalibrated - changed:
+            if device < len(frames):
+                # Its colors did not change, but they are corrected differently now
+                self._dirty[device] = [(0, len(frames[device]))]
+
+        if self.base_state:
+            self.states[0] = base_state
+        else:
+            self.states.insert(0, base_state)
 
         # TODO: Remove this temp thing
         self.base_state = base_state
 
-    def push_state(self, state: StackState) -> ActionCookie:
+        for state in self.states:
+            self._resolve_targets(state)
+        for device in range(len(self.devices)):
+            self._update_device(device)
+        self._update_brightness()
+        self.flush()
+
+    def push_state(self, state: StackState, below: bool = False) -> ActionCookie:
+        """Puts the state on top, or `below` all other states but the base state"""
         state["cookie"] = self._get_cookie()
-        self.states.append(state)
+        if below:
+            self.states.insert(1 if self.base_state else 0, state)
+        else:
+            self.states.append(state)
 
-        self._update_from_state(state)
+        if self.backend:
+            self._resolve_targets(state)
+            self._update_from_state(state)
+        else:
+            self.buffered_states += 1
         return state["cookie"]
 
+    def update_state(self, cookie: ActionCookie, state: StackState):
+        """Replaces the contents of a state, while it keeps its place on the stack
+
+           Only the LEDs that the previous or the new contents set are composited.
+        """
+        index = next(
+            (i for i, s in enumerate(self.states) if s["cookie"] == cookie), None
+        )
+        if index is None:
+            return
+
+        previous = self.states[index]
+        state["cookie"] = cookie
+        self.states[index] = state
+        if self.backend:
+            self._resolve_targets(state)
+            if self._selectors(previous) == self._selectors(state) and previous.get(
+                "scene"
+            ) is state.get("scene"):
+                # The same LEDs, so compositing the new state covers the previous one
+                self._update_from_state(state)
+            else:
+                self._update_from_state(previous, state)
+
+    @staticmethod
+    def _selectors(state: StackState) -> List[DeviceSelector]:
+        return [selector for selector, _, _ in state.get("targets", [])]
+
     def remove_state(self, cookie: ActionCookie):
         state = next(
             (state for state in self.states if state["cookie"] == cookie), None
@@ -46,7 +163,75 @@ class ActionStack:
         if state:
             self.states.remove(state)
             # Check what devices should be updated
-            self._update_from_state(state)
+            if self.backend:
+                self._update_from_state(state)
+
+    def capture_scene(self, name: str) -> Scene:
+        """The current colors of every device, before post-processing"""
+        if not self.frames:
+            raise Exception("The devices are not known yet")
+        return Scene.capture(name, self.devices, self.frames)
+
+    def set_dimmer(self, dimmer: float):
+        """Scales the brightness of every device, without recompositing any state"""
+        self.postprocessor.set_dimmer(dimmer)
+        self._dirty = {
+            device: [(0, len(frame))] for device, frame in enumerate(self.frames)
+        }
+        self.flush()
+
+    def flush(self):
+        """Sends the changed parts of the frames, post-processed, to the backend"""
+        dirty, self._dirty = self._dirty, {}
+        whole, self._whole = self._whole, set()
+        for device, spans in dirty.items():
+            frame = self.postprocessor.apply(device, self.frames[device])
+            runs = LedRanges(spans).runs
+            if device in whole:
+                # E.g. a scene, of which every device is restored in a single write
+                runs = [(runs[0][0], runs[-1][1])]
+            else:
+                runs = self._split_at_zones(device, runs)
+            if len(runs) > MAX_WRITES_PER_DEVICE:
+                runs = [(runs[0][0], runs[-1][1])]
+            for start, end in runs:
+                self.backend.write(device, frame, start, end)
+
+    def _split_at_zones(self, device, runs) -> List[Tuple[int, int]]:
+        """Splits the runs of changed LEDs at the zone boundaries of the device
+
+           A run over several zones is written as an update of the entire device.
+           Split, it is written as an update of each zone instead. That only happens
+           when those packets hold fewer bytes in total, as when the zones are small
+           compared to the device.
+        """
+        zones = self.devices[device].zones
+        split = []
+        for start, end in runs:
+            pieces = [
+                (max(start, zone.offset), min(end, zone.offset + zone.count))
+                for zone in zones
+                if zone.offset < end and start < zone.offset + zone.count
+            ]
+            if len(pieces) > 1 and sum(
+                self._packet_size(device, *piece) for piece in pieces
+            ) < self._packet_size(device, start, end):
+                split += pieces
+            else:
+                split.append((start, end))
+        return split
+
+    def _packet_size(self, device, start, end) -> int:
+        """The bytes that the backend sends to write the LEDs [start, end)
+
+           As `OpenRGBBackend.write`, which sends the smallest packet that holds them.
+        """
+        if end - start == 1:
+            return LED_PACKET_SIZE
+        for zone in self.devices[device].zones:
+            if zone.offset <= start and end <= zone.offset + zone.count:
+                return ZONE_PACKET_SIZE + 4 * zone.count
+        return DEVICE_PACKET_SIZE + 4 * len(self.frames[device])
 
     def _get_cookie(self):
         """Get a cryptographically secure random cookie
@@ -56,121 +241,284 @@ class ActionStack:
         """
         return struct.unpack("i", os.urandom(4))
 
-    def _update_from_state(self, state):
-        """Updates every device, zone or led that this state effects."""
-        for device in state["devices"]:
-            if "zones" in device:
-                for zone in device["zones"]:
-                    self._update_zone(device["id"], zone["id"])
-                    if "leds" in zone:
-                        for led in zone["leds"]:
-                            # TODO: (Re)Setting individual LEDs is not yet supported
-                            pass
-            if "leds" in device:
-                for led in device["leds"]:
-                    # TODO: (Re)Setting individual LEDs is not yet supported
-                    pass
-            if "colors" in device or "color" in device:
-                pass  # TODO: Resetting device colors is not yet supported
+    def _update_from_state(self, *states):
+        """Updates every device, zone or led that these states effect."""
+        for state in states:
+            if "brightness" in state:
+                self._update_brightness()
+
+            for device in state.get("devices", []):
+                device_id = device["id"]
+                if "colors" in device or "color" in device:
+                    self._update_device(device_id)
+                    continue
+                for zone in device.get("zones", []):
+                    zone_start, zone_end = self._zone_span(device_id, zone["id"])
+                    self._update_span(device_id, zone_start, zone_end)
+                for leds in device.get("leds", []):
+                    for start, end in leds["ranges"]:
+                        self._update_span(device_id, start, end)
+        self.flush()
+
+    def _resolve_targets(self, state: StackState):
+        """Translates the state's selectors into the devices, zones and LEDs to set
+
+           A 'scene' sets the colors of every device it holds, below the selectors.
+        """
+        if "targets" not in state and "scene" not in state:
+            return
+
+        devices = {}
+        if "scene" in state:
+            for device_id, colors in state["scene"].device_colors(self.devices).items():
+                devices[device_id] = {
+                    "id": device_id,
+                    "colors": colors,
+                    "zones": [],
+                    "leds": [],
+                }
+        for selector, color_key, color in state.get("targets", []):
+            for device_id, target in self.selectors.targets(selector).items():
+                device = devices.setdefault(
+                    device_id, {"id": device_id, "zones": [], "leds": []}
+                )
+                if selector.leds is None:
+                    device["zones"] += [
+                        {"id": zone, color_key: color} for zone in target
+                    ]
+                else:
+                    device["leds"].append({"ranges": target, color_key: color})
+        state["devices"] = list(devices.values())
+
+    def _update_brightness(self):
+        """The top-most state that sets the brightness determines the dimmer"""
+        brightness = next(
+            (s["brightness"] for s in reversed(self.states) if "brightness" in s), 1.0,
+        )
+        if brightness != self.postprocessor.dimmer:
+            self.set_dimmer(brightness)
 
     def _update_device(self, device):
-        """Traverses the states top-down, configuring the devices LEDs accordingly
-        
-           The states are traversed top-down, registering each of the device's zones that is altered until the 
-           end is reached or the entire device is changed by a state. Then the device's new state is set, folowed
-           by an update to each of the altered zones. This assures that when a full device's state is removed from the top, 
-           individual zone's all get the correct state again.
-        
+        self._whole.add(device)
+        self._update_span(device, 0, len(self.frames[device]))
+
+    def _update_span(self, device, start, end):
+        """Composites the LEDs [start, end) of a device from the states
+
+           The states are traversed top-down until one is found that sets all of these
+           LEDs. From there, the states are painted over each other bottom-up, so every
+           LED gets the color of the top-most state that sets it. Only the LEDs that
+           actually changed are written to the frame.
         """
-        altered_zones = []
+        layers = []
         for state in reversed(self.states):
-            device_obj = next((d for d in state["devices"] if d["id"] == device), None)
+            device_obj = next(
+                (d for d in state.get("devices", []) if d["id"] == device), None
+            )
             if device_obj:
-                # If the state alters the entire device's color, use that.
-                if "colors" in device_obj or "color" in device_obj:
-                    self._set_colors(device, self.client.devices[device])
+                layers.append(device_obj)
+                if self._covers(device_obj, device, start, end):
                     break
 
-                if "zones" in device:
-                    altered_zones += [z["id"] for z in device_obj["zones"]]
+        colors = self.frames[device][start:end].copy()
+        for device_obj in reversed(layers):
+            if "colors" in device_obj or "color" in device_obj:
+                self._set_colors(colors, start, device_obj, 0, len(self.frames[device]))
+            for zone in device_obj.get("zones", []):
+                zone_start, zone_end = self._zone_span(device, zone["id"])
+                self._set_colors(colors, start, zone, zone_start, zone_end)
+            for leds in device_obj.get("leds", []):
+                # The state's 'colors' are spread over its LEDs, in order
+                index = 0
+                count = len(leds["ranges"])
+                for led_start, led_end in leds["ranges"]:
+                    origin = led_start - index
+                    self._set_colors(
+                        colors, start, leds, led_start, led_end, origin, count
+                    )
+                    index += led_end - led_start
+
+        self._write(device, start, colors)
+
+    def _covers(self, device_obj, device, start, end) -> bool:
+        """Whether the state sets the colors of all LEDs [start, end) of the device"""
+        if "colors" in device_obj or "color" in device_obj:
+            return True
+        for zone in device_obj.get("zones", []):
+            zone_start, zone_end = self._zone_span(device, zone["id"])
+            if zone_start <= start and end <= zone_end:
+                return True
+        return any(
+            leds["ranges"].covers(start, end) for leds in device_obj.get("leds", [])
+        )
 
-                # TODO: Individual LEDs
-        for zone_id in altered_zones:
-            self._update_zone(device, zone_id)
+    def _zone_span(self, device, zone):
+        zone_info = self.devices[device].zones[zone]
+        return zone_info.offset, zone_info.offset + zone_info.count
 
-    def _update_zone(self, device, zone):
-        """Traverses the states top-down until it finds a state that sets this zone's colors. It then applies those colors"""
-        for state in reversed(self.states):
-            device_obj = next((d for d in state["devices"] if d["id"] == device), None)
-            if device_obj:
-                # If the state alters the entire device's color, use that.
-                if "colors" in device_obj or "color" in device_obj:
-                    self._set_colors(device_obj, self.client.devices[device])
-                    break
-                pass
+    @staticmethod
+    def _set_colors(buffer, offset, state_obj, start, end, origin=None, count=None):
+        """Paints the state's colors on the LEDs [start, end) of the buffer
+
+           The buffer holds the LEDs from `offset` on; LEDs outside of it are skipped.
+           `origin` is the LED at which the state's 'colors' start, which defaults to
+           `start`. A 'colors' list that is shorter than the LEDs it covers is repeated.
+           A 'meter' is spread over the `count` LEDs from `origin`, which defaults to
+           all LEDs up to `end`.
+        """
+        origin = start if origin is None else origin
+        count = end - origin if count is None else count
+        start, end = max(start, offset), min(end, offset + len(buffer))
+        if start >= end:
+            return
 
-                # # Check if the zone itself is altered by this state
-                if "zones" in device_obj:
-                    zone_obj = next(
-                        (z for z in device_obj["zones"] if z["id"] == zone), None
-                    )
-                    if zone_obj and ("colors" in zone_obj or "color" in zone_obj):
-                        self._set_colors(
-                            zone_obj, self.client.devices[device].zones[zone]
-                        )
-                        break
-
-    def _set_colors(self, state_obj, rgb_obj):
-        """Updates the device or zone's color when the 'color' or 'colors' key is present in the state"""
         if "colors" in state_obj:
-            rgb_obj.set_colors(state_obj["colors"])
+            colors = np.asarray(state_obj["colors"], dtype=np.uint8).reshape(-1, 3)
+            indices = (np.arange(start, end) - origin) % len(colors)
+            buffer[start - offset : end - offset] = colors[indices]
         elif "color" in state_obj:
-            rgb_obj.set_color(state_obj["color"])
+            buffer[start - offset : end - offset] = state_obj["color"]
+        elif "meter" in state_obj:
+            gradient, level, background = state_obj["meter"]
+            positions = np.arange(start, end) - origin
+            lit = positions < round(level * count)
+            indices = positions * (len(gradient) - 1) // max(count - 1, 1)
+            buffer[start - offset : end - offset] = np.where(
+                lit[:, None], gradient[indices], background
+            )
+
+    def _write(self, device, offset, colors):
+        """Writes the colors of the LEDs from `offset` on to the frame
+
+           Only the span from the first to the last LED that changed is marked dirty.
+        """
+        frame = self.frames[device]
+        changed = frame[offset : offset + len(colors)] != colors
+        changed = np.flatnonzero(changed.any(axis=1))
+        if not len(changed):
+            return
+
+        start, end = int(changed[0]), int(changed[-1]) + 1
+        frame[offset + start : offset + end] = colors[start:end]
+        self._dirty.setdefault(device, []).append((offset + start, offset + end))
 
 
 class BaseAction:
+    # Whether the action follows a value, see `Action.update`
+    continuous = False
+
     def act(self, context: Context = Context()):
         pass
 
     def reset(self, context: Context = Context()):
         pass
 
-    def construct_state(self):
+    def construct_state(self, context: Context = Context()):
         return {}
 
+    def selectors(self) -> List[DeviceSelector]:
+        """The selectors of this action and the actions it wraps"""
+        return []
+
 
 class Action(BaseAction):
     def __init__(self, wrapped_action):
         super().__init__()
         self._inner_action = wrapped_action
+        # The context of the latest update, until it is written
+        self._pending_update: Context = None
+        self._update_handle: asyncio.Handle = None
+        self._next_frame = 0.0
+
+    @property
+    def continuous(self):
+        return self._inner_action.continuous
 
     def act(self, context: Context):
-        state = self.construct_state()
+        state = self.construct_state(context)
+        if self.continuous:
+            self._next_frame = asyncio.get_event_loop().time() + 1 / MAX_FRAME_RATE
         return context.action_stack.push_state(state)
 
-    def construct_state(self):
-        state = self._construct_state()
-        inner_state = self._inner_action.construct_state()
+    def update(self, cookie, context: Context):
+        """Shows the new values of a continuous action in the state it already pushed
+
+           At most one update is written per frame. Updates that arrive before that
+           are dropped, except for the latest one.
+        """
+        self._pending_update = context
+        if self._update_handle is None:
+            loop = asyncio.get_event_loop()
+            delay = max(self._next_frame - loop.time(), 0)
+            self._update_handle = loop.call_later(delay, self._write_update, cookie)
+
+    def _write_update(self, cookie):
+        context, self._pending_update = self._pending_update, None
+        self._update_handle = None
+        self._next_frame = asyncio.get_event_loop().time() + 1 / MAX_FRAME_RATE
+        context.action_stack.update_state(cookie, self.construct_state(context))
+
+    def construct_state(self, context: Context = Context()):
+        state = self._construct_state(context)
+        inner_state = self._inner_action.construct_state(context)
 
         return dict_merge(state, inner_state)
 
-    def _construct_state(self):
+    def _construct_state(self, context: Context = Context()):
         return {}
 
+    def selectors(self) -> List[DeviceSelector]:
+        return self._inner_action.selectors()
+
     def reset(self, cookie, context: Context):
+        if self._update_handle is not None:
+            self._update_handle.cancel()
+            self._update_handle = None
         context.action_stack.remove_state(cookie)
 
 
+class BrightnessAction(Action):
+    """Dims (or brightens) all devices for as long as the action is active"""
+
+    def __init__(self, wrapped_action: Action, brightness: float):
+        super().__init__(wrapped_action)
+        self.brightness = brightness
+
+    def _construct_state(self, context: Context = Context()):
+        return {"brightness": self.brightness}
+
+
+class SceneAction(Action):
+    """Restores a saved scene, with a single write per device
+
+       The scene is read from the `SceneStore` when the action is first activated.
+    """
+
+    def __init__(self, wrapped_action: Action, scene: str):
+        super().__init__(wrapped_action)
+        self.scene = scene
+
+    def _construct_state(self, context: Context = Context()) -> StackState:
+        return {"scene": SceneStore.get().load(self.scene)}
+
+
 class ZoneAction(Action):
+    """Colors zones or LEDs of the devices picked by id, name (pattern) and/or type
+
+       The selection is resolved by the ActionStack, so it follows the devices when
+       OpenRGB re-enumerates them. See `DeviceSelector` for the matching rules.
+    """
+
     def __init__(
         self,
         wrapped_action: Action,
-        zones: List[int],
-        leds: List[int] = None,
+        zones: List[Union[int, str]] = None,
+        leds: Union[LedRanges, List[int]] = None,
         color: List[int] = None,
         colors: List[List[int]] = None,
-        device=None,
+        device: int = None,
         device_type=None,
+        device_name: str = None,
     ):
         super().__init__(wrapped_action)
         self.zones = zones
@@ -178,14 +526,18 @@ class ZoneAction(Action):
         self.color = None
         self.colors = None
         if color:
-            self.color = RGBColor(*color)
+            self.color = tuple(color)
         elif colors:
-            self.colors = [RGBColor(*color) for color in colors]
+            self.colors = tuple(tuple(color) for color in colors)
         else:
             raise Exception("Either 'color' or 'colors' should be set")
         # TODO: Add option to set modes
         # self.mode = mode
         self.device = device
+        self.selector = DeviceSelector(device, device_name, device_type, zones, leds)
+
+    def selectors(self) -> List[DeviceSelector]:
+        return [self.selector] + super().selectors()
 
     def _construct_state(self, context: Context = Context()) -> StackState:
 
@@ -196,14 +548,88 @@ class ZoneAction(Action):
             color_key = "color"
             color_val = self.color
 
-        state = {
-            "devices": [
-                {
-                    "id": self.device,
-                    "zones": [
-                        {"id": zone, color_key: color_val} for zone in self.zones
-                    ],
-                }
-            ]
-        }
-        return state
+        # Resolved into "devices" when the state is pushed
+        return {"targets": [(self.selector, color_key, color_val)]}
+
+
+class MeterAction(Action):
+    """Maps a value onto a gradient, e.g. a battery percentage from green to red
+
+       The value is a template, such as '$prop_Percentage', which is scaled from
+       `value_range` to 0-1. By default, all selected LEDs get the color of the
+       gradient at that point. As a `meter`, the LEDs of every zone (or the selected
+       LEDs) form a level bar instead, each lit LED colored by its own place in the
+       gradient.
+
+       The action is continuous: while it is active, new values update its state in
+       place. The gradient is sampled once, when the configuration is loaded.
+    """
+
+    continuous = True
+
+    def __init__(
+        self,
+        wrapped_action: Action,
+        gradient: List[List[int]],
+        value: str,
+        value_range: Tuple[float, float] = (0, 100),
+        meter: bool = False,
+        background: List[int] = (0, 0, 0),
+        zones: List[Union[int, str]] = None,
+        leds: Union[LedRanges, List[int]] = None,
+        device: int = None,
+        device_type=None,
+        device_name: str = None,
+    ):
+        super().__init__(wrapped_action)
+        if len(gradient) < 2:
+            raise Exception("A gradient needs at least two colors")
+        self.gradient = self._sample(gradient)
+        self.value = Template(value)
+        self.minimum, self.maximum = value_range
+        if self.maximum == self.minimum:
+            raise Exception("The range of a gradient cannot be empty")
+        self.meter = meter
+        self.background = tuple(background)
+        self.selector = DeviceSelector(device, device_name, device_type, zones, leds)
+        self._gradient_array = None
+
+    @staticmethod
+    def _sample(gradient: List[List[int]]) -> List[Tuple[int, int, int]]:
+        """The colors of the gradient at GRADIENT_SIZE evenly spread points"""
+        segments = len(gradient) - 1
+        samples = []
+        for index in range(GRADIENT_SIZE):
+            position = index * segments / (GRADIENT_SIZE - 1)
+            segment = min(int(position), segments - 1)
+            fraction = position - segment
+            start, end = gradient[segment], gradient[segment + 1]
+            samples.append(
+                tuple(round(a + (b - a) * fraction) for a, b in zip(start, end))
+            )
+        return samples
+
+    def selectors(self) -> List[DeviceSelector]:
+        return [self.selector] + super().selectors()
+
+    def level(self, context: Context) -> float:
+        """The value from the context, scaled to 0-1"""
+        text = substitute_all(self.value, context)
+        try:
+            value = float(text)
+        except ValueError:
+            logging.warning("Not a number: '%s', using the minimum instead", text)
+            value = self.minimum
+        level = (value - self.minimum) / (self.maximum - self.minimum)
+        return min(max(level, 0.0), 1.0)
+
+    def _construct_state(self, context: Context = Context()) -> StackState:
+        level = self.level(context)
+        if not self.meter:
+            color = self.gradient[round(level * (GRADIENT_SIZE - 1))]
+            return {"targets": [(self.selector, "color", color)]}
+
+        if self._gradient_array is None:
+            self._gradient_array = np.array(self.gradient, dtype=np.uint8)
+        meter = (self._gradient_array, level, self.background)
+        return {"targets": [(self.selector, "meter", meter)]}
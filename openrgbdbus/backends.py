@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import abc
+import json
+import logging
+import mmap
+import os
+import socket
+import struct
+import time
+from typing import Callable, Iterator, List, Tuple
+
+from .utils import lazy_import
+
+np = lazy_import("numpy")
+openrgb = lazy_import("openrgb")
+
+MAGIC = b"ORGBRING"
+VERSION = 1
+# magic, version, number of slots, slot size, topology size, frames written
+FILE_HEADER = struct.Struct("<8sIIIIQ")
+COUNTER = struct.Struct("<Q")
+COUNTER_OFFSET = FILE_HEADER.size - COUNTER.size
+# monotonic timestamp (ns), device id, number of LEDs, changed LEDs [start, end)
+SLOT_HEADER = struct.Struct("<QIIII")
+# The header of an OpenRGB SDK packet: magic, device id, packet type, data size
+SDK_HEADER = struct.Struct("<4sIII")
+SDK_DEVICE_LIST_UPDATED = 100
+# Appended to the path of a frame recording that was replaced by a new topology
+PREVIOUS_RECORDING_SUFFIX = ".previous"
+
+
+def _align(size: int, alignment: int = 8) -> int:
+    return (size + alignment - 1) // alignment * alignment
+
+
+class ZoneInfo:
+    def __init__(self, name: str, count: int):
+        self.name = name
+        self.count = count
+        # The index of the zone's first LED in the device. Set by its DeviceInfo.
+        self.offset = 0
+
+
+class DeviceInfo:
+    """The topology of a device: its zones, the LEDs they hold and their colors"""
+
+    def __init__(
+        self,
+        name: str,
+        zones: List[ZoneInfo],
+        device_type: openrgb.utils.DeviceType = None,
+        colors: np.ndarray = None,
+    ):
+        self.name = name
+        if device_type is None:
+            device_type = openrgb.utils.DeviceType.UNKNOWN
+        self.type = device_type
+        self.zones = zones
+
+        offset = 0
+        for zone in zones:
+            zone.offset = offset
+            offset += zone.count
+        self.led_count = offset
+
+        if colors is None:
+            colors = np.zeros((self.led_count, 3), dtype=np.uint8)
+        self.colors = colors
+
+    def topology(self) -> tuple:
+        """Everything that identifies the device, apart from its colors"""
+        return (
+            self.name,
+            self.type,
+            tuple((zone.name, zone.count) for zone in self.zones),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "type": int(self.type),
+            "zones": [{"name": zone.name, "leds": zone.count} for zone in self.zones],
+        }
+
+
+class OutputBackend(metaclass=abc.ABCMeta):
+    """Receives the frames composited by the ActionStack
+
+       A frame is an (LEDs x 3) uint8 array holding the RGB colors of one device.
+    """
+
+    @abc.abstractmethod
+    def devices(self) -> List[DeviceInfo]:
+        """The topology and current colors of every device, indexed by device id"""
+        pass
+
+    @abc.abstractmethod
+    def write(self, device_id: int, frame: np.ndarray, start: int, end: int):
+        """Outputs a device's frame of which only the LEDs [start, end) changed"""
+        pass
+
+    def watch(self, event_loop, callback: Callable[[List[DeviceInfo]], None]):
+        """Calls `callback` on the event loop with the new devices when they change"""
+        pass
+
+    def close(self):
+        pass
+
+
+class OpenRGBBackend(OutputBackend):
+    """Writes the frames to the devices of an OpenRGB SDK server"""
+
+    def __init__(self, client: openrgb.OpenRGBClient):
+        self.client = client
+
+    def devices(self) -> List[DeviceInfo]:
+        return [
+            DeviceInfo(
+                device.name,
+                [ZoneInfo(zone.name, len(zone.leds)) for zone in device.zones],
+                device.type,
+                np.array(
+                    [(c.red, c.green, c.blue) for c in device.colors], dtype=np.uint8
+                ).reshape(-1, 3),
+            )
+            for device in self.client.devices
+        ]
+
+    def write(self, device_id: int, frame: np.ndarray, start: int, end: int):
+        device = self.client.devices[device_id]
+
+        if end - start == 1:
+            color = openrgb.utils.RGBColor(*frame[start].tolist())
+            device.leds[start].set_color(color, fast=True)
+            return
+
+        # A zone update is the smallest packet that can hold the changes
+        zone_start = 0
+        for zone in device.zones:
+            zone_end = zone_start + len(zone.leds)
+            if zone_start <= start and end <= zone_end:
+                zone.set_colors(self._to_colors(frame[zone_start:zone_end]), fast=True)
+                return
+            zone_start = zone_end
+
+        device.set_colors(self._to_colors(frame), fast=True)
+
+    def watch(self, event_loop, callback: Callable[[List[DeviceInfo]], None]):
+        # The server only sends packets on its own when its device list changed
+        event_loop.add_reader(
+            self.client.comms.sock.fileno(), self._on_readable, event_loop, callback
+        )
+
+    def _on_readable(self, event_loop, callback: Callable[[List[DeviceInfo]], None]):
+        sock = self.client.comms.sock
+        header = sock.recv(SDK_HEADER.size, socket.MSG_WAITALL)
+        if len(header) < SDK_HEADER.size:
+            event_loop.remove_reader(sock.fileno())
+            logging.error("Lost the connection to the OpenRGB SDK server")
+            return
+
+        _magic, _device_id, packet_type, size = SDK_HEADER.unpack(header)
+        if size:
+            sock.recv(size, socket.MSG_WAITALL)
+        if packet_type == SDK_DEVICE_LIST_UPDATED:
+            logging.info("The OpenRGB device list changed")
+            self.client.update()
+            callback(self.devices())
+
+    @staticmethod
+    def _to_colors(frame: np.ndarray) -> List[openrgb.utils.RGBColor]:
+        RGBColor = openrgb.utils.RGBColor
+        return [RGBColor(*color) for color in frame.tolist()]
+
+    def close(self):
+        self.client.disconnect()
+
+
+class NullBackend(OutputBackend):
+    """Discards every frame, to measure the cost of everything before the output"""
+
+    def __init__(self, devices: List[DeviceInfo]):
+        self._devices = devices
+        self.writes = 0
+
+    def devices(self) -> List[DeviceInfo]:
+        return self._devices
+
+    def write(self, device_id: int, frame: np.ndarray, start: int, end: int):
+        self.writes += 1
+
+
+class RecordingBackend(OutputBackend):
+    """Records every frame (with a timestamp) to a memory-mapped ring file
+
+       The file starts with a header and the device topology as JSON, followed by
+       a fixed number of slots that each hold one frame. When all slots are used,
+       the oldest frames get overwritten. Use `FrameRecording` to read the file.
+       All frames are also passed on to the `forward` backend.
+
+       When the topology of the devices changes, the file is started anew, as its
+       device table and slots no longer fit. The frames before the change are kept
+       next to it, with `PREVIOUS_RECORDING_SUFFIX` appended to the path.
+    """
+
+    def __init__(self, path: str, forward: OutputBackend, frames: int = 1024):
+        self.path = path
+        self.forward = forward
+        self.slots = frames
+        self._open(forward.devices())
+
+    def _open(self, devices: List[DeviceInfo]):
+        """Starts a recording of these devices, with slots that fit all their frames"""
+        self._devices = devices
+        max_leds = max((device.led_count for device in devices), default=0)
+        table = json.dumps([device.to_dict() for device in devices]).encode()
+        self.slot_size = _align(SLOT_HEADER.size + max_leds * 3)
+        self.data_offset = _align(FILE_HEADER.size + len(table))
+        size = self.data_offset + self.slots * self.slot_size
+
+        with open(self.path, "wb") as f:
+            f.truncate(size)
+        self._file = open(self.path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), size)
+        FILE_HEADER.pack_into(
+            self._map, 0, MAGIC, VERSION, self.slots, self.slot_size, len(table), 0
+        )
+        self._map[FILE_HEADER.size : FILE_HEADER.size + len(table)] = table
+        self.count = 0
+
+    def devices(self) -> List[DeviceInfo]:
+        return self._devices
+
+    def watch(self, event_loop, callback: Callable[[List[DeviceInfo]], None]):
+        def on_devices(devices: List[DeviceInfo]):
+            topology = [device.topology() for device in devices]
+            if topology != [device.topology() for device in self._devices]:
+                self._close_file()
+                os.replace(self.path, self.path + PREVIOUS_RECORDING_SUFFIX)
+                logging.info(
+                    "The devices changed, moved the frames recorded so far to '%s'",
+                    self.path + PREVIOUS_RECORDING_SUFFIX,
+                )
+                self._open(devices)
+            else:
+                self._devices = devices
+            callback(devices)
+
+        self.forward.watch(event_loop, on_devices)
+
+    def write(self, device_id: int, frame: np.ndarray, start: int, end: int):
+        if SLOT_HEADER.size + frame.nbytes > self.slot_size:
+            # A frame of a device that the recording does not know of yet would
+            # overwrite the next slot
+            logging.warning(
+                "Not recording a frame of %d LEDs of device %d", len(frame), device_id
+            )
+            self.forward.write(device_id, frame, start, end)
+            return
+
+        offset = self.data_offset + (self.count % self.slots) * self.slot_size
+        SLOT_HEADER.pack_into(
+            self._map,
+            offset,
+            time.monotonic_ns(),
+            device_id,
+            len(frame),
+            start,
+            end,
+        )
+        data = frame.tobytes()
+        offset += SLOT_HEADER.size
+        self._map[offset : offset + len(data)] = data
+
+        # Only count the frame once it has been written completely
+        self.count += 1
+        COUNTER.pack_into(self._map, COUNTER_OFFSET, self.count)
+
+        self.forward.write(device_id, frame, start, end)
+
+    def close(self):
+        self._close_file()
+        self.forward.close()
+
+    def _close_file(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+class FrameRecording:
+    """Reads the frames from a file written by the RecordingBackend"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._data = f.read()
+        magic, version, self.slots, self.slot_size, table_size, self.count = (
+            FILE_HEADER.unpack_from(self._data)
+        )
+        if magic != MAGIC or version > VERSION:
+            raise Exception(f"'{path}' is not a supported frame recording")
+        table = self._data[FILE_HEADER.size : FILE_HEADER.size + table_size]
+        self.devices = json.loads(table)
+        self._data_offset = _align(FILE_HEADER.size + table_size)
+
+    def __len__(self):
+        return min(self.count, self.slots)
+
+    def __iter__(self) -> Iterator[Tuple[float, int, int, int, np.ndarray]]:
+        """Yields (timestamp, device id, start, end, frame), oldest first"""
+        for index in range(self.count - len(self), self.count):
+            offset = self._data_offset + (index % self.slots) * self.slot_size
+            timestamp, device_id, leds, start, end = SLOT_HEADER.unpack_from(
+                self._data, offset
+            )
+            offset += SLOT_HEADER.size
+            frame = np.frombuffer(
+                self._data, dtype=np.uint8, count=leds * 3, offset=offset
+            ).reshape(leds, 3)
+            yield timestamp / 1e9, device_id, start, end, frame
@@ -0,0 +1,92 @@
+import abc
+import time
+from typing import List
+
+from pydbus.bus import Bus
+
+from .utils import Context
+
+# How much a new measurement of the cost of a condition weighs in its average
+COST_SMOOTHING = 0.2
+
+
+class Condition(metaclass=abc.ABCMeta):
+    """A check that is done before a trigger fires
+
+       Every condition measures how long it takes and how often its result came
+       from a cache, so that `AllCondition` and `AnyCondition` can try their
+       cheapest children first and skip the rest once the outcome is decided.
+    """
+
+    # The cost in seconds that is assumed before the condition has been measured
+    estimated_cost = 0.0
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.cache_hits = 0
+        # The average cost of the calls that were not answered from a cache
+        self.miss_cost = None
+
+    def evaluate(self, bus: Bus, context: Context) -> bool:
+        cache_hits = self.cache_hits
+        start = time.perf_counter()
+        result = self._evaluate(bus, context)
+        cost = time.perf_counter() - start
+
+        self.calls += 1
+        # Cache hits are left out, as `expected_cost` accounts for them
+        if self.cache_hits == cache_hits:
+            if self.miss_cost is None:
+                self.miss_cost = cost
+            else:
+                self.miss_cost += COST_SMOOTHING * (cost - self.miss_cost)
+        return result
+
+    @abc.abstractmethod
+    def _evaluate(self, bus: Bus, context: Context) -> bool:
+        pass
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cache_hits / self.calls if self.calls else 0.0
+
+    @property
+    def expected_cost(self) -> float:
+        """The cost of a call that misses the cache, times how often calls miss"""
+        if self.miss_cost is None:
+            return self.estimated_cost * (1 - self.hit_rate)
+        return self.miss_cost * (1 - self.hit_rate)
+
+
+class AllCondition(Condition):
+    def __init__(self, conditions: List[Condition]):
+        super().__init__()
+        self.conditions = conditions
+
+    @property
+    def estimated_cost(self):
+        return sum(condition.expected_cost for condition in self.conditions)
+
+    def _evaluate(self, bus: Bus, context: Context) -> bool:
+        ordered = sorted(self.conditions, key=lambda c: c.expected_cost)
+        return all(condition.evaluate(bus, context) for condition in ordered)
+
+
+class AnyCondition(AllCondition):
+    def _evaluate(self, bus: Bus, context: Context) -> bool:
+        ordered = sorted(self.conditions, key=lambda c: c.expected_cost)
+        return any(condition.evaluate(bus, context) for condition in ordered)
+
+
+class NotCondition(Condition):
+    def __init__(self, condition: Condition):
+        super().__init__()
+        self.condition = condition
+
+    @property
+    def estimated_cost(self):
+        return self.condition.expected_cost
+
+    def _evaluate(self, bus: Bus, context: Context) -> bool:
+        return not self.condition.evaluate(bus, context)
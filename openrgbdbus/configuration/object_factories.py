@@ -1,17 +1,51 @@
 import abc
 import re
+from functools import partial
 from types import SimpleNamespace
 from typing import Generic, TypeVar
 
 import yaml
-from openrgb import OpenRGBClient
 
 import openrgbdbus.connector
 import openrgbdbus.defaults as defaults
 
-from ..actions import Action, BaseAction, ZoneAction
+from ..actions import (
+    Action,
+    BaseAction,
+    BrightnessAction,
+    MeterAction,
+    SceneAction,
+    ZoneAction,
+)
+from ..backends import (
+    DeviceInfo,
+    NullBackend,
+    OpenRGBBackend,
+    OutputBackend,
+    RecordingBackend,
+    ZoneInfo,
+)
+from ..conditions import AllCondition, AnyCondition, Condition, NotCondition
 from ..hook import Hook
-from ..trigger import DBusTrigger, SleepTrigger, Trigger, TriggerCondition
+from ..postprocessing import Calibration, PostProcessor
+from ..selection import LedRanges
+from ..trigger import (
+    DBusTrigger,
+    FileChangeTrigger,
+    FileTrigger,
+    HwmonTrigger,
+    LoadTrigger,
+    ProcessTrigger,
+    PropertyTrigger,
+    SensorTrigger,
+    SleepTrigger,
+    Trigger,
+    TriggerCondition,
+    TriggerSource,
+)
+from ..utils import lazy_import
+
+openrgb = lazy_import("openrgb")
 
 T = TypeVar("T")
 
@@ -112,15 +146,54 @@ class ActionFactory(Factory[Action]):
     def field_factories(cls):
         return {
             "device_id": ("device", int),
-            # "leds": ("leds", Factory.list(int)),
-            "zones": ("zones", Factory.list(int)),
+            "device": ("device_name", str),
+            "device_type": ("device_type", DeviceInfoFactory.parse_type),
+            "leds": ("leds", ActionFactory.parse_leds),
+            "zones": ("zones", Factory.list(ActionFactory.parse_zone)),
             "color": ("color", Factory.list(int)),
             "colors": ("colors", Factory.list(Factory.list(int))),
             "arguments": ("arguments", Factory.list(str)),
+            "brightness": ("brightness", float),
+            "gradient": ("gradient", Factory.list(Factory.list(int))),
+            "value": ("value", str),
+            "range": ("value_range", Factory.list(float)),
+            "meter": ("meter", bool),
+            "background": ("background", Factory.list(int)),
+            "scene": ("scene", str),
         }
 
+    @classmethod
+    def parse_zone(cls, definition):
+        """Zones are given by index, or by name (pattern)"""
+        return definition if isinstance(definition, int) else str(definition)
+
+    @classmethod
+    def parse_leds(cls, definition_list):
+        """LEDs are given by index, or as inclusive ranges like '10-20'"""
+        runs = []
+        for definition in definition_list:
+            if isinstance(definition, int):
+                runs.append((definition, definition + 1))
+                continue
+            try:
+                first, last = (int(led) for led in str(definition).split("-"))
+            except ValueError:
+                raise Exception(
+                    "LEDs should be indices or ranges like '10-20', not '{}'".format(
+                        definition
+                    )
+                )
+            runs.append((first, last + 1))
+        return LedRanges(runs)
+
     @classmethod
     def construct_instance(cls, *args, **kwargs):
+        if "brightness" in kwargs:
+            return BrightnessAction(*args, **kwargs)
+        if "gradient" in kwargs:
+            return MeterAction(*args, **kwargs)
+        if "scene" in kwargs:
+            return SceneAction(*args, **kwargs)
         # TODO: Don't hardcode the ZoneAction here
         return ZoneAction(*args, **kwargs)
 
@@ -171,12 +244,109 @@ class SleepTriggerFactory(Factory[SleepTrigger]):
         return SleepTrigger(*args, **kwargs)
 
 
+class PropertyTriggerFactory(Factory[PropertyTrigger]):
+    @classmethod
+    def field_factories(cls):
+        return {
+            "service": ("service", str),
+            "path": ("path", str),
+            "interface": ("interface", str),
+            "expression": ("expression", str),
+            "updates": ("updates", bool),
+        }
+
+    @classmethod
+    def construct_instance(cls, *args, **kwargs):
+        return PropertyTrigger(*args, **kwargs)
+
+
+class HwmonTriggerFactory(Factory[HwmonTrigger]):
+    @classmethod
+    def field_factories(cls):
+        return {
+            "chip": ("chip", str),
+            "sensor": ("sensor", str),
+            "expression": ("expression", str),
+            "interval": ("interval", SleepTriggerFactory.parse_time),
+            "updates": ("updates", bool),
+        }
+
+    @classmethod
+    def construct_instance(cls, *args, **kwargs):
+        return HwmonTrigger(*args, **kwargs)
+
+
+class LoadTriggerFactory(Factory[LoadTrigger]):
+    @classmethod
+    def field_factories(cls):
+        return {
+            "expression": ("expression", str),
+            "interval": ("interval", SleepTriggerFactory.parse_time),
+            "updates": ("updates", bool),
+        }
+
+    @classmethod
+    def construct_instance(cls, *args, **kwargs):
+        return LoadTrigger(*args, **kwargs)
+
+
+class FileTriggerFactory(Factory[TriggerSource]):
+    @classmethod
+    def field_factories(cls):
+        return {
+            "path": ("path", str),
+            "expression": ("expression", str),
+            "scale": ("scale", float),
+            "changes": ("changes", bool),
+            "interval": ("interval", SleepTriggerFactory.parse_time),
+            "updates": ("updates", bool),
+        }
+
+    @classmethod
+    def construct_instance(cls, *args, expression=None, changes=False, **kwargs):
+        if expression is not None:
+            # Files with a value, such as sysfs attributes, are read every interval
+            return SensorTrigger(*args, expression=expression, **kwargs)
+        if "scale" in kwargs:
+            raise Exception("'scale' can only be used together with 'expression'")
+        if changes:
+            if "updates" in kwargs:
+                raise Exception("'changes' already triggers on every change")
+            return FileChangeTrigger(*args, **kwargs)
+        if "updates" in kwargs:
+            # Whether a file exists has no values that could change meanwhile
+            raise Exception(
+                "'updates' can only be used together with 'expression'. "
+                "Use 'changes' to trigger on every change of the file."
+            )
+        return FileTrigger(*args, **kwargs)
+
+
+class ProcessTriggerFactory(Factory[ProcessTrigger]):
+    @classmethod
+    def field_factories(cls):
+        return {
+            "name": ("name", str),
+            "interval": ("interval", SleepTriggerFactory.parse_time),
+            "updates": ("updates", bool),
+        }
+
+    @classmethod
+    def construct_instance(cls, *args, **kwargs):
+        return ProcessTrigger(*args, **kwargs)
+
+
 class TriggerFactory(Factory[DBusTrigger]):
     @classmethod
     def field_factories(cls):
         return {
             "signal": ("source", DBusTriggerFactory.create),
             "sleep": ("source", SleepTriggerFactory.create),
+            "property": ("source", PropertyTriggerFactory.create),
+            "hwmon": ("source", HwmonTriggerFactory.create),
+            "loadavg": ("source", LoadTriggerFactory.create),
+            "file": ("source", FileTriggerFactory.create),
+            "process": ("source", ProcessTriggerFactory.create),
             "conditions": ("conditions", Factory.list(TriggerConditionFactory.create)),
         }
 
@@ -185,19 +355,37 @@ class TriggerFactory(Factory[DBusTrigger]):
         return Trigger(*args, **kwargs)
 
 
-class TriggerConditionFactory(Factory[TriggerCondition]):
+class TriggerConditionFactory(Factory[Condition]):
     @classmethod
     def field_factories(cls):
         return {
             "service_name": ("service", str),
             "path": ("path", str),
             "method": ("method", str),
-            "response": ("response", str),
+            "response": ("response", Factory.identity),
+            "operator": ("operator", str),
+            "cache": ("cache", SleepTriggerFactory.parse_time),
             "arguments": ("arguments", Factory.list(str)),
+            "all": ("all", Factory.list(TriggerConditionFactory.create)),
+            "any": ("any", Factory.list(TriggerConditionFactory.create)),
+            "not": ("not", TriggerConditionFactory.create),
         }
 
     @classmethod
     def construct_instance(cls, *args, **kwargs):
+        groups = {"all", "any", "not"} & set(kwargs)
+        if groups and len(kwargs) > 1:
+            raise Exception(
+                "'{}' cannot be combined with other keys in a condition".format(
+                    groups.pop()
+                )
+            )
+        if "all" in kwargs:
+            return AllCondition(kwargs["all"])
+        if "any" in kwargs:
+            return AnyCondition(kwargs["any"])
+        if "not" in kwargs:
+            return NotCondition(kwargs["not"])
         return TriggerCondition(*args, **kwargs)
 
 
@@ -206,7 +394,7 @@ class HookFactory(Factory[Hook]):
     def field_factories(cls):
         return {
             "bus": ("bus_name", str),
-            "action": ("action", ActionFactory.create),
+            "action": ("action", HookFactory.single_action),
             "actions": (
                 "action",
                 Factory.reduce(ActionFactory.create, "wrapped_action", BaseAction),
@@ -215,12 +403,21 @@ class HookFactory(Factory[Hook]):
             "until": ("end_trigger", TriggerFactory.create),
         }
 
+    @classmethod
+    def single_action(cls, definition):
+        """An action on its own, which wraps a BaseAction like the first of 'actions'"""
+        return ActionFactory.create(definition, wrapped_action=BaseAction())
+
     @classmethod
     def construct_instance(cls, *args, **kwargs):
+        if kwargs.get("action") is None:
+            raise Exception(
+                "Hook '{}' needs 'action' or 'actions'".format(kwargs.get("name", ""))
+            )
         return Hook(*args, **kwargs)
 
 
-class ClientFactory(Factory[OpenRGBClient]):
+class ClientFactory(Factory["openrgb.OpenRGBClient"]):
     @classmethod
     def field_factories(cls):
         return {
@@ -237,7 +434,117 @@ class ClientFactory(Factory[OpenRGBClient]):
 
     @classmethod
     def construct_instance(cls, *args, **kwargs):
-        return OpenRGBClient(*args, **kwargs)
+        return openrgb.OpenRGBClient(*args, **kwargs)
+
+
+class ZoneInfoFactory(Factory[ZoneInfo]):
+    @classmethod
+    def field_factories(cls):
+        return {
+            "name": ("name", str),
+            "leds": ("count", int),
+        }
+
+    @classmethod
+    def construct_instance(cls, *args, **kwargs):
+        return ZoneInfo(*args, **kwargs)
+
+
+class DeviceInfoFactory(Factory[DeviceInfo]):
+    @classmethod
+    def field_factories(cls):
+        return {
+            "name": ("name", str),
+            "type": ("device_type", DeviceInfoFactory.parse_type),
+            "zones": ("zones", Factory.list(ZoneInfoFactory.create)),
+        }
+
+    @classmethod
+    def parse_type(cls, definition: str):
+        try:
+            return openrgb.utils.DeviceType[definition.upper()]
+        except KeyError:
+            raise Exception("Unknown device type: {}".format(definition))
+
+    @classmethod
+    def construct_instance(cls, *args, **kwargs):
+        return DeviceInfo(*args, **kwargs)
+
+
+class BackendFactory(Factory[OutputBackend]):
+    @classmethod
+    def field_factories(cls):
+        return {
+            "backend": ("backend", str),
+            "devices": ("devices", Factory.list(DeviceInfoFactory.create)),
+            "path": ("path", str),
+            "frames": ("frames", int),
+            "forward": ("forward", str),
+        }
+
+    @classmethod
+    def defaults(cls):
+        return defaults.output
+
+    @classmethod
+    def construct_instance(
+        cls,
+        backend,
+        server,
+        devices=None,
+        path="frames.ring",
+        frames=1024,
+        forward="null",
+    ):
+        if backend == "openrgb":
+            return OpenRGBBackend(ClientFactory.create(server))
+        elif backend == "null":
+            return NullBackend(devices or cls.snapshot_devices(server))
+        elif backend == "recording":
+            return RecordingBackend(
+                path, cls.construct_instance(forward, server, devices), frames
+            )
+        raise Exception("Unknown output backend: {}".format(backend))
+
+    @classmethod
+    def snapshot_devices(cls, server):
+        """Gets the devices from the OpenRGB server, without keeping the connection"""
+        backend = OpenRGBBackend(ClientFactory.create(server))
+        devices = backend.devices()
+        backend.close()
+        return devices
+
+
+class CalibrationFactory(Factory[Calibration]):
+    @classmethod
+    def field_factories(cls):
+        return {
+            "device_id": ("device", int),
+            "device": ("device_name", str),
+            "device_type": ("device_type", DeviceInfoFactory.parse_type),
+            "brightness": ("brightness", float),
+            "gamma": ("gamma", float),
+            "white_point": ("white_point", Factory.list(int)),
+        }
+
+    @classmethod
+    def construct_instance(cls, *args, **kwargs):
+        return Calibration(*args, **kwargs)
+
+
+class PostProcessorFactory(Factory[PostProcessor]):
+    @classmethod
+    def field_factories(cls):
+        return {
+            "brightness": ("brightness", float),
+            "gamma": ("gamma", float),
+            "white_point": ("white_point", Factory.list(int)),
+            "devices": ("calibrations", Factory.list(CalibrationFactory.create)),
+        }
+
+    @classmethod
+    def construct_instance(cls, *args, **kwargs):
+        return PostProcessor(*args, **kwargs)
 
 
 class ConnectorFactory(Factory[Hook]):
@@ -247,7 +554,9 @@ class ConnectorFactory(Factory[Hook]):
             "hooks": ("hooks", Factory.dict_to_list(HookFactory.create, keyarg="name")),
             "version": ("", Factory.ignore),
             "logging": ("", Factory.ignore),
-            "server": ("client", ClientFactory.create),
+            "server": ("server", Factory.identity),
+            "output": ("output", Factory.identity),
+            "postprocessing": ("postprocessor", PostProcessorFactory.create),
             "default": (
                 "default_action",
                 Factory.reduce(ActionFactory.create, "wrapped_action", BaseAction),
@@ -259,5 +568,9 @@ class ConnectorFactory(Factory[Hook]):
         return defaults.connector
 
     @classmethod
-    def construct_instance(cls, *args, **kwargs):
-        return openrgbdbus.connector.Connector(*args, **kwargs)
+    def construct_instance(cls, *args, server, output=None, **kwargs):
+        # The backend is only created once the connector starts, as it has to connect
+        backend_factory = partial(BackendFactory.create, output or {}, server=server)
+        return openrgbdbus.connector.Connector(
+            *args, backend_factory=backend_factory, **kwargs
+        )
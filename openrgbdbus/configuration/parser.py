@@ -1,10 +1,11 @@
 import logging
 
-from packaging import version
-
+from ..utils import lazy_import
 from . import load_configuration
 from .object_factories import ConnectorFactory
 
+version = lazy_import("packaging.version")
+
 
 class ConfigurationParser:
     _config_ver = "0.4.0"
@@ -1,11 +1,24 @@
 import asyncio
+import signal
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, List
 
 from gi.repository import GLib
 from pydbus import SessionBus
 
 from openrgbdbus.actions import Action, ActionStack
 
+from .backends import OutputBackend
 from .configuration import ConfigurationParser
+from .control import ControlServer
+from .dispatch import BusDispatcher
+from .postprocessing import PostProcessor
+from .profiling import RuntimeProfiler
+from .scenes import SceneStore
+from .startup import StartupProfile
+from .trace import TraceRecorder, TraceReplayer
 from .utils import Context
 
 
@@ -13,58 +26,244 @@ class Connector:
     __create_key = object()
 
     @classmethod
-    def fromConfig(cls, configuration):
+    def fromConfig(cls, configuration, backend: str = None):
+        """Creates a connector from a configuration (file)
 
-        return (
-            ConfigurationParser().load(configuration).createConnector(cls.__create_key)
-        )
+           `backend` overrides the output backend set in the configuration.
+        """
+        parser = ConfigurationParser().load(configuration)
+        if backend:
+            parser.configuration = {
+                **parser.configuration,
+                "output": {
+                    **parser.configuration.get("output", {}),
+                    "backend": backend,
+                },
+            }
+        return parser.createConnector(cls.__create_key)
 
     def __init__(
-        self, create_key, hooks, client, debug=False, default_action: Action = None
+        self,
+        create_key,
+        hooks,
+        backend_factory: Callable[[], OutputBackend],
+        debug=False,
+        default_action: Action = None,
+        postprocessor: PostProcessor = None,
     ):
         assert (
             create_key == Connector.__create_key
         ), "Connector objects must be created using Connector.fromConfig"
         self.hooks = hooks
-        self.client = client
+        self.backend_factory = backend_factory
+        # Only set once the backend has connected, see `start`
+        self.backend: OutputBackend = None
         self.loop = GLib.MainLoop()
         self.default_action = default_action
         self.context = Context(
             {
-                # "rgb_client": client,
                 "debug": debug,
-                "action_stack": ActionStack(client),
+                "action_stack": ActionStack(postprocessor=postprocessor),
             }
         )
         for hook in self.hooks:
             hook.set_context(self.context)
 
+        # Known up front, so that the selectors are matched before any activation
+        actions = [hook.action for hook in self.hooks] + [default_action]
+        for action in filter(None, actions):
+            self.context.action_stack.selectors.add(*action.selectors())
+        self.recorder: TraceRecorder = None
+        self.replayer: TraceReplayer = None
+        self.profile: StartupProfile = None
+        self.profiler = RuntimeProfiler(self)
+        self.control: ControlServer = None
+        # The scene that was restored with the 'scene' control command
+        self._scene_cookie = None
+        self._ready_callbacks: List[Callable[[], None]] = []
+        self._default_cookie = None
+        self._error: Exception = None
+        self._stopped = False
+
+    def record(self, recorder: TraceRecorder):
+        """Records the messages that reach the hooks' buses while running"""
+        self.recorder = recorder
+
+    def replay(self, replayer: TraceReplayer):
+        """Feeds the hooks from a recorded trace instead of the live buses
+
+           The connector stops once the entire trace has been replayed.
+        """
+        self.replayer = replayer
+        for hook in self.hooks:
+            hook.bus = replayer.bus(hook.bus_name)
+
+    def profile_startup(self, profile: StartupProfile):
+        """Times the phases of `start` and reports them once the output is ready"""
+        self.profile = profile
+
+    def serve_control(self, server: ControlServer):
+        """Accepts commands, such as 'profile', on a local socket while running"""
+        self.control = server
+
+    def when_ready(self, callback: Callable[[], None]):
+        """Calls `callback` on the event loop once the output backend is ready"""
+        if self.backend:
+            callback()
+        else:
+            self._ready_callbacks.append(callback)
+
     def start(self):
         # Just call this once to ensure there is a default event loop.
-        asyncio.get_event_loop()
+        event_loop = asyncio.get_event_loop()
+
+        if threading.current_thread() is threading.main_thread():
+            event_loop.add_signal_handler(signal.SIGUSR1, self.profiler.start)
+        if self.control:
+            self.control.register("profile", self._profile_command)
+            self.control.register("status", self.profiler.live_objects)
+            self.control.register("scene", self.restore_scene)
+            self.control.register("save_scene", self.save_scene)
+            self.control.register("scenes", lambda: SceneStore.get().names())
+            event_loop.run_until_complete(self.control.start())
+
+        # Connecting to the output can take a while, so it happens while the hooks
+        # attach. Until it is done, the ActionStack only keeps the activated states.
+        threading.Thread(
+            target=self._connect_backend,
+            args=(event_loop,),
+            name="output-connect",
+            daemon=True,
+        ).start()
 
         if self.default_action:
-            self.default_action.act(self.context)
+            self._default_cookie = self.default_action.act(self.context)
             print("Initialized with default actions")
 
-        for hook in self.hooks:
-            hook.attach()
+        with self._phase("attach hooks"):
+            for hook in self.hooks:
+                hook.attach()
+
+            if self.recorder:
+                buses = {h.bus_name.lower(): h.bus for h in self.hooks}
+                for bus_name, bus in buses.items():
+                    self.recorder.attach(bus, bus_name)
+
+        if self.replayer:
+
+            async def finish_replay():
+                # Let the activations of the last replayed messages run first
+                await asyncio.sleep(0)
+                self.stop()
+
+            def on_replayed():
+                # The dispatch workers may still be matching the last messages
+                BusDispatcher.join_all()
+                asyncio.run_coroutine_threadsafe(finish_replay(), event_loop)
+
+            # Replays only start once the output is ready, so they are reproducible
+            self.when_ready(lambda: self.replayer.start(on_replayed))
 
-        asyncio.get_event_loop().run_forever()
+        event_loop.run_forever()
 
         print("%d hooks attached" % len(self.hooks))
 
         self.loop.run()
 
+        if self._error:
+            raise self._error
+
+    def save_scene(self, name: str) -> str:
+        """Saves the current colors of every device as a scene, and returns its path"""
+        store = SceneStore.get()
+        store.save(self.context.action_stack.capture_scene(name))
+        return store.path(name)
+
+    def restore_scene(self, name: str = None):
+        """Shows a scene below the active hooks, until another one is restored
+
+           Switching scenes takes a single write per device. Without a name, the
+           devices go back to the colors they had without a scene.
+        """
+        action_stack = self.context.action_stack
+        if name is None:
+            if self._scene_cookie is not None:
+                action_stack.remove_state(self._scene_cookie)
+                self._scene_cookie = None
+            return
+
+        state = {"scene": SceneStore.get().load(name)}
+        if self._scene_cookie is None:
+            # The active hooks stay on top
+            self._scene_cookie = action_stack.push_state(state, below=True)
+        else:
+            action_stack.update_state(self._scene_cookie, state)
+
+    async def _profile_command(self, duration: float = None) -> str:
+        report = asyncio.get_event_loop().create_future()
+        self.profiler.start(duration, report.set_result)
+        return (await report).format()
+
+    def _phase(self, name: str):
+        return self.profile.phase(name) if self.profile else nullcontext()
+
+    def _connect_backend(self, event_loop):
+        """Creates the output backend and reads its devices, off the main thread"""
+        try:
+            with self._phase("connect output"):
+                backend = self.backend_factory()
+            with self._phase("read devices"):
+                devices = backend.devices()
+        except Exception as ex:
+            self._error = ex
+            event_loop.call_soon_threadsafe(self.stop)
+            return
+
+        event_loop.call_soon_threadsafe(self._on_backend_ready, backend, devices)
+
+    def _on_backend_ready(self, backend: OutputBackend, devices):
+        if self._stopped:
+            backend.close()
+            return
+
+        self.backend = backend
+        action_stack = self.context.action_stack
+        with self._phase("write buffered"):
+            action_stack.set_backend(backend, devices)
+        backend.watch(asyncio.get_event_loop(), action_stack.update_devices)
+
+        if self.profile:
+            self.profile.record("ready", time.perf_counter())
+            self.profile.info["buffered activations"] = action_stack.buffered_states
+            self.profile.report()
+
+        callbacks, self._ready_callbacks = self._ready_callbacks, []
+        for callback in callbacks:
+            callback()
+
     def stop(self):
-        self.loop.quit()
+        if self._stopped:
+            return
+        self._stopped = True
+
+        # Quitting from an idle callback also works when the loop is not running yet
+        GLib.idle_add(self.loop.quit)
         asyncio.get_event_loop().stop()
 
+        if self.recorder:
+            self.recorder.close()
+
+        if self.control:
+            self.control.close()
+
         for hook in self.hooks:
             hook.disconnect()
 
         print("%d hooks removed" % len(self.hooks))
 
-        if self.default_action:
-            self.default_action.reset(self.context)
+        if self.default_action and self._default_cookie is not None:
+            self.default_action.reset(self._default_cookie, self.context)
             print("Reset default actions")
+
+        if self.backend:
+            self.backend.close()
@@ -0,0 +1,115 @@
+import asyncio
+import inspect
+import json
+import logging
+import os
+import socket
+import stat
+import tempfile
+from typing import Awaitable, Callable, Dict, Union
+
+ControlHandler = Callable[..., Union[object, Awaitable[object]]]
+
+
+def default_socket_path() -> str:
+    """The control socket in the user's runtime directory"""
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, "openrgb-dbus-connector.sock")
+
+
+class ControlServer:
+    """Accepts commands on a local Unix socket, one JSON object per line
+
+       A command looks like `{"command": "profile", "duration": 10}`, where every
+       key apart from 'command' is passed to its handler. Every command gets a
+       single line back: `{"ok": true, "result": ...}` or `{"ok": false, "error":
+       ...}`. Only the user that runs the connector can connect to the socket.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or default_socket_path()
+        self.handlers: Dict[str, ControlHandler] = {}
+        self._server: asyncio.AbstractServer = None
+
+    def register(self, command: str, handler: ControlHandler):
+        """Handlers run on the event loop, and can be coroutine functions"""
+        self.handlers[command] = handler
+
+    async def start(self):
+        if os.path.exists(self.path):
+            self._remove_stale_socket()
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._serve, self.path)
+        finally:
+            os.umask(umask)
+        logging.info("Listening for control commands on %s", self.path)
+
+    def _remove_stale_socket(self):
+        """Removes the socket of a connector that did not stop cleanly
+
+           A socket that still accepts connections belongs to a running connector,
+           which keeps it.
+        """
+        if not stat.S_ISSOCK(os.stat(self.path).st_mode):
+            raise Exception("'{}' exists and is not a socket".format(self.path))
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.path)
+            except ConnectionRefusedError:
+                os.unlink(self.path)
+                return
+        raise Exception(
+            "Another connector is already listening on '{}'".format(self.path)
+        )
+
+    def close(self):
+        if self._server:
+            self._server.close()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(json.dumps(await self._handle(line)).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            command = request.pop("command")
+            if command not in self.handlers:
+                raise Exception("Unknown command: '{}'".format(command))
+            result = self.handlers[command](**request)
+            if inspect.isawaitable(result):
+                result = await result
+            return {"ok": True, "result": result}
+        except Exception as ex:
+            logging.warning("Control command failed: %s", ex)
+            return {"ok": False, "error": str(ex)}
+
+
+def send_command(command: str, path: str = None, timeout: float = None, **arguments):
+    """Sends a command to a running connector and returns its result"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(path or default_socket_path())
+        request = json.dumps({"command": command, **arguments}).encode() + b"\n"
+        connection.sendall(request)
+        response = connection.makefile("rb").readline()
+    if not response:
+        raise Exception("The connector closed the connection")
+
+    response = json.loads(response)
+    if not response["ok"]:
+        raise Exception(response["error"])
+    return response["result"]
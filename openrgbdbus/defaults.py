@@ -4,4 +4,6 @@ client = {
     "display_name": "D-Bus Connector",
 }
 
+output = {"backend": "openrgb"}
+
 connector = {"server": client}
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import queue
+import sys
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# The number of messages a bus can have waiting before new ones are dropped
+QUEUE_SIZE = 1024
+
+
+class Handoff:
+    """Passes calls from other threads to the event loop, without taking a lock
+
+       Calls are appended to a deque, which is thread-safe in CPython, and the loop
+       is only woken up when it is not already going to drain it. The loop runs all
+       calls that were handed off in one go, in order. Calls that are made on the
+       loop's own thread are run right away.
+    """
+
+    _handoffs: Dict[asyncio.AbstractEventLoop, "Handoff"] = {}
+
+    @classmethod
+    def get(cls) -> "Handoff":
+        """The handoff to the current event loop. Must be called on its thread."""
+        loop = asyncio.get_event_loop()
+        if loop not in cls._handoffs:
+            cls._handoffs[loop] = Handoff(loop)
+        return cls._handoffs[loop]
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._thread = threading.get_ident()
+        self._calls = deque()
+        self._scheduled = False
+
+    def __len__(self):
+        """The number of calls that wait for the loop"""
+        return len(self._calls)
+
+    def call(self, callback: Callable, *args):
+        if threading.get_ident() == self._thread:
+            callback(*args)
+            return
+
+        self._calls.append((callback, args))
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        # Calls that are appended from here on schedule another drain
+        self._scheduled = False
+        calls = self._calls
+        for _ in range(len(calls)):
+            callback, args = calls.popleft()
+            try:
+                callback(*args)
+            except Exception as ex:
+                logging.critical("Unhandled exception in callback task: ", exc_info=ex)
+                exit(1)
+
+
+class SignalMatch:
+    """The message headers and arguments that a signal trigger expects
+
+       Empty headers and `None` arguments match anything.
+    """
+
+    def __init__(self, params: Dict[str, str], arguments: List):
+        self.params = {k: v for k, v in params.items() if k != "eavesdrop" and v}
+        self.member = self.params.get("member")
+        self.arguments = arguments
+
+    def matches(self, headers: Dict[str, str], arguments: Tuple) -> bool:
+        for key, expected in self.params.items():
+            if expected != headers[key]:
+                return False
+        for expected, actual in zip(self.arguments, arguments):
+            if expected is not None and expected != actual:
+                return False
+        return True
+
+
+# Called on the dispatch worker with the message and its unpacked arguments
+SignalCallback = Callable[[object, Tuple], None]
+
+
+class BusDispatcher:
+    """Matches the messages of one bus connection, on a worker thread of its own
+
+       There is one dispatcher per connection, with one filter for all signal
+       triggers and property mirrors on it. GDBus calls the filters of all
+       connections on the same thread, so the filter only queues the messages that
+       could match. The worker unpacks each message once, looks up the matches by
+       member name, and also evaluates the conditions of the triggers of the bus,
+       which can make blocking D-Bus calls. Activations go to the event loop
+       through the `Handoff`.
+
+       The queue is bounded: when a bus floods it, its new messages are dropped
+       instead of delaying the other buses or the event loop. Buses with
+       `lossless = True`, such as replayed buses, wait for room instead. Once the
+       worker caught up, the `drop_listeners` are called, e.g. so that mirrored
+       state can be read again. Calls that are `submit`ted are never dropped and
+       never block the caller.
+    """
+
+    _dispatchers: Dict[object, "BusDispatcher"] = {}
+
+    @classmethod
+    def get(cls, bus) -> "BusDispatcher":
+        if bus.con not in cls._dispatchers:
+            lossless = getattr(bus, "lossless", False)
+            cls._dispatchers[bus.con] = BusDispatcher(bus.con, Handoff.get(), lossless)
+        return cls._dispatchers[bus.con]
+
+    @classmethod
+    def all(cls) -> List["BusDispatcher"]:
+        return list(cls._dispatchers.values())
+
+    @classmethod
+    def join_all(cls):
+        """Waits until every dispatcher has handled everything it was given"""
+        for dispatcher in list(cls._dispatchers.values()):
+            dispatcher.queue.join()
+
+    def __init__(
+        self,
+        connection,
+        handoff: Handoff,
+        lossless: bool = False,
+        queue_size: int = QUEUE_SIZE,
+    ):
+        self.connection = connection
+        self.handoff = handoff
+        self.lossless = lossless
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        # Called on the worker after messages were dropped
+        self.drop_listeners: Set[Callable[[], None]] = set()
+        # Submitted calls, which go ahead of the queued messages
+        self._calls = deque()
+        # Replaced instead of changed, so the worker and the filter never need a lock
+        self._matches: Dict[Optional[str], Tuple[Tuple[SignalMatch, Callable]]] = {}
+        self._filter = None
+        self.thread = threading.Thread(
+            target=self._run, name=f"dispatch-{len(self._dispatchers)}", daemon=True
+        )
+        self.thread.start()
+
+    def add(self, match: SignalMatch, callback: SignalCallback):
+        entry = (match, callback)
+        matches = dict(self._matches)
+        matches[match.member] = matches.get(match.member, ()) + (entry,)
+        self._matches = matches
+        if self._filter is None:
+            self._filter = self.connection.add_filter(self._filter_message)
+        return entry
+
+    def remove(self, entry):
+        match, _ = entry
+        matches = dict(self._matches)
+        remaining = tuple(e for e in matches.get(match.member, ()) if e is not entry)
+        if remaining:
+            matches[match.member] = remaining
+        else:
+            matches.pop(match.member, None)
+        self._matches = matches
+        if not matches and self._filter is not None:
+            self.connection.remove_filter(self._filter)
+            self._filter = None
+
+    def __len__(self):
+        """The number of signal triggers on the bus"""
+        return sum(len(entries) for entries in self._matches.values())
+
+    def submit(self, callback: Callable, *args):
+        """Runs `callback` on the worker, e.g. to evaluate conditions
+
+           Called from the event loop, so it does not wait for room in the queue.
+        """
+        self._calls.append((callback, args))
+        try:
+            # Wakes up the worker. When the queue is full, the worker is busy and
+            # runs the calls before it takes its next message anyway.
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def on_worker(self) -> bool:
+        return threading.current_thread() is self.thread
+
+    def _filter_message(self, conn, message, incoming):
+        if incoming:
+            matches = self._matches
+            if message.get_member() in matches or None in matches:
+                try:
+                    self.queue.put((self._dispatch, (message,)), block=self.lossless)
+                except queue.Full:
+                    if not self.dropped:
+                        logging.warning("Dispatch queue is full, dropping messages")
+                    self.dropped += 1
+        return message
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                while self._calls:
+                    callback, args = self._calls.popleft()
+                    callback(*args)
+                if item is not None:
+                    callback, args = item
+                    callback(*args)
+            except Exception as ex:
+                logging.critical("Unhandled exception in dispatch task: ", exc_info=ex)
+                self.handoff.call(sys.exit, 1)
+            finally:
+                self.queue.task_done()
+            if self.dropped and self.queue.empty():
+                logging.warning("Dropped %d messages", self.dropped)
+                self.dropped = 0
+                for listener in list(self.drop_listeners):
+                    listener()
+
+    def _dispatch(self, message):
+        matches = self._matches
+        entries = matches.get(message.get_member(), ()) + matches.get(None, ())
+        if not entries:
+            return
+
+        headers = {
+            "sender": message.get_sender(),
+            "path": message.get_path(),
+            "interface": message.get_interface(),
+            "member": message.get_member(),
+            "destination": message.get_destination(),
+        }
+        body = message.get_body()
+        arguments = body.unpack() if body is not None else ()
+        for match, callback in entries:
+            if match.matches(headers, arguments):
+                callback(message, arguments)
@@ -0,0 +1,86 @@
+import operator
+import re
+from typing import Callable, Mapping
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+_COMPARISON = re.compile(r"^\s*([\w.-]+)\s*(==|!=|<=|>=|<|>)\s*(.+?)\s*$")
+_NAME = re.compile(r"^\s*(not\s+)?([\w.-]+)\s*$")
+
+
+def parse_literal(text: str):
+    """Parses the value in an expression: booleans, numbers and (quoted) strings"""
+    text = text.strip()
+    lowered = text.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        return text[1:-1]
+    for number_type in (int, float):
+        try:
+            return number_type(text)
+        except ValueError:
+            pass
+    return text
+
+
+def compile_comparison(symbol: str, expected) -> Callable[[object], bool]:
+    """A function that compares a value to `expected` with the operator `symbol`"""
+    if symbol not in OPERATORS:
+        raise Exception("Unknown operator: '{}'".format(symbol))
+    op = OPERATORS[symbol]
+
+    def compare(value) -> bool:
+        # Without this, e.g. 'Level == 1' would also match True
+        if isinstance(value, bool) != isinstance(expected, bool):
+            return False
+        try:
+            return op(value, expected)
+        except TypeError:
+            return False
+
+    return compare
+
+
+class Comparison:
+    """A compiled `<name> <operator> <value>` expression, e.g. `Percentage < 20`
+
+       A plain `<name>` (or `not <name>`) tests whether the value is truthy. Missing
+       values, and values that cannot be compared to each other, never match.
+    """
+
+    def __init__(self, name: str, compare: Callable[[object], bool], text: str):
+        self.name = name
+        self._compare = compare
+        self.text = text
+
+    @classmethod
+    def parse(cls, expression: str) -> "Comparison":
+        match = _COMPARISON.match(expression)
+        if match:
+            name, symbol, value = match.groups()
+            compare = compile_comparison(symbol, parse_literal(value))
+            return cls(name, compare, expression)
+
+        match = _NAME.match(expression)
+        if match:
+            negate, name = match.groups()
+            compare = (lambda value: not value) if negate else bool
+            return cls(name, compare, expression)
+
+        raise Exception("Invalid expression: '{}'".format(expression))
+
+    def __call__(self, values: Mapping[str, object]) -> bool:
+        if self.name not in values:
+            return False
+        return self._compare(values[self.name])
+
+    def __repr__(self):
+        return f"Comparison({self.text!r})"
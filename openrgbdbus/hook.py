@@ -1,76 +1,102 @@
 import logging
 from string import Template
-from typing import Callable, List, Union
+from typing import Callable, Set, Union
 
 from pydbus.bus import Bus, bus_get
 from pydbus.subscription import Subscription
 
 from .actions import Action
 from .trigger import Trigger, TriggerSubscription
-from .utils import Context, substitute_all
+from .utils import Context, referenced_names, substitute_all
 
 
-def bus_from_name(name: str):
+def bus_type_from_name(name: str):
     name = name.lower()
     if name == "system":
-        bus_type = Bus.Type.SYSTEM
+        return Bus.Type.SYSTEM
     elif name == "session":
-        bus_type = Bus.Type.SESSION
+        return Bus.Type.SESSION
     else:
         # Just because I currently do not know how they work
         raise Exception("Custom busses are currently not supported")
-    return bus_get(bus_type)
+
+
+def bus_from_name(name: str):
+    return bus_get(bus_type_from_name(name))
 
 
 class Hook:
     def __init__(
         self,
         start_trigger: Trigger,
-        end_trigger: Trigger,
-        action: Action,
+        end_trigger: Trigger = None,
+        action: Action = None,
         bus_name: str = "session",
         name: str = None,
     ):
-        self.bus = bus_from_name(bus_name)
+        # Fail early on unsupported busses
+        bus_type_from_name(bus_name)
+        self.bus_name = bus_name
+        # Only connected on attach, so the bus can still be swapped (e.g. for replays)
+        self.bus = None
         self.start_trigger = start_trigger
+        if end_trigger is None:
+            end_trigger = Trigger(start_trigger.source.inverse())
         self.end_trigger = end_trigger
         self.action = action
         self.context = {}
         if not name:
             name = id(self)
         self.name = name
-        self.subscriptions: List[TriggerSubscription] = []
+        self.subscriptions: Set[TriggerSubscription] = set()
+        # The cookie of a continuous action while it is active
+        self._active_cookie = None
 
     def set_context(self, context: Context):
         self.context = Context(context)
 
     def attach(self):
-        self.subscriptions.append(
+        if self.bus is None:
+            self.bus = bus_from_name(self.bus_name)
+        # Events only keep what the rest of the hook uses. Known once the action
+        # can no longer be replaced.
+        self.start_trigger.source.fields = referenced_names(
+            [self.start_trigger.conditions, self.action, self.end_trigger]
+        )
+        self.subscriptions.add(
             self.start_trigger.subscribe(
                 self.bus, self.context, self._get_trigger_handler(self.bus)
             )
         )
 
     def disconnect(self):
-        for subscription in self.subscriptions:
+        for subscription in list(self.subscriptions):
             self._cancel_subscription(subscription)
 
     def _cancel_subscription(self, subscription: TriggerSubscription):
         subscription.cancel()
-        self.subscriptions.remove(subscription)
+        self.subscriptions.discard(subscription)
 
     def _get_trigger_handler(self, bus):
         def trigger_func(context):
+            if self._active_cookie is not None:
+                # Continuous actions follow the new values instead of stacking
+                self.action.update(self._active_cookie, context)
+                return
+
             logging.info(f"Hook '{self.name}' activated")
 
             action_cookie = self.action.act(context)
+            if self.action.continuous:
+                self._active_cookie = action_cookie
 
             def _on_end(*args, **kwargs):
                 self.action.reset(action_cookie, context)
+                self._active_cookie = None
                 logging.info(f"Hook '{self.name}' halted")
                 self._cancel_subscription(subscription)
 
             subscription = self.end_trigger.subscribe(bus, context, _on_end)
-            self.subscriptions.append(subscription)
+            self.subscriptions.add(subscription)
 
         return trigger_func
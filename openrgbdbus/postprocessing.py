@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from typing import Dict, List, Set
+
+from .backends import DeviceInfo
+from .selection import DeviceSelector
+from .utils import lazy_import
+
+np = lazy_import("numpy")
+
+# Added to a frame, these turn its values into indices of a flattened (3 x 256) LUT
+_CHANNEL_OFFSETS = (0, 256, 512)
+
+
+class Calibration:
+    """The color correction of the devices picked by id, name (pattern) and/or type
+
+       Unset values are taken from the global settings of the PostProcessor. The
+       device's brightness is applied on top of the global brightness. Like the
+       actions, calibrations follow the devices when OpenRGB re-enumerates them.
+    """
+
+    def __init__(
+        self,
+        brightness: float = None,
+        gamma: float = None,
+        white_point: List[int] = None,
+        device: int = None,
+        device_type=None,
+        device_name: str = None,
+    ):
+        self.brightness = brightness
+        self.gamma = gamma
+        self.white_point = white_point
+        self.selector = DeviceSelector(device, device_name, device_type)
+
+
+class PostProcessor:
+    """The last stage before the output: brightness, gamma and white point correction
+
+       Every device gets a precomputed lookup table per channel, which is applied to
+       the entire frame when it is flushed. The `dimmer` scales the brightness of
+       all devices and can be changed at any time; only the tables are recomputed.
+    """
+
+    def __init__(
+        self,
+        brightness: float = 1,
+        gamma: float = 1,
+        white_point: List[int] = (255, 255, 255),
+        calibrations: List[Calibration] = None,
+    ):
+        self.brightness = brightness
+        self.gamma = gamma
+        self.white_point = white_point
+        self.calibrations = calibrations or []
+        # The calibration of every device (by id) that one was given for
+        self.devices: Dict[int, Calibration] = {}
+        self.dimmer = 1.0
+        self._luts: Dict[int, np.ndarray] = {}
+
+    def update_devices(self, devices: List[DeviceInfo]) -> Set[int]:
+        """Matches the calibrations against a new device list
+
+           When several calibrations match a device, the last one is used. Returns
+           the ids of the devices that got another calibration.
+        """
+        previous, self.devices = self.devices, {}
+        for device_id, device in enumerate(devices):
+            for calibration in self.calibrations:
+                if calibration.selector.matches(device_id, device):
+                    self.devices[device_id] = calibration
+
+        changed = {
+            device_id
+            for device_id in set(previous) | set(self.devices)
+            if previous.get(device_id) is not self.devices.get(device_id)
+        }
+        for device_id in changed:
+            self._luts.pop(device_id, None)
+        return changed
+
+    def set_dimmer(self, dimmer: float):
+        self.dimmer = max(0.0, dimmer)
+        self._luts.clear()
+
+    def apply(self, device_id: int, frame: np.ndarray) -> np.ndarray:
+        """Returns the corrected copy of the frame (or the frame itself if unchanged)"""
+        if device_id not in self._luts:
+            self._luts[device_id] = self._build_lut(device_id)
+
+        lut = self._luts[device_id]
+        if lut is None:
+            return frame
+        return lut[frame + np.array(_CHANNEL_OFFSETS, dtype=np.intp)]
+
+    def _build_lut(self, device_id: int) -> np.ndarray:
+        """A flattened (3 x 256) lookup table, or None when it would change nothing"""
+        calibration = self.devices.get(device_id, Calibration())
+        brightness = self.brightness * self.dimmer
+        if calibration.brightness is not None:
+            brightness *= calibration.brightness
+        gamma = calibration.gamma if calibration.gamma is not None else self.gamma
+        white_point = calibration.white_point or self.white_point
+
+        if brightness == 1 and gamma == 1 and tuple(white_point) == (255, 255, 255):
+            return None
+
+        scale = np.asarray(white_point, dtype=float) * brightness
+        lut = np.rint(np.outer(scale, np.linspace(0, 1, 256) ** gamma))
+        return np.clip(lut, 0, 255).astype(np.uint8).ravel()
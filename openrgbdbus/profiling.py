@@ -0,0 +1,331 @@
+import asyncio
+import cProfile
+import gc
+import inspect
+import io
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from . import actions, backends, conditions, dispatch, postprocessing, selection
+from . import hook, properties, system, trigger
+from .utils import Context, EventContext
+
+# How long a profile runs when it is started by a signal
+DEFAULT_WINDOW = 30
+
+# The subsystems that time and allocations are grouped by. Code of other libraries
+# is counted towards the subsystem that called it.
+DISPATCH = "DBusTrigger filter"
+CONDITIONS = "TriggerCondition"
+ACTION_STACK = "ActionStack"
+WRITES = "OpenRGB writes"
+TRIGGERS = "Other triggers"
+OTHER = "Other"
+
+# (name, file, line) as used by cProfile
+FunctionKey = Tuple[str, int, str]
+
+
+def _source_file(module) -> str:
+    return os.path.normcase(os.path.abspath(inspect.getsourcefile(module)))
+
+
+def _class_lines(cls) -> range:
+    lines, start = inspect.getsourcelines(cls)
+    return range(start, start + len(lines))
+
+
+class SubsystemMap:
+    """Tells which subsystem a function or an allocation belongs to"""
+
+    def __init__(self):
+        self.files = {
+            _source_file(dispatch): DISPATCH,
+            _source_file(conditions): CONDITIONS,
+            _source_file(actions): ACTION_STACK,
+            _source_file(selection): ACTION_STACK,
+            _source_file(postprocessing): ACTION_STACK,
+            _source_file(backends): WRITES,
+            _source_file(system): TRIGGERS,
+            _source_file(properties): TRIGGERS,
+            _source_file(hook): TRIGGERS,
+        }
+        # trigger.py holds the code of several subsystems
+        self.trigger_file = _source_file(trigger)
+        self.trigger_classes = [
+            (_class_lines(trigger.DBusTrigger), DISPATCH),
+            (_class_lines(trigger.TriggerCondition), CONDITIONS),
+        ]
+        openrgb_module = sys.modules.get("openrgb")
+        self.openrgb_directory = None
+        if openrgb_module is not None and getattr(openrgb_module, "__file__", None):
+            self.openrgb_directory = os.path.dirname(
+                os.path.normcase(os.path.abspath(openrgb_module.__file__))
+            )
+
+    def subsystem(self, filename: str, line: int = 0) -> str:
+        """The subsystem of the code, or None for code of the standard library etc."""
+        filename = os.path.normcase(os.path.abspath(filename))
+        if filename in self.files:
+            return self.files[filename]
+        if filename == self.trigger_file:
+            for lines, name in self.trigger_classes:
+                if line in lines:
+                    return name
+            return TRIGGERS
+        if self.openrgb_directory and filename.startswith(self.openrgb_directory):
+            return WRITES
+        return None
+
+
+class ProfileReport:
+    """The results of a profile, grouped by subsystem"""
+
+    def __init__(
+        self,
+        stats: pstats.Stats,
+        allocations: List[tracemalloc.StatisticDiff],
+        objects: Dict[str, int],
+        window: float,
+        stats_path: str = None,
+    ):
+        self.window = window
+        self.objects = objects
+        self.stats_path = stats_path
+        subsystems = SubsystemMap()
+
+        # Seconds spent, and the functions that spent most of it, per subsystem
+        self.time: Dict[str, float] = {}
+        self.functions: Dict[str, List[Tuple[float, FunctionKey]]] = {}
+        owners = self._attribute(stats.stats, subsystems)
+        for function, (_, _, own_time, cumulative, _) in stats.stats.items():
+            for subsystem, share in owners[function].items():
+                self.time[subsystem] = self.time.get(subsystem, 0) + own_time * share
+            if subsystems.subsystem(function[0], function[1]):
+                subsystem = subsystems.subsystem(function[0], function[1])
+                self.functions.setdefault(subsystem, []).append((cumulative, function))
+
+        # Bytes and blocks that were allocated (and not freed), per subsystem
+        self.allocations: Dict[str, List[int]] = {}
+        for statistic in allocations:
+            frame = statistic.traceback[0]
+            subsystem = subsystems.subsystem(frame.filename, frame.lineno) or OTHER
+            totals = self.allocations.setdefault(subsystem, [0, 0])
+            totals[0] += statistic.size_diff
+            totals[1] += statistic.count_diff
+        self.top_allocations = allocations[:10]
+
+    @staticmethod
+    def _attribute(stats, subsystems: SubsystemMap) -> Dict[FunctionKey, Dict]:
+        """The share of every function's own time that each subsystem is charged
+
+           Code that is not part of a subsystem is charged to the subsystems of its
+           callers, in proportion to the time spent on behalf of each of them.
+        """
+        owners: Dict[FunctionKey, Dict[str, float]] = {}
+
+        def owner(function: FunctionKey, visiting: set) -> Dict[str, float]:
+            if function in owners:
+                return owners[function]
+            subsystem = subsystems.subsystem(function[0], function[1])
+            if subsystem:
+                return owners.setdefault(function, {subsystem: 1.0})
+
+            if function in visiting:
+                # A recursive call, which is charged through its first caller
+                return {OTHER: 1.0}
+            callers = stats.get(function, (0, 0, 0, 0, {}))[4]
+            total = sum(edge[3] for edge in callers.values())
+            if not total:
+                # The event loop itself
+                return owners.setdefault(function, {OTHER: 1.0})
+
+            shares: Dict[str, float] = {}
+            for caller, edge in callers.items():
+                weight = edge[3] / total
+                for subsystem, share in owner(caller, visiting | {function}).items():
+                    shares[subsystem] = shares.get(subsystem, 0) + share * weight
+            owners[function] = shares
+            return shares
+
+        for function in stats:
+            owner(function, set())
+        return owners
+
+    def format(self) -> str:
+        out = io.StringIO()
+        print(f"Runtime profile of {self.window:.1f} seconds", file=out)
+        print(
+            f"  {'subsystem':<20} {'cpu ms':>9} {'alloc KiB':>10} {'blocks':>8}",
+            file=out,
+        )
+        names = sorted(
+            set(self.time) | set(self.allocations),
+            key=lambda name: -self.time.get(name, 0),
+        )
+        for name in names:
+            size, count = self.allocations.get(name, (0, 0))
+            print(
+                f"  {name:<20} {self.time.get(name, 0) * 1000:>9.1f}"
+                f" {size / 1024:>10.1f} {count:>8}",
+                file=out,
+            )
+
+        print("Slowest functions (cumulative ms):", file=out)
+        for name, functions in sorted(self.functions.items()):
+            print(f"  {name}:", file=out)
+            for cumulative, (filename, line, function) in sorted(functions)[:-6:-1]:
+                location = f"{os.path.basename(filename)}:{line}"
+                print(
+                    f"    {cumulative * 1000:>9.1f}  {function} ({location})", file=out
+                )
+
+        print("Largest new allocations:", file=out)
+        for statistic in self.top_allocations:
+            frame = statistic.traceback[0]
+            print(
+                f"  {statistic.size_diff / 1024:>9.1f} KiB {statistic.count_diff:>7}"
+                f"  {os.path.basename(frame.filename)}:{frame.lineno}",
+                file=out,
+            )
+
+        print("Live objects:", file=out)
+        for name, count in self.objects.items():
+            print(f"  {name}: {count}", file=out)
+        if self.stats_path:
+            print(f"Full profile: {self.stats_path}", file=out)
+        return out.getvalue()
+
+
+class RuntimeProfiler:
+    """Profiles the running connector for a while, with cProfile and tracemalloc
+
+       cProfile only sees the thread it is enabled on (before Python 3.12), so a
+       profile is also enabled on the dispatch worker of every bus. Started with
+       `SIGUSR1` or the 'profile' control command, see `Connector.start`.
+    """
+
+    def __init__(self, connector, window: float = DEFAULT_WINDOW):
+        self.connector = connector
+        self.window = window
+        self.running = False
+        self._profiles: List[cProfile.Profile] = []
+        # The dispatch workers with the profiles that run on their threads
+        self._workers: List[Tuple[dispatch.BusDispatcher, cProfile.Profile]] = []
+        self._callbacks: List[Callable[[ProfileReport], None]] = []
+
+    def start(
+        self, window: float = None, on_report: Callable[[ProfileReport], None] = None
+    ):
+        """Profiles for `window` seconds, then reports. Joins a running profile."""
+        if on_report:
+            self._callbacks.append(on_report)
+        if self.running:
+            return
+
+        self.running = True
+        window = self.window if window is None else window
+        logging.warning("Profiling for %.1f seconds", window)
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        self._snapshot = tracemalloc.take_snapshot()
+        self._start = time.perf_counter()
+
+        # CPU time of the thread, so that waiting for messages does not count
+        main = cProfile.Profile(time.thread_time)
+        main.enable()
+        self._profiles = [main]
+        self._workers = []
+        for dispatcher in dispatch.BusDispatcher.all():
+            profile = cProfile.Profile(time.thread_time)
+            dispatcher.submit(self._enable, profile)
+            self._profiles.append(profile)
+            self._workers.append((dispatcher, profile))
+        asyncio.get_event_loop().call_later(window, self._stop)
+
+    @staticmethod
+    def _enable(profile: cProfile.Profile):
+        try:
+            profile.enable()
+        except ValueError:
+            # Since Python 3.12, one profile covers all threads and it is enabled
+            pass
+
+    def _stop(self):
+        self._profiles[0].disable()
+        window = time.perf_counter() - self._start
+        pending = len(self._workers)
+        if not pending:
+            self._report(window)
+            return
+
+        # The profiles of the workers are disabled on their own threads as well
+        handoff = dispatch.Handoff.get()
+
+        def disable(profile: cProfile.Profile):
+            profile.disable()
+            handoff.call(on_disabled)
+
+        def on_disabled():
+            nonlocal pending
+            pending -= 1
+            if not pending:
+                self._report(window)
+
+        for dispatcher, profile in self._workers:
+            dispatcher.submit(disable, profile)
+
+    def _report(self, window: float):
+        snapshot = tracemalloc.take_snapshot()
+        if self._started_tracing:
+            tracemalloc.stop()
+        allocations = snapshot.compare_to(self._snapshot, "lineno")
+        self._snapshot = None
+
+        stats = pstats.Stats(self._profiles[0])
+        for profile in self._profiles[1:]:
+            profile.create_stats()
+            if profile.stats:
+                stats.add(profile)
+        stats_path = os.path.join(
+            tempfile.gettempdir(), f"openrgb-dbus-connector-{os.getpid()}.prof"
+        )
+        stats.dump_stats(stats_path)
+        self._profiles = []
+        self._workers = []
+        self.running = False
+
+        report = ProfileReport(
+            stats, allocations, self.live_objects(), window, stats_path
+        )
+        print(report.format(), file=sys.stderr)
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(report)
+
+    def live_objects(self) -> Dict[str, int]:
+        """The number of layers, subscriptions, contexts, timers and queued calls"""
+        connector = self.connector
+        stack = connector.context.action_stack
+        loop = asyncio.get_event_loop()
+        dispatchers = dispatch.BusDispatcher.all()
+        return {
+            "layers": len(stack.states) - (1 if stack.base_state else 0),
+            "subscriptions": sum(len(hook.subscriptions) for hook in connector.hooks),
+            "signal matches": sum(len(dispatcher) for dispatcher in dispatchers),
+            "contexts": sum(
+                1 for o in gc.get_objects() if isinstance(o, (Context, EventContext))
+            ),
+            # Private, but there is no other way to see the timers of an asyncio loop
+            "pending timers": len(getattr(loop, "_scheduled", ())),
+            "queued messages": sum(d.queue.qsize() for d in dispatchers),
+            "queued activations": len(dispatch.Handoff.get()),
+            "dropped messages": sum(d.dropped for d in dispatchers),
+        }
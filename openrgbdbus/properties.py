@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .dispatch import BusDispatcher, SignalMatch
+from .expressions import Comparison
+from .utils import Context
+
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+DBUS_SERVICE = "org.freedesktop.DBus"
+PROPERTY_PREFIX = "prop_"
+
+
+class PropertyWatch:
+    """Calls `callback` whenever the expression becomes `target` (True or False)
+
+       With `updates`, it is also called when a property that the hook uses (as
+       `prop_<name>`, see `fields`) changes while the expression stays `target`.
+       Without `fields`, that is any property of the interface.
+    """
+
+    def __init__(
+        self,
+        expression: Comparison,
+        target: bool,
+        context: Context,
+        callback: Callable[[Context], None],
+        updates: bool = False,
+        fields: Set[str] = None,
+    ):
+        self.expression = expression
+        self.target = target
+        self.context = context
+        self.callback = callback
+        self.updates = updates
+        # Assume the opposite, so the watch fires if the target already holds
+        self.last = not target
+
+        # The properties that the watch is evaluated on. `None` stands for all.
+        self.properties: Set[Optional[str]] = {expression.name}
+        if updates and fields is None:
+            self.properties.add(None)
+        elif updates:
+            self.properties |= {
+                field[len(PROPERTY_PREFIX) :]
+                for field in fields
+                if field.startswith(PROPERTY_PREFIX)
+            }
+
+
+class PropertyMirror:
+    """The latest values of the properties of one interface of a D-Bus object
+
+       There is only one mirror per (bus, service, path, interface), however many
+       watches use it. It subscribes to PropertiesChanged once, and gets the current
+       values with a single GetAll call. The changes pass through the bus's
+       `BusDispatcher`, like signals do. The watches are evaluated on the event
+       loop, but only those whose properties changed.
+
+       Only the changes sent by the current owner of the service are taken over,
+       unless the bus cannot tell owners (`tracks_owners = False`, such as replayed
+       buses). When the service gets another owner, e.g. because it restarted, or
+       when the dispatcher had to drop messages, the values are read again.
+    """
+
+    _mirrors: Dict[Tuple, "PropertyMirror"] = {}
+
+    @classmethod
+    def get(cls, bus, service: str, path: str, interface: str) -> "PropertyMirror":
+        key = (bus, service, path, interface)
+        if key not in cls._mirrors:
+            cls._mirrors[key] = PropertyMirror(bus, service, path, interface)
+        return cls._mirrors[key]
+
+    def __init__(self, bus, service: str, path: str, interface: str):
+        self.bus = bus
+        self.service = service
+        self.path = path
+        self.interface = interface
+        self.values: Dict[str, object] = {}
+        self.ready = False
+        # The watches by the properties they are evaluated on, see `PropertyWatch`
+        self._watches: Dict[Optional[str], Set[PropertyWatch]] = {}
+        self._event_loop = asyncio.get_event_loop()
+        # The unique name of the service's owner. Unique names own themselves.
+        self._owner = service if service.startswith(":") else None
+        self._check_owner = getattr(bus, "tracks_owners", True)
+        self._match = (
+            f"type='signal',sender='{service}',path='{path}',"
+            f"interface='{PROPERTIES_INTERFACE}',member='PropertiesChanged',"
+            f"arg0='{interface}'"
+        )
+        self._owner_match = (
+            f"type='signal',sender='{DBUS_SERVICE}',interface='{DBUS_SERVICE}',"
+            f"member='NameOwnerChanged',arg0='{service}'"
+        )
+
+        logging.info("Mirroring the properties of %s %s %s", service, path, interface)
+        dbus = bus.get(DBUS_SERVICE)
+        dbus.AddMatch(self._match)
+        if self._owner is None:
+            dbus.AddMatch(self._owner_match)
+        self._dispatcher = BusDispatcher.get(bus)
+        self._entries = [
+            self._dispatcher.add(
+                SignalMatch(
+                    {
+                        "path": path,
+                        "interface": PROPERTIES_INTERFACE,
+                        "member": "PropertiesChanged",
+                    },
+                    [interface],
+                ),
+                self._on_properties_changed,
+            )
+        ]
+        if self._owner is None:
+            self._entries.append(
+                self._dispatcher.add(
+                    SignalMatch(
+                        {
+                            "sender": DBUS_SERVICE,
+                            "interface": DBUS_SERVICE,
+                            "member": "NameOwnerChanged",
+                        },
+                        [service],
+                    ),
+                    self._on_owner_changed,
+                )
+            )
+        self._dispatcher.drop_listeners.add(self._on_dropped)
+        # Whether values are read again after dropped changes, and if once more
+        self._resyncing = False
+        self._resync_again = False
+        self._start_bootstrap()
+
+    def watch(self, watch: PropertyWatch):
+        for name in watch.properties:
+            self._watches.setdefault(name, set()).add(watch)
+        if self.ready:
+            self._event_loop.call_soon(self._evaluate, [watch])
+
+    def unwatch(self, watch: PropertyWatch):
+        for name in watch.properties:
+            watches = self._watches.get(name, set())
+            watches.discard(watch)
+            if not watches:
+                self._watches.pop(name, None)
+        if not self._watches:
+            self.close()
+
+    def close(self):
+        PropertyMirror._mirrors.pop(
+            (self.bus, self.service, self.path, self.interface), None
+        )
+        for entry in self._entries:
+            self._dispatcher.remove(entry)
+        self._dispatcher.drop_listeners.discard(self._on_dropped)
+        dbus = self.bus.get(DBUS_SERVICE)
+        dbus.RemoveMatch(self._match)
+        if not self.service.startswith(":"):
+            dbus.RemoveMatch(self._owner_match)
+
+    def _start_bootstrap(self, replace: bool = False):
+        threading.Thread(
+            target=self._bootstrap,
+            args=(replace,),
+            name="property-getall",
+            daemon=True,
+        ).start()
+
+    def _bootstrap(self, replace: bool = False):
+        """Gets the current values, off the event loop as it is a blocking call
+
+           With `replace`, the values replace all known values instead of only
+           those that did not change in the meantime.
+        """
+        try:
+            if not replace and self._check_owner and self._owner is None:
+                # Changes are only taken over from here on, before the values are read
+                self._owner = self.bus.get(DBUS_SERVICE).GetNameOwner(self.service)
+            values = self.bus.get(self.service, self.path).GetAll(self.interface)
+        except Exception as ex:
+            logging.info(
+                "Could not get the properties of %s %s: %s", self.service, self.path, ex
+            )
+            values = None
+        self._event_loop.call_soon_threadsafe(self._on_bootstrap, values or {}, replace)
+
+    def _on_bootstrap(self, values: Dict[str, object], replace: bool):
+        if replace:
+            # Those of a previous owner, or from before dropped changes, are stale
+            self.values = values
+            if self._resyncing:
+                self._resyncing = False
+                if self._resync_again:
+                    self._resync_again = False
+                    self._resync()
+        else:
+            # Values that changed in the meantime are newer than the ones from GetAll
+            self.values = {**values, **self.values}
+        self.ready = True
+        self._evaluate(self._all_watches())
+
+    def _on_properties_changed(self, message, arguments: Tuple):
+        """Called on the dispatch worker, with the changes of any service"""
+        if self._check_owner and (
+            self._owner is None or message.get_sender() != self._owner
+        ):
+            return
+        _interface, changed, invalidated = arguments
+        self._dispatcher.handoff.call(self._on_changed, changed, invalidated)
+
+    def _on_owner_changed(self, message, arguments: Tuple):
+        _name, _old_owner, new_owner = arguments
+        self._owner = new_owner or None
+        self._start_bootstrap(replace=True)
+
+    def _on_dropped(self):
+        self._dispatcher.handoff.call(self._resync)
+
+    def _resync(self):
+        """Reads the values again, with at most one GetAll at a time"""
+        if self._resyncing:
+            self._resync_again = True
+            return
+        self._resyncing = True
+        self._start_bootstrap(replace=True)
+
+    def _on_changed(self, changed: Dict[str, object], invalidated: List[str]):
+        self.values.update(changed)
+        for name in invalidated:
+            self.values.pop(name, None)
+
+        names = set(changed) | set(invalidated) | {None}
+        # A watch can be registered under several of the names
+        watches = {w: None for name in names for w in self._watches.get(name, ())}
+        self._evaluate(list(watches))
+
+    def _all_watches(self) -> List[PropertyWatch]:
+        return list({w: None for ws in self._watches.values() for w in ws})
+
+    def _evaluate(self, watches: List[PropertyWatch]):
+        for watch in watches:
+            if watch not in self._watches.get(watch.expression.name, ()):
+                # Removed by the callback of an earlier watch
+                continue
+            state = watch.expression(self.values)
+            if state == watch.last and not (watch.updates and state == watch.target):
+                continue
+            watch.last = state
+            if state == watch.target:
+                watch.callback(
+                    Context(
+                        watch.context,
+                        {f"prop_{name}": v for name, v in self.values.items()},
+                    )
+                )
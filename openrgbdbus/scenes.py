@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from typing import Dict, List
+
+from .backends import DeviceInfo
+from .utils import lazy_import
+
+np = lazy_import("numpy")
+
+SCENE_EXTENSION = ".npz"
+
+
+def default_scene_directory() -> str:
+    """Where scenes are saved, in the user's data directory"""
+    data = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(data, "openrgb-dbus-connector", "scenes")
+
+
+def _topology_key(device: dict) -> tuple:
+    return (
+        device["name"],
+        device["type"],
+        tuple((zone["name"], zone["leds"]) for zone in device["zones"]),
+    )
+
+
+class Scene:
+    """The colors of every device at one moment
+
+       The colors of all devices are kept in a single (LEDs x 3) uint8 array, along
+       with the topology of the devices. A scene is restored onto the devices with
+       the same topology, whatever ids they have by then, in a single write each.
+    """
+
+    def __init__(self, name: str, devices: List[dict], colors: np.ndarray):
+        self.name = name
+        # As in `DeviceInfo.to_dict`
+        self.devices = devices
+        self.colors = colors
+        self._offsets = np.cumsum(
+            [0] + [sum(zone["leds"] for zone in d["zones"]) for d in devices]
+        )
+
+    @classmethod
+    def capture(cls, name: str, devices: List[DeviceInfo], frames: List[np.ndarray]):
+        """A scene of the frames of the devices, as composited by the ActionStack"""
+        colors = np.concatenate(frames) if frames else np.zeros((0, 3), np.uint8)
+        return Scene(name, [device.to_dict() for device in devices], colors)
+
+    def device_colors(self, devices: List[DeviceInfo]) -> Dict[int, np.ndarray]:
+        """The colors of the scene for each of these devices that it holds, by id"""
+        keys = {_topology_key(d): index for index, d in enumerate(self.devices)}
+        colors = {}
+        for device_id, device in enumerate(devices):
+            index = keys.get(_topology_key(device.to_dict()))
+            if index is not None:
+                start, end = self._offsets[index], self._offsets[index + 1]
+                colors[device_id] = self.colors[start:end]
+        return colors
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                name=np.array(self.name),
+                devices=np.array(json.dumps(self.devices)),
+                colors=self.colors,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "Scene":
+        with np.load(path) as data:
+            return Scene(
+                str(data["name"]),
+                json.loads(str(data["devices"])),
+                data["colors"].astype(np.uint8).reshape(-1, 3),
+            )
+
+
+class SceneStore:
+    """The scenes in a directory, one file per scene, by name
+
+       Scenes are read once and then kept in memory.
+    """
+
+    _stores: Dict[str, "SceneStore"] = {}
+
+    @classmethod
+    def get(cls, directory: str = None) -> "SceneStore":
+        """The store of the directory, shared by the actions and the control socket"""
+        directory = directory or default_scene_directory()
+        if directory not in cls._stores:
+            cls._stores[directory] = SceneStore(directory)
+        return cls._stores[directory]
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or default_scene_directory()
+        self._scenes: Dict[str, Scene] = {}
+
+    def path(self, name: str) -> str:
+        if not re.fullmatch(r"[\w.-]+", name) or name.startswith("."):
+            raise Exception("Invalid scene name: '{}'".format(name))
+        return os.path.join(self.directory, name + SCENE_EXTENSION)
+
+    def names(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            file[: -len(SCENE_EXTENSION)]
+            for file in os.listdir(self.directory)
+            if file.endswith(SCENE_EXTENSION)
+        )
+
+    def load(self, name: str) -> Scene:
+        if name not in self._scenes:
+            path = self.path(name)
+            if not os.path.exists(path):
+                raise Exception("Unknown scene: '{}'".format(name))
+            self._scenes[name] = Scene.load(path)
+        return self._scenes[name]
+
+    def save(self, scene: Scene):
+        scene.save(self.path(scene.name))
+        self._scenes[scene.name] = scene
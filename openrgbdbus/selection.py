@@ -0,0 +1,209 @@
+import fnmatch
+import logging
+import re
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Union
+
+from .backends import DeviceInfo
+
+
+class LedRanges:
+    """A set of LEDs, stored as sorted and non-overlapping [start, end) runs"""
+
+    def __init__(self, runs: Iterable[Tuple[int, int]] = ()):
+        merged = []
+        for start, end in sorted(runs):
+            if end <= start:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        self.runs: Tuple[Tuple[int, int], ...] = tuple(merged)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return iter(self.runs)
+
+    def __len__(self):
+        """The number of LEDs in the set"""
+        return sum(end - start for start, end in self.runs)
+
+    def shift(self, offset: int, limit: int) -> "LedRanges":
+        """The LEDs moved by `offset`, without those beyond `offset + limit`"""
+        return LedRanges(
+            (offset + start, offset + min(end, limit))
+            for start, end in self.runs
+            if start < limit
+        )
+
+    def covers(self, start: int, end: int) -> bool:
+        return any(first <= start and end <= last for first, last in self.runs)
+
+    def __repr__(self):
+        return f"LedRanges({list(self.runs)!r})"
+
+
+# The zones (by id) or LEDs that a selector picked on every device (by id) it matched
+Targets = Dict[int, Union[Tuple[int, ...], LedRanges]]
+
+
+class NamePattern:
+    """Matches a device or zone name
+
+       Patterns starting with 're:' are regular expressions that only have to match
+       part of the name. Anything else is a glob (e.g. 'Corsair*') that has to match
+       the entire name, which also means that a plain name is matched exactly.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        if pattern.startswith("re:"):
+            self._regex = re.compile(pattern[len("re:") :])
+        else:
+            self._regex = re.compile(fnmatch.translate(pattern))
+
+    def matches(self, name: str) -> bool:
+        if self.pattern.startswith("re:"):
+            return self._regex.search(name) is not None
+        return self._regex.match(name) is not None
+
+    def __repr__(self):
+        return f"NamePattern({self.pattern!r})"
+
+
+class DeviceSelector:
+    """Selects zones or LEDs of devices by id, name (pattern) and/or type
+
+       A selector without any device criteria matches every device. Zones are given
+       by index or name pattern; without any, all zones of a device are selected.
+       LEDs are indices within each of the selected zones, or within the device if
+       no zones were given.
+    """
+
+    def __init__(
+        self,
+        device_id: int = None,
+        name: str = None,
+        device_type=None,
+        zones: List[Union[int, str]] = None,
+        leds: Union[LedRanges, List[int]] = None,
+    ):
+        self.device_id = device_id
+        self.name = NamePattern(name) if name is not None else None
+        self.device_type = device_type
+        self.zones = None
+        if zones is not None:
+            self.zones = [
+                zone if isinstance(zone, int) else NamePattern(zone) for zone in zones
+            ]
+        if leds is not None and not isinstance(leds, LedRanges):
+            leds = LedRanges((led, led + 1) for led in leds)
+        self.leds = leds
+
+    def matches(self, device_id: int, device: DeviceInfo) -> bool:
+        """Whether the device meets the device criteria, regardless of its zones"""
+        if self.device_id is not None and self.device_id != device_id:
+            return False
+        if self.device_type is not None and self.device_type != device.type:
+            return False
+        return self.name is None or self.name.matches(device.name)
+
+    def select(self, device_id: int, device: DeviceInfo) -> Tuple[int, ...]:
+        """The ids of the device's zones that this selector picks (none if no match)"""
+        if not self.matches(device_id, device):
+            return ()
+
+        if self.zones is None:
+            return tuple(range(len(device.zones)))
+
+        zone_ids = []
+        for zone in self.zones:
+            if isinstance(zone, int):
+                if zone < len(device.zones):
+                    zone_ids.append(zone)
+                else:
+                    logging.warning(
+                        "Device '%s' has no zone %d, ignoring it", device.name, zone
+                    )
+                continue
+            zone_ids += [
+                zone_id
+                for zone_id, zone_info in enumerate(device.zones)
+                if zone.matches(zone_info.name)
+            ]
+        return tuple(sorted(set(zone_ids)))
+
+    def select_leds(self, device: DeviceInfo, zone_ids: Tuple[int, ...]) -> LedRanges:
+        """The LEDs of the device that this selector picks, given the selected zones"""
+        if self.zones is None:
+            return self.leds.shift(0, device.led_count)
+
+        runs = []
+        for zone_id in zone_ids:
+            zone = device.zones[zone_id]
+            runs += self.leds.shift(zone.offset, zone.count).runs
+        return LedRanges(runs)
+
+    def __repr__(self):
+        return (
+            f"DeviceSelector(device_id={self.device_id!r}, name={self.name!r}, "
+            f"device_type={self.device_type!r}, zones={self.zones!r}, "
+            f"leds={self.leds!r})"
+        )
+
+
+class SelectorIndex:
+    """The resolved targets of every known selector
+
+       Selectors are matched once, when they are added or when the devices change,
+       so that looking up their targets is a dictionary access. When the device list
+       changes, only the devices that changed are matched again.
+    """
+
+    def __init__(self):
+        self.devices: List[DeviceInfo] = []
+        self._targets: Dict[DeviceSelector, Targets] = {}
+
+    def add(self, *selectors: DeviceSelector):
+        for selector in selectors:
+            if selector not in self._targets:
+                device_ids = range(len(self.devices))
+                self._targets[selector] = self._resolve(selector, device_ids)
+
+    def targets(self, selector: DeviceSelector) -> Targets:
+        if selector not in self._targets:
+            # Selectors should be added up front, but this keeps unknown ones working
+            self.add(selector)
+        return self._targets[selector]
+
+    def update(self, devices: List[DeviceInfo]) -> Set[int]:
+        """Takes over the new device list, and returns the ids of the changed devices"""
+        previous, self.devices = self.devices, devices
+        changed = {
+            device_id
+            for device_id in range(max(len(previous), len(devices)))
+            if device_id >= len(previous)
+            or device_id >= len(devices)
+            or previous[device_id].topology() != devices[device_id].topology()
+        }
+
+        if changed:
+            for selector, targets in self._targets.items():
+                for device_id in changed:
+                    targets.pop(device_id, None)
+                targets.update(self._resolve(selector, changed))
+        return changed
+
+    def _resolve(self, selector: DeviceSelector, device_ids) -> Targets:
+        targets = {}
+        for device_id in sorted(device_ids):
+            if device_id >= len(self.devices):
+                continue
+            device = self.devices[device_id]
+            zone_ids = selector.select(device_id, device)
+            if zone_ids and selector.leds is not None:
+                leds = selector.select_leds(device, zone_ids)
+                if leds:
+                    targets[device_id] = leds
+            elif zone_ids:
+                targets[device_id] = zone_ids
+        return targets
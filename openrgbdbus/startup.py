@@ -0,0 +1,48 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+
+class StartupProfile:
+    """Records how long each phase of the startup takes, and on which thread
+
+       Phases can overlap, e.g. when the output connects while the hooks attach.
+       All times are relative to `start`, a `time.perf_counter()` value.
+    """
+
+    def __init__(self, start: float = None):
+        self.start = time.perf_counter() if start is None else start
+        # (name, thread, start, end)
+        self.phases: List[Tuple[str, str, float, float]] = []
+        self.info: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+    def record(self, name: str, start: float, end: float = None):
+        end = time.perf_counter() if end is None else end
+        with self._lock:
+            self.phases.append((name, threading.current_thread().name, start, end))
+
+    def report(self, file=sys.stderr):
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[2])
+
+        print("Startup profile (milliseconds since launch):", file=file)
+        print(f"  {'phase':<20} {'thread':<16} {'start':>8} {'took':>8}", file=file)
+        for name, thread, start, end in phases:
+            print(
+                f"  {name:<20} {thread:<16}"
+                f" {(start - self.start) * 1000:>8.1f} {(end - start) * 1000:>8.1f}",
+                file=file,
+            )
+        for name, value in self.info.items():
+            print(f"  {name}: {value}", file=file)
@@ -0,0 +1,482 @@
+import asyncio
+import ctypes
+import glob
+import logging
+import os
+import struct
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from .selection import NamePattern
+
+# Undoes a registration with the `SystemPoller`
+Cancel = Callable[[], None]
+
+# Sysfs attributes and /proc/loadavg are far smaller than this
+READ_SIZE = 4096
+
+# From inotify(7). Files are reported when they are created (also as a symlink),
+# again once they are written, and when they are replaced or deleted.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# Hwmon reports e.g. temperatures in millidegrees Celsius and power in microwatts
+HWMON_SCALES = {
+    "temp": 1000,
+    "in": 1000,
+    "curr": 1000,
+    "humidity": 1000,
+    "power": 1000000,
+    "energy": 1000000,
+}
+
+
+def hwmon_scale(sensor: str) -> int:
+    """What the value of a hwmon sensor (e.g. 'temp1') is divided by to get °C, V, W"""
+    return HWMON_SCALES.get(sensor.rstrip("0123456789"), 1)
+
+
+def find_hwmon_sensor(chip: str, sensor: str) -> str:
+    """The input file of a hwmon sensor, found by the (pattern of the) chip's name
+
+       The hwmonN directories are numbered in the order the drivers loaded, which can
+       change between boots, so chips are looked up by name, e.g. 'k10temp'.
+    """
+    pattern = NamePattern(chip)
+    for directory in sorted(glob.glob("/sys/class/hwmon/hwmon*")):
+        try:
+            with open(os.path.join(directory, "name")) as name_file:
+                name = name_file.read().strip()
+        except OSError:
+            continue
+        path = os.path.join(directory, f"{sensor}_input")
+        if pattern.matches(name) and os.path.exists(path):
+            return path
+    raise Exception("Hwmon chip '{}' has no sensor '{}'".format(chip, sensor))
+
+
+class PolledFile:
+    """A file that is kept open and is read from the start into the same buffer
+
+       The file is opened when it is first read, so it does not have to exist yet.
+       When its path leads to another file, e.g. after it was atomically replaced,
+       `check` closes it so that the next read opens the new one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd: Optional[int] = None
+        self._buffer = bytearray(READ_SIZE)
+        self._view = memoryview(self._buffer)
+
+    def read(self) -> str:
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+        size = os.preadv(self.fd, [self._buffer], 0)
+        return str(self._view[:size], "utf-8", "replace")
+
+    def check(self):
+        """Closes the file if its path now leads to another file, or to none"""
+        if self.fd is None:
+            return
+        try:
+            current = os.stat(self.path)
+        except OSError:
+            current = None
+        if current is None or not os.path.samestat(current, os.fstat(self.fd)):
+            self.close()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class PollGroup:
+    """Everything that is polled at the same interval, handled in a single wakeup"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float):
+        self.loop = loop
+        self.interval = interval
+        self.callbacks: Set[Callable[[], None]] = set()
+        self._timer: asyncio.TimerHandle = None
+        self._deadline = 0.0
+
+    def add(self, callback: Callable[[], None]):
+        self.callbacks.add(callback)
+        if self._timer is None:
+            self._deadline = self.loop.time()
+            self._timer = self.loop.call_soon(self._tick)
+
+    def remove(self, callback: Callable[[], None]):
+        self.callbacks.discard(callback)
+        if not self.callbacks and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _tick(self):
+        for callback in list(self.callbacks):
+            callback()
+        if not self.callbacks:
+            return
+
+        # Skip the ticks that were missed instead of catching up with a burst
+        self._deadline = max(self._deadline + self.interval, self.loop.time())
+        self._timer = self.loop.call_at(self._deadline, self._tick)
+
+
+class FileSampler:
+    """Reads one file once per tick, and hands its contents to every listener
+
+       The contents are None when the file could not be opened or read.
+    """
+
+    def __init__(self, path: str):
+        self.file = PolledFile(path)
+        self.listeners: Set[Callable[[Optional[str]], None]] = set()
+
+    def __call__(self):
+        try:
+            text = self.file.read()
+        except OSError as ex:
+            logging.debug("Could not read %s: %s", self.file.path, ex)
+            text = None
+        for listener in list(self.listeners):
+            listener(text)
+
+
+class StatWatch:
+    """Reports changes to a file by comparing its metadata every tick
+
+       Used where inotify is not available, or the file's directory does not exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.listeners: Set[Callable[[], None]] = set()
+        self._signature = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def __call__(self):
+        signature = self._stat()
+        if signature != self._signature:
+            self._signature = signature
+            for listener in list(self.listeners):
+                listener()
+
+
+class Inotify:
+    """Reports changes to files through inotify(7), on the event loop
+
+       The directories of the files are watched, so that files can also be created,
+       replaced and deleted. Multiple events for a file in one read are reported once.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "Could not initialize inotify")
+        self._directories: Dict[int, str] = {}
+        self._descriptors: Dict[str, int] = {}
+        self.listeners: Dict[str, Set[Callable[[], None]]] = {}
+        loop.add_reader(self.fd, self._on_readable)
+
+    def watch(self, path: str, listener: Callable[[], None]):
+        directory = os.path.dirname(path)
+        if directory not in self._descriptors:
+            descriptor = self._libc.inotify_add_watch(
+                self.fd, os.fsencode(directory), INOTIFY_MASK
+            )
+            if descriptor < 0:
+                raise OSError(ctypes.get_errno(), "Could not watch", directory)
+            self._descriptors[directory] = descriptor
+            self._directories[descriptor] = directory
+        self.listeners.setdefault(path, set()).add(listener)
+
+    def unwatch(self, path: str, listener: Callable[[], None]):
+        listeners = self.listeners.get(path, set())
+        listeners.discard(listener)
+        if not listeners:
+            self.listeners.pop(path, None)
+
+        directory = os.path.dirname(path)
+        if not any(os.path.dirname(other) == directory for other in self.listeners):
+            descriptor = self._descriptors.pop(directory, None)
+            if descriptor is not None:
+                self._directories.pop(descriptor, None)
+                self._libc.inotify_rm_watch(self.fd, descriptor)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            descriptor, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if descriptor in self._directories and name:
+                changed.add(
+                    os.path.join(self._directories[descriptor], os.fsdecode(name))
+                )
+
+        for path in changed:
+            for listener in list(self.listeners.get(path, ())):
+                listener()
+
+
+class ProcessTable:
+    """The names of the running processes, updated with one scan of /proc per tick
+
+       Only processes that are new since the previous scan have their name read, and
+       listeners are only called when the processes that match their pattern change.
+       Processes that match a pattern are also watched through a pidfd (Linux 5.3),
+       so that their exit is reported right away instead of at the next scan. Names
+       are those in /proc/<pid>/comm, which are cut off after 15 characters.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.scanned = False
+        self.names: Dict[int, str] = {}
+        # pattern -> (compiled pattern, matching pids, listeners)
+        self.patterns: Dict[str, Tuple[NamePattern, Set[int], Set[Callable]]] = {}
+        self._pidfds: Dict[int, int] = {}
+        # Reported through their pidfd, but still listed in /proc until reaped
+        self._exited: Set[int] = set()
+
+    def add(self, pattern: str, listener: Callable[[Set[int]], None]):
+        if pattern not in self.patterns:
+            compiled = NamePattern(pattern)
+            pids = {pid for pid, name in self.names.items() if compiled.matches(name)}
+            self.patterns[pattern] = (compiled, pids, set())
+            for pid in pids:
+                self._watch_exit(pid)
+        _, pids, listeners = self.patterns[pattern]
+        listeners.add(listener)
+        if self.scanned:
+            self.loop.call_soon(listener, set(pids))
+
+    def remove(self, pattern: str, listener: Callable[[Set[int]], None]):
+        _, pids, listeners = self.patterns[pattern]
+        listeners.discard(listener)
+        if not listeners:
+            del self.patterns[pattern]
+            for pid in pids:
+                if not any(pid in other for _, other, _ in self.patterns.values()):
+                    self._unwatch_exit(pid)
+
+    def __call__(self):
+        running = {int(e.name) for e in os.scandir("/proc") if e.name.isdigit()}
+        self._exited &= running
+        running -= self._exited
+        exited = self.names.keys() - running
+        started = {}
+        for pid in running - self.names.keys():
+            try:
+                with open(f"/proc/{pid}/comm") as comm:
+                    started[pid] = comm.read().rstrip("\n")
+            except OSError:
+                # Exited in the meantime
+                pass
+
+        for pid in exited:
+            del self.names[pid]
+        self.names.update(started)
+
+        first_scan, self.scanned = not self.scanned, True
+        for pattern, (compiled, pids, listeners) in list(self.patterns.items()):
+            gone = pids & exited
+            new = {pid for pid, name in started.items() if compiled.matches(name)}
+            if gone or new or first_scan:
+                pids -= gone
+                pids |= new
+                self._notify(pattern)
+        for pid in exited:
+            self._unwatch_exit(pid)
+
+    def _notify(self, pattern: str):
+        _, pids, listeners = self.patterns[pattern]
+        for pid in pids:
+            self._watch_exit(pid)
+        for listener in list(listeners):
+            listener(set(pids))
+
+    def _watch_exit(self, pid: int):
+        if pid in self._pidfds or not hasattr(os, "pidfd_open"):
+            return
+        try:
+            pidfd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            self.loop.call_soon(self._on_exit, pid)
+            return
+        except OSError:
+            # Not supported by the kernel, the next scan notices the exit instead
+            return
+        self._pidfds[pid] = pidfd
+        self.loop.add_reader(pidfd, self._on_exit, pid)
+
+    def _unwatch_exit(self, pid: int):
+        pidfd = self._pidfds.pop(pid, None)
+        if pidfd is not None:
+            self.loop.remove_reader(pidfd)
+            os.close(pidfd)
+
+    def _on_exit(self, pid: int):
+        self._unwatch_exit(pid)
+        self._exited.add(pid)
+        self.names.pop(pid, None)
+        for pattern, (_, pids, _) in list(self.patterns.items()):
+            if pid in pids:
+                pids.discard(pid)
+                self._notify(pattern)
+
+
+class SystemPoller:
+    """Watches local system state for all system triggers, on the event loop
+
+       There is one poller per event loop, however many triggers use it. Files stay
+       open and are read once per tick however many triggers read them, everything
+       with the same interval is handled in the same wakeup, and inotify and pidfds
+       replace polling where the kernel supports them.
+    """
+
+    _pollers: Dict[asyncio.AbstractEventLoop, "SystemPoller"] = {}
+
+    @classmethod
+    def get(cls) -> "SystemPoller":
+        loop = asyncio.get_event_loop()
+        if loop not in cls._pollers:
+            cls._pollers[loop] = SystemPoller(loop)
+        return cls._pollers[loop]
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._groups: Dict[float, PollGroup] = {}
+        # Shared by everything with the same path and/or interval, with their Cancel
+        self._samplers: Dict[Tuple[str, float], Tuple[FileSampler, Cancel]] = {}
+        self._stat_watches: Dict[Tuple[str, float], Tuple[StatWatch, Cancel]] = {}
+        self._process_tables: Dict[float, Tuple[ProcessTable, Cancel]] = {}
+        self._inotify: Inotify = None
+        self._inotify_failed = False
+
+    def every(self, interval: float, callback: Callable[[], None]) -> Cancel:
+        """Calls `callback` every `interval` seconds, starting right away"""
+        if interval not in self._groups:
+            self._groups[interval] = PollGroup(self.loop, interval)
+        group = self._groups[interval]
+        group.add(callback)
+
+        def cancel():
+            group.remove(callback)
+            if not group.callbacks:
+                self._groups.pop(interval, None)
+
+        return cancel
+
+    def sample(
+        self, path: str, interval: float, listener: Callable[[Optional[str]], None]
+    ) -> Cancel:
+        """Calls `listener` with the contents of the file every `interval` seconds
+
+           The file is reopened when it is created, replaced or deleted.
+        """
+        key = (path, interval)
+        if key not in self._samplers:
+            sampler = FileSampler(path)
+            stop_watching = self.watch_file(path, interval, sampler.file.check)
+            stop_sampling = self.every(interval, sampler)
+
+            def stop_sampler():
+                stop_sampling()
+                stop_watching()
+
+            self._samplers[key] = (sampler, stop_sampler)
+        sampler, stop = self._samplers[key]
+        sampler.listeners.add(listener)
+
+        def cancel():
+            sampler.listeners.discard(listener)
+            if not sampler.listeners:
+                del self._samplers[key]
+                stop()
+                sampler.file.close()
+
+        return cancel
+
+    def watch_processes(
+        self, pattern: str, interval: float, listener: Callable[[Set[int]], None]
+    ) -> Cancel:
+        """Calls `listener` with the pids of the processes whose name matches, when
+           they change. New processes are found every `interval` seconds.
+        """
+        if interval not in self._process_tables:
+            table = ProcessTable(self.loop)
+            self._process_tables[interval] = (table, self.every(interval, table))
+        table, stop = self._process_tables[interval]
+        table.add(pattern, listener)
+
+        def cancel():
+            table.remove(pattern, listener)
+            if not table.patterns:
+                del self._process_tables[interval]
+                stop()
+
+        return cancel
+
+    def watch_file(
+        self, path: str, interval: float, listener: Callable[[], None]
+    ) -> Cancel:
+        """Calls `listener` when the file is created, written, replaced or deleted
+
+           Without inotify, or if its directory does not exist yet, the file is
+           checked every `interval` seconds instead.
+        """
+        path = os.path.abspath(path)
+        inotify = self._get_inotify()
+        if inotify:
+            try:
+                inotify.watch(path, listener)
+                return lambda: inotify.unwatch(path, listener)
+            except OSError as ex:
+                logging.info("Polling %s, as it cannot be watched: %s", path, ex)
+
+        key = (path, interval)
+        if key not in self._stat_watches:
+            watch = StatWatch(path)
+            self._stat_watches[key] = (watch, self.every(interval, watch))
+        watch, stop = self._stat_watches[key]
+        watch.listeners.add(listener)
+
+        def cancel():
+            watch.listeners.discard(listener)
+            if not watch.listeners:
+                del self._stat_watches[key]
+                stop()
+
+        return cancel
+
+    def _get_inotify(self) -> Optional[Inotify]:
+        if self._inotify is None and not self._inotify_failed:
+            try:
+                self._inotify = Inotify(self.loop)
+            except (OSError, AttributeError) as ex:
+                logging.info("Polling files, as inotify is not available: %s", ex)
+                self._inotify_failed = True
+        return self._inotify
@@ -0,0 +1,201 @@
+import base64
+import gzip
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict
+
+from gi.repository import Gio
+
+TRACE_FORMAT = "openrgbdbus-trace"
+TRACE_VERSION = 1
+
+
+def _open_trace(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t")
+    return open(path, mode)
+
+
+class TraceRecorder:
+    """Records every incoming message of one or more buses into a trace file
+
+       The trace is line-delimited JSON. The first line is a header, every other
+       line holds the monotonic time (relative to the start of the recording), the
+       name of the bus and the full serialized message, headers included. Paths
+       ending in '.gz' are compressed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = _open_trace(path, "w")
+        self._file.write(
+            json.dumps({"format": TRACE_FORMAT, "version": TRACE_VERSION}) + "\n"
+        )
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._filters = []
+        self.count = 0
+
+    def attach(self, bus, bus_name: str):
+        """Starts recording the messages that reach the filters of the bus"""
+
+        def filter(conn, message, incoming):
+            if incoming:
+                self.record(bus_name, message)
+            return message
+
+        self._filters.append((bus, bus.con.add_filter(filter)))
+
+    def record(self, bus_name: str, message):
+        timestamp = time.monotonic() - self._start
+        try:
+            blob = message.to_blob(Gio.DBusCapabilityFlags.NONE)
+        except Exception as ex:
+            # E.g. messages carrying file descriptors
+            logging.debug("Not recording message: %s", ex)
+            return
+
+        line = json.dumps(
+            {
+                "t": round(timestamp, 6),
+                "bus": bus_name,
+                "blob": base64.b64encode(blob).decode("ascii"),
+            },
+            separators=(",", ":"),
+        )
+        with self._lock:
+            if self._file:
+                self._file.write(line + "\n")
+                self.count += 1
+
+    def close(self):
+        for bus, _filter in self._filters:
+            bus.con.remove_filter(_filter)
+        self._filters = []
+
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+        logging.info("Recorded %d messages to '%s'", self.count, self.path)
+
+
+class _ReplayProxy:
+    """Stands in for the proxy objects of a live bus"""
+
+    def __init__(self, service: str):
+        self._service = service
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            if name not in ("AddMatch", "RemoveMatch"):
+                logging.warning(
+                    "Calling '%s.%s' is not possible while replaying a trace",
+                    self._service,
+                    name,
+                )
+            return None
+
+        return method
+
+
+class _ReplayConnection:
+    def __init__(self):
+        self._filters: Dict[int, Callable] = {}
+        self._next_id = 1
+
+    def add_filter(self, filter: Callable) -> int:
+        filter_id = self._next_id
+        self._next_id += 1
+        self._filters[filter_id] = filter
+        return filter_id
+
+    def remove_filter(self, filter_id: int):
+        self._filters.pop(filter_id, None)
+
+    def dispatch(self, message):
+        for filter in list(self._filters.values()):
+            filter(self, message, True)
+
+
+class ReplayBus:
+    """A bus without a connection: its filters only receive replayed messages"""
+
+    # Replays have to be reproducible, so their messages are never dropped
+    lossless = True
+    # The senders of replayed messages are the unique names of the recording. As
+    # nothing owns a name while replaying, they cannot be checked against owners.
+    tracks_owners = False
+
+    def __init__(self):
+        self.con = _ReplayConnection()
+
+    def get(self, service: str, path: str = None):
+        return _ReplayProxy(service)
+
+
+class TraceReplayer:
+    """Feeds a recorded trace into the filters of `ReplayBus`es
+
+       :param speed: how fast to replay the trace relative to the recording. `0`
+                     replays it as fast as possible.
+    """
+
+    def __init__(self, path: str, speed: float = 1):
+        self.path = path
+        self.speed = speed
+        self.buses: Dict[str, ReplayBus] = {}
+        self.count = 0
+        self.elapsed = None
+        self._thread = None
+
+    def bus(self, bus_name: str) -> ReplayBus:
+        return self.buses.setdefault(bus_name.lower(), ReplayBus())
+
+    def start(self, on_done: Callable[[], None] = None):
+        """Replays the trace on a separate thread, just like GDBus calls its filters"""
+
+        def run():
+            try:
+                self.replay()
+            except Exception as ex:
+                logging.critical("Unhandled exception while replaying: ", exc_info=ex)
+            if on_done:
+                on_done()
+
+        self._thread = threading.Thread(target=run, name="trace-replay", daemon=True)
+        self._thread.start()
+
+    def replay(self):
+        with _open_trace(self.path, "r") as f:
+            header = json.loads(f.readline())
+            if header.get("format") != TRACE_FORMAT:
+                raise Exception(f"'{self.path}' is not a trace file")
+            if header.get("version", 0) > TRACE_VERSION:
+                raise Exception(f"Unsupported trace version {header['version']}")
+
+            start = time.monotonic()
+            for line in f:
+                record = json.loads(line)
+                if self.speed:
+                    delay = start + record["t"] / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                bus = self.buses.get(record["bus"])
+                if not bus:
+                    continue
+                message = Gio.DBusMessage.new_from_blob(
+                    base64.b64decode(record["blob"]), Gio.DBusCapabilityFlags.NONE
+                )
+                bus.con.dispatch(message)
+                self.count += 1
+
+        self.elapsed = time.monotonic() - start
+        logging.info(
+            "Replayed %d messages in %.3f seconds",
+            self.count,
+            self.elapsed,
+        )
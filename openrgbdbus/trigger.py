@@ -1,45 +1,112 @@
 import abc
 import asyncio
+import copy
 import logging
+import os
+import time
 from string import Template
-from typing import Callable, List, Union
+from typing import Callable, Dict, List, Set, Tuple, Union
 
 from pydbus.bus import Bus
 from pydbus.subscription import Subscription
 
-from .utils import Context, substitute_all
+from .conditions import AllCondition, Condition
+from .dispatch import BusDispatcher, Handoff, SignalMatch
+from .expressions import OPERATORS, Comparison, compile_comparison, parse_literal
+from .properties import PropertyMirror, PropertyWatch
+from .system import SystemPoller, find_hwmon_sensor, hwmon_scale
+from .utils import Context, EventContext, substitute_all
 
 TriggerCallback = Callable[[Context], None]
 
+# The headers of a signal in the context of its events, with their getters
+SIGNAL_HEADERS = {
+    "sig_sender": "get_sender",
+    "sig_path": "get_path",
+    "sig_interface": "get_interface",
+    "sig_name": "get_member",
+    "sig_destination": "get_destination",
+}
+
+
+class TriggerCondition(Condition):
+    """Calls a D-Bus method and compares its response, e.g. `response: 20, operator: <`
+
+       String responses from the configuration are parsed like the values in property
+       expressions, so that they can be compared with numbers and booleans as well.
+       Methods that return a string are compared with the text itself, also when the
+       response is not a string, e.g. `response: 1` matches "1". With `cache`,
+       the response is reused for that many seconds instead of calling the method.
+    """
+
+    # A blocking D-Bus call is far more expensive than anything else a condition does
+    estimated_cost = 1e-3
 
-class TriggerCondition:
     def __init__(
         self,
         service: str,
         path: str,
         method: str,
-        response: str,
+        response,
         # interface: str = None,
         arguments: [] = [],
+        operator: str = "==",
+        cache: float = None,
     ):
+        super().__init__()
         self.service = Template(service)
         self.path = Template(path)
         # self.interface = Template(interface)
         self.method = Template(method)
-        self.response = Template(response)
-        # self.response = [Template(x) for x in response]
         self.arguments = [Template(x) for x in arguments]
+        if operator not in OPERATORS:
+            raise Exception("Unknown operator: '{}'".format(operator))
+        self.operator = operator
+        self.cache = cache
+        self._responses: Dict[Tuple, Tuple[float, object]] = {}
+
+        if isinstance(response, str) and "$" in response:
+            # Depends on the context, so it can only be compiled once it is known
+            self.response = Template(response)
+            self._compare = None
+        else:
+            self.response = response
+            self._compare = self._compile(response)
+
+    def _compile(self, response) -> Callable[[object], bool]:
+        if isinstance(response, str):
+            value = parse_literal(response)
+            text = value if isinstance(value, str) else response
+        else:
+            value, text = response, str(response)
+        compare_typed = compile_comparison(self.operator, value)
+        compare_text = compile_comparison(self.operator, text)
+        return lambda result: (
+            compare_text(result) if isinstance(result, str) else compare_typed(result)
+        )
 
-    def evaluate(self, bus: Bus, context: Context) -> bool:
-        service, path, method, expected_response, arguments = substitute_all(
-            [self.service, self.path, self.method, self.response, self.arguments,],
-            parameters=context,
+    def _evaluate(self, bus: Bus, context: Context) -> bool:
+        service, path, method, arguments = substitute_all(
+            [self.service, self.path, self.method, self.arguments], parameters=context,
         )
+        compare = self._compare or self._compile(
+            substitute_all(self.response, parameters=context)
+        )
+        return compare(self._call(bus, service, path, method, arguments))
+
+    def _call(self, bus: Bus, service: str, path: str, method: str, arguments: List):
+        if self.cache is None:
+            return getattr(bus.get(service, path), method)(*arguments)
 
-        dev = bus.get(service, path)
-        func = getattr(dev, method)
-        result = func(*arguments)
-        return result == expected_response
+        key = (service, path, method, tuple(arguments))
+        now = time.monotonic()
+        if key in self._responses and now - self._responses[key][0] < self.cache:
+            self.cache_hits += 1
+            return self._responses[key][1]
+
+        result = getattr(bus.get(service, path), method)(*arguments)
+        self._responses[key] = (now, result)
+        return result
 
 
 class TriggerSubscription:
@@ -52,6 +119,9 @@ class TriggerSubscription:
 
 
 class TriggerSource(metaclass=abc.ABCMeta):
+    # The parameters of its events that are used once it triggers. `None` keeps all.
+    fields: Set[str] = None
+
     def __init__(self):
         super().__init__()
 
@@ -61,28 +131,44 @@ class TriggerSource(metaclass=abc.ABCMeta):
     ) -> TriggerSubscription:
         pass
 
+    def inverse(self) -> "TriggerSource":
+        """The source that ends what this source started, if there is no 'until'"""
+        raise Exception("'until' is required for this trigger")
+
 
 class Trigger:
     def __init__(
-        self, source: TriggerSource, conditions: List[TriggerCondition] = [],
+        self, source: TriggerSource, conditions: List[Condition] = [],
     ):
         self.source = source
         self.conditions = conditions
+        self.condition = AllCondition(conditions)
 
     def evaluate_conditions(self, bus: Bus, context: Context) -> bool:
-        return all(condition.evaluate(bus, context) for condition in self.conditions)
+        return self.condition.evaluate(bus, context)
 
     def subscribe(
         self, bus: Bus, context: Context, callback: TriggerCallback
     ) -> TriggerSubscription:
-        def callback_wrapper(*args, **kwargs):
+        """Calls `callback` on the event loop when the source triggers
+
+           The conditions are evaluated on the dispatch worker of the bus, as they
+           can make blocking D-Bus calls. Signal triggers already call back on it.
+        """
+        handoff = Handoff.get()
+        dispatcher = BusDispatcher.get(bus) if self.conditions else None
+
+        def callback_wrapper(context: Context):
+            if dispatcher and not dispatcher.on_worker():
+                dispatcher.submit(callback_wrapper, context)
+                return
 
             try:
-                if self.evaluate_conditions(bus, args[0]):
-                    callback(*args, **kwargs)
+                if self.evaluate_conditions(bus, context):
+                    handoff.call(callback, context)
             except Exception as ex:
                 logging.critical("Unhandled exception in callback task: ", exc_info=ex)
-                exit(1)
+                handoff.call(exit, 1)
 
         return self.source.subscribe(bus, context, callback_wrapper)
 
@@ -122,39 +208,31 @@ class DBusTrigger(TriggerSource):
             self.sub_params["eavesdrop"] = str(eavesdrop).lower()
         self.arguments = [Template(x) if isinstance(x, str) else x for x in arguments]
 
-    # TODO: Clean this method ups
-
-    def create_filter(self, context: Context, bus: Bus, callback: TriggerCallback):
-        async def make_callback(*args, **kwargs):
-            callback(*args, **kwargs)
-
-        event_loop = asyncio.get_event_loop()
+    def event_layout(self, count: int) -> Tuple[Dict[str, int], List[str], List[int]]:
+        """The names, header getters and argument indices that events keep
+
+           Only the `fields` are kept, so that e.g. large arguments that no template
+           uses are not kept alive along with the event.
+        """
+        fields = self.fields
+        headers = [h for h in SIGNAL_HEADERS if fields is None or h in fields]
+        indices = [
+            i for i in range(count) if fields is None or f"sig_arg{i}" in fields
+        ]
+        names = headers + [f"sig_arg{i}" for i in indices]
+        return (
+            {name: i for i, name in enumerate(names)},
+            [SIGNAL_HEADERS[header] for header in headers],
+            indices,
+        )
 
-        def filter(conn, message, incoming):
-            try:
-                if incoming and self._should_handle(message, context):
-                    new_context = self.construct_callback_context(context, message)
-                    asyncio.run_coroutine_threadsafe(
-                        make_callback(new_context), event_loop
-                    )
-                return message
-            except Exception as ex:
-                logging.critical("Unhandled exception in filter thread: ", exc_info=ex)
-                exit(1)
-
-        return filter
-
-    def construct_callback_context(self, context: Context, message) -> Context:
-        return Context(
-            context,
-            {
-                "sig_sender": message.get_sender(),
-                "sig_path": message.get_path(),
-                "sig_interface": message.get_interface(),
-                "sig_name": message.get_member(),
-                "sig_destination": message.get_destination(),
-                **{f"sig_arg{i}": v for i, v in enumerate(message.get_body().unpack())},
-            },
+    def construct_callback_context(
+        self, context: Context, message, arguments: Tuple, layout=None
+    ) -> EventContext:
+        names, getters, indices = layout or self.event_layout(len(arguments))
+        headers = tuple(getattr(message, getter)() for getter in getters)
+        return EventContext(
+            context, names, headers + tuple(arguments[i] for i in indices)
         )
 
     def subscribe(
@@ -169,57 +247,28 @@ class DBusTrigger(TriggerSource):
         )
 
         bus.get("org.freedesktop.DBus").AddMatch(match_string)
-        _filter = bus.con.add_filter(self.create_filter(context, bus, callback))
+        # By the number of arguments. Only used on the dispatch worker.
+        layouts = {}
+
+        def on_signal(message, arguments: Tuple):
+            layout = layouts.get(len(arguments))
+            if layout is None:
+                layout = layouts[len(arguments)] = self.event_layout(len(arguments))
+            callback(
+                self.construct_callback_context(context, message, arguments, layout)
+            )
+
+        dispatcher = BusDispatcher.get(bus)
+        entry = dispatcher.add(
+            SignalMatch(sub_params, substitute_all(self.arguments, context)), on_signal
+        )
 
-        def unsubscribe(_filter=_filter, bus=bus):
-            bus.con.remove_filter(_filter)
+        def unsubscribe(entry=entry, bus=bus):
+            dispatcher.remove(entry)
             bus.get("org.freedesktop.DBus").RemoveMatch(match_string)
 
         return TriggerSubscription(unsubscribe)
 
-    def _should_handle(self, message, context: Context) -> bool:
-        """Check if the trigger should be tripped by the message"""
-
-        message_params = {
-            "sender": message.get_sender(),
-            "path": message.get_path(),
-            "interface": message.get_interface(),
-            "member": message.get_member(),
-            "destination": message.get_destination(),
-        }
-        logging.debug("Analyzing incoming message %s", message_params)
-        sub_params = substitute_all(self.sub_params, context)
-
-        for key in (k for k in sub_params if k != "eavesdrop"):
-            expected = sub_params[key]
-            actual = message_params[key]
-            if expected and expected != actual:
-                # logging.debug(
-                #     f"Ignoring message due to {key} mismatch (expected {expected}, got {actual})"
-                # )
-                return False
-
-        if not self._validate_arguments(message, context):
-            return False
-
-        logging.debug("Accepted incoming message %s", message_params)
-
-        # If everything was alright: return True
-        return True
-
-    def _validate_arguments(self, message, context) -> bool:
-        actual_args = message.get_body().unpack()
-        expected_args = substitute_all(self.arguments, context)
-        argument_pairs = zip(expected_args, actual_args)
-        filtered_pairs = ((e, a) for e, a in argument_pairs if e != None)
-        for expected_arg, actual in filtered_pairs:
-            if expected_arg != actual:
-                # logging.debug(
-                #     f"Ignoring message due to argument mismatch (expected {expected_args}, got {actual})"
-                # )
-                return False
-        return True
-
 
 class SleepTrigger(TriggerSource):
     def __init__(self, duration):
@@ -239,3 +288,263 @@ class SleepTrigger(TriggerSource):
 
         task = asyncio.get_event_loop().create_task(trigger())
         return TriggerSubscription(lambda task=task: task.cancel())
+
+
+class PropertyTrigger(TriggerSource):
+    """Triggers when an expression on the properties of a D-Bus object becomes true
+
+       With `end=True`, it instead triggers when the expression stops being true.
+       All property triggers on the same object share one `PropertyMirror`.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        path: str,
+        interface: str,
+        expression: str,
+        end: bool = False,
+        updates: bool = False,
+    ):
+        super().__init__()
+        self.service = Template(service)
+        self.path = Template(path)
+        self.interface = Template(interface)
+        self.expression = Comparison.parse(expression)
+        self.end = end
+        self.updates = updates
+
+    def inverse(self) -> "PropertyTrigger":
+        inverse = copy.copy(self)
+        inverse.end = not self.end
+        inverse.updates = False
+        return inverse
+
+    def subscribe(
+        self, bus: Bus, context: Context, callback: TriggerCallback
+    ) -> TriggerSubscription:
+        service, path, interface = substitute_all(
+            [self.service, self.path, self.interface], context
+        )
+        mirror = PropertyMirror.get(bus, service, path, interface)
+        watch = PropertyWatch(
+            self.expression, not self.end, context, callback, self.updates, self.fields
+        )
+        mirror.watch(watch)
+        return TriggerSubscription(lambda: mirror.unwatch(watch))
+
+
+class SystemTrigger(TriggerSource):
+    """Base of the triggers on the state of the local system
+
+       They trigger when their state becomes true, or with `end=True` when it stops
+       being true, so that they also end themselves when there is no 'until'. All of
+       them share one `SystemPoller`. The values that determined the state are
+       available to the actions as `sys_<name>`. With `updates`, they also trigger
+       whenever those values change while the state is true.
+    """
+
+    def __init__(self, interval: float = 1, end: bool = False, updates: bool = False):
+        super().__init__()
+        self.interval = interval
+        self.end = end
+        self.updates = updates
+
+    def inverse(self) -> "SystemTrigger":
+        inverse = copy.copy(self)
+        inverse.end = not self.end
+        inverse.updates = False
+        return inverse
+
+    @abc.abstractmethod
+    def _watch(
+        self,
+        poller: SystemPoller,
+        context: Context,
+        on_change: Callable[[bool, Dict[str, object]], None],
+    ) -> Callable[[], None]:
+        """Calls `on_change` with the state and its values, returns how to stop"""
+        pass
+
+    def subscribe(
+        self, bus: Bus, context: Context, callback: TriggerCallback
+    ) -> TriggerSubscription:
+        target = not self.end
+        # Assume the opposite, so the trigger fires if the target already holds
+        last = not target
+        last_values = None
+        active = True
+
+        def on_change(state: bool, values: Dict[str, object]):
+            nonlocal last, last_values
+            if not active:
+                return
+            if state == last and not (
+                self.updates and state == target and values != last_values
+            ):
+                return
+            last, last_values = state, values
+            if state == target:
+                callback(
+                    Context(context, {f"sys_{name}": v for name, v in values.items()})
+                )
+
+        stop = self._watch(SystemPoller.get(), context, on_change)
+
+        def cancel():
+            nonlocal active
+            active = False
+            stop()
+
+        return TriggerSubscription(cancel)
+
+
+class SensorTrigger(SystemTrigger):
+    """Triggers when an expression on a number in a file becomes true, e.g. `value > 70`
+
+       Meant for sysfs attributes, which are read every `interval` seconds. The value
+       is divided by `scale`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        expression: str,
+        interval: float = 1,
+        end: bool = False,
+        scale: float = 1,
+        updates: bool = False,
+    ):
+        super().__init__(interval, end, updates)
+        self.path = Template(path)
+        self.expression = Comparison.parse(expression)
+        self.scale = scale
+
+    def _path(self, context: Context) -> str:
+        return substitute_all(self.path, context)
+
+    def _parse(self, text: str) -> Dict[str, object]:
+        value = parse_literal(text)
+        if self.scale != 1 and type(value) in (int, float):
+            value /= self.scale
+        return {"value": value}
+
+    def _watch(self, poller, context, on_change):
+        path = self._path(context)
+
+        def on_read(text: str):
+            values = self._parse(text) if text is not None else {}
+            on_change(self.expression(values), {"path": path, **values})
+
+        return poller.sample(path, self.interval, on_read)
+
+
+class HwmonTrigger(SensorTrigger):
+    """A `SensorTrigger` on a hwmon sensor, e.g. the 'temp1' sensor of 'k10temp'
+
+       Values are in degrees Celsius, volts, amperes, watts and joules.
+    """
+
+    def __init__(
+        self,
+        chip: str,
+        sensor: str,
+        expression: str,
+        interval: float = 1,
+        end: bool = False,
+        updates: bool = False,
+    ):
+        super().__init__("", expression, interval, end, hwmon_scale(sensor), updates)
+        self.chip = Template(chip)
+        self.sensor = Template(sensor)
+
+    def _path(self, context: Context) -> str:
+        return find_hwmon_sensor(*substitute_all([self.chip, self.sensor], context))
+
+
+class LoadTrigger(SensorTrigger):
+    """A `SensorTrigger` on /proc/loadavg, e.g. `load1 > 4`
+
+       The values are `load1`, `load5`, `load15`, and the number of `running` and
+       `total` tasks.
+    """
+
+    def __init__(
+        self,
+        expression: str,
+        interval: float = 1,
+        end: bool = False,
+        updates: bool = False,
+    ):
+        super().__init__("/proc/loadavg", expression, interval, end, updates=updates)
+
+    def _parse(self, text: str) -> Dict[str, object]:
+        load1, load5, load15, tasks, _ = text.split()
+        running, total = tasks.split("/")
+        return {
+            "load1": float(load1),
+            "load5": float(load5),
+            "load15": float(load15),
+            "running": int(running),
+            "total": int(total),
+        }
+
+
+class FileTrigger(SystemTrigger):
+    """Triggers when a file exists, and (without 'until') ends when it is deleted"""
+
+    def __init__(self, path: str, interval: float = 1, end: bool = False):
+        super().__init__(interval, end)
+        self.path = Template(path)
+
+    def _watch(self, poller, context, on_change):
+        path = substitute_all(self.path, context)
+
+        def on_event():
+            on_change(os.path.exists(path), {"path": path})
+
+        poller.loop.call_soon(on_event)
+        return poller.watch_file(path, self.interval, on_event)
+
+
+class FileChangeTrigger(TriggerSource):
+    """Triggers every time a file is written or replaced"""
+
+    def __init__(self, path: str, interval: float = 1):
+        super().__init__()
+        self.path = Template(path)
+        self.interval = interval
+
+    def subscribe(
+        self, bus: Bus, context: Context, callback: TriggerCallback
+    ) -> TriggerSubscription:
+        path = substitute_all(self.path, context)
+
+        def on_event():
+            if os.path.exists(path):
+                callback(Context(context, {"sys_path": path}))
+
+        stop = SystemPoller.get().watch_file(path, self.interval, on_event)
+        return TriggerSubscription(stop)
+
+
+class ProcessTrigger(SystemTrigger):
+    """Triggers when a process with a matching name runs, until the last one exits
+
+       Names are globs or 're:' patterns. The values are the lowest matching `pid`
+       and the `count` of matching processes.
+    """
+
+    def __init__(
+        self, name: str, interval: float = 1, end: bool = False, updates: bool = False
+    ):
+        super().__init__(interval, end, updates)
+        self.name = Template(name)
+
+    def _watch(self, poller, context, on_change):
+        def on_processes(pids: Set[int]):
+            values = {"pid": min(pids), "count": len(pids)} if pids else {"count": 0}
+            on_change(bool(pids), values)
+
+        name = substitute_all(self.name, context)
+        return poller.watch_processes(name, self.interval, on_processes)
@@ -1,7 +1,11 @@
 import collections.abc
+import importlib
+import importlib.util
+import sys
+import types
 from functools import partial
 from string import Template
-from typing import Dict, List, Union
+from typing import Dict, List, Mapping, Set, Tuple, Union
 
 
 def substitute_all(
@@ -17,22 +21,121 @@ def substitute_all(
         return templates
 
 
+class _LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is used"""
+
+    def __getattr__(self, attribute: str):
+        # The import system makes other threads wait until the module is executed
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+
+def lazy_import(name: str):
+    """Returns the module, but only executes it once one of its attributes is used
+
+       Keeps heavy dependencies off the startup path until they are actually needed.
+       Unlike `importlib.util.LazyLoader`, this can first be used from several
+       threads at once, e.g. by the thread that connects to OpenRGB and the main
+       thread.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    return _LazyModule(name)
+
+
 class Context(dict):
-    def __init__(self, parent: dict = {}, iterable={}):
-        super().__init__(iterable)
-        self._parent = parent
+    """The parameters of a hook, on top of those of its parent
 
-    def __len__(self):
-        return super().__len__() + self._parent.__len__()
+       The parent's parameters are copied, so a lookup never has to go through a
+       chain of parents.
+    """
 
-    def __missing__(self, key):
-        return self._parent[key] if self._parent else super().__missing__(key)
+    def __init__(self, parent: Mapping = {}, iterable={}):
+        super().__init__(parent)
+        self.update(iterable)
 
     __getattr__ = dict.__getitem__
     __setattr__ = dict.__setitem__
     __delattr__ = dict.__delitem__
 
 
+class EventContext(collections.abc.Mapping):
+    """The context of a single event: a few values on top of a `Context`
+
+       Events can be frequent and can be kept alive for as long as the hook they
+       activated, so they do not get a dict of their own. The names of the values
+       are shared by all events of a subscription.
+
+       :param names: the index of every value in `values`, by name
+    """
+
+    __slots__ = ("_context", "_names", "_values")
+
+    def __init__(self, context: Mapping, names: Dict[str, int], values: Tuple):
+        self._context = context
+        self._names = names
+        self._values = values
+
+    def __getitem__(self, key):
+        index = self._names.get(key)
+        if index is None:
+            return self._context[key]
+        return self._values[index]
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __iter__(self):
+        yield from self._names
+        for key in self._context:
+            if key not in self._names:
+                yield key
+
+    def __len__(self):
+        return len(self._names) + sum(1 for k in self._context if k not in self._names)
+
+
+def referenced_names(value, _seen: Set[int] = None) -> Set[str]:
+    """The context parameters that the templates in a value, or in its parts, use
+
+       Looks into lists, tuples, dicts and the attributes of the objects of this
+       package. Objects that read parameters without a template can say so with a
+       `references()` method instead.
+    """
+    if isinstance(value, Template):
+        return {
+            match.group("named") or match.group("braced")
+            for match in value.pattern.finditer(value.template)
+            if match.group("named") or match.group("braced")
+        }
+
+    _seen = set() if _seen is None else _seen
+    if id(value) in _seen:
+        return set()
+    _seen.add(id(value))
+
+    if isinstance(value, collections.abc.Mapping):
+        value = list(value.values())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        names = set()
+        for item in value:
+            names |= referenced_names(item, _seen)
+        return names
+    if callable(getattr(value, "references", None)):
+        return value.references()
+    if type(value).__module__.split(".")[0] == __package__ and hasattr(
+        value, "__dict__"
+    ):
+        return referenced_names(vars(value), _seen)
+    return set()
+
+
 # From https://gist.github.com/angstwad/bf22d1822c38a92ec0a9#gistcomment-3305932
 def dict_merge(*args, add_keys=True):
     assert len(args) >= 2, "dict_merge requires at least two dicts to merge"
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from openrgbdbus.backends import (
+    PREVIOUS_RECORDING_SUFFIX,
+    DeviceInfo,
+    FrameRecording,
+    NullBackend,
+    RecordingBackend,
+    ZoneInfo,
+)
+
+
+class WatchedBackend(NullBackend):
+    """A null backend of which the test changes the devices"""
+
+    def watch(self, event_loop, callback):
+        self.callback = callback
+
+
+def strip(leds: int) -> DeviceInfo:
+    return DeviceInfo("Strip", [ZoneInfo("Strip", leds)])
+
+
+class RecordingBackendTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "frames.ring")
+
+    def test_topology_change_starts_a_new_recording(self):
+        forward = WatchedBackend([strip(10)])
+        backend = RecordingBackend(self.path, forward, frames=4)
+        changes = []
+        backend.watch(None, changes.append)
+        backend.write(0, np.full((10, 3), 1, np.uint8), 0, 10)
+
+        # The strip grew, so its frames no longer fit the slots of the recording
+        forward.callback([strip(30)])
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(backend.devices()[0].led_count, 30)
+        backend.write(0, np.full((30, 3), 2, np.uint8), 0, 30)
+        backend.close()
+
+        previous = list(FrameRecording(self.path + PREVIOUS_RECORDING_SUFFIX))
+        self.assertEqual([len(frame) for *_, frame in previous], [10])
+        recording = FrameRecording(self.path)
+        self.assertEqual(recording.devices[0]["zones"][0]["leds"], 30)
+        frames = [frame for *_, frame in recording]
+        self.assertEqual(len(frames), 1)
+        self.assertTrue((frames[0] == 2).all())
+        self.assertEqual(forward.writes, 2)
+
+    def test_same_topology_keeps_the_recording(self):
+        forward = WatchedBackend([strip(10)])
+        backend = RecordingBackend(self.path, forward, frames=4)
+        backend.watch(None, lambda devices: None)
+        backend.write(0, np.full((10, 3), 1, np.uint8), 0, 10)
+        forward.callback([strip(10)])
+        backend.write(0, np.full((10, 3), 2, np.uint8), 0, 10)
+        backend.close()
+
+        self.assertEqual(len(FrameRecording(self.path)), 2)
+        self.assertFalse(os.path.exists(self.path + PREVIOUS_RECORDING_SUFFIX))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import time
+import unittest
+
+from openrgbdbus.conditions import AllCondition, Condition
+from openrgbdbus.configuration.object_factories import TriggerConditionFactory
+from openrgbdbus.utils import Context
+
+
+class FakeBus:
+    """Answers every method call with `result`"""
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def get(self, service: str, path: str = None):
+        return self
+
+    def __getattr__(self, name):
+        def method(*args):
+            self.calls += 1
+            return self.result
+
+        return method
+
+
+def condition(**definition):
+    return TriggerConditionFactory.create(
+        {"service_name": "org.example.Test", "path": "/", "method": "Get", **definition}
+    )
+
+
+class ResponseTest(unittest.TestCase):
+    def test_unquoted_number_matches_text(self):
+        self.assertTrue(condition(response=1).evaluate(FakeBus("1"), Context()))
+        self.assertTrue(condition(response=1).evaluate(FakeBus(1), Context()))
+        self.assertFalse(condition(response=1).evaluate(FakeBus("2"), Context()))
+
+    def test_unquoted_boolean_matches_text(self):
+        self.assertTrue(condition(response=True).evaluate(FakeBus("True"), Context()))
+        self.assertTrue(condition(response=True).evaluate(FakeBus(True), Context()))
+        self.assertFalse(condition(response=True).evaluate(FakeBus(1), Context()))
+
+    def test_string_response_is_parsed(self):
+        self.assertTrue(condition(response="20").evaluate(FakeBus(20), Context()))
+        self.assertTrue(condition(response="20").evaluate(FakeBus("20"), Context()))
+        less = condition(response="20", operator="<")
+        self.assertTrue(less.evaluate(FakeBus(10), Context()))
+
+
+class TimedCondition(Condition):
+    """Takes `seconds`, except when the result is cached for `cached` calls"""
+
+    def __init__(self, name: str, seconds: float, order: list, cached: int = 0):
+        super().__init__()
+        self.name = name
+        self.seconds = seconds
+        self.order = order
+        self.cached = cached
+        self._remaining = 0
+
+    def _evaluate(self, bus, context: Context) -> bool:
+        self.order.append(self.name)
+        if self._remaining:
+            self._remaining -= 1
+            self.cache_hits += 1
+        else:
+            self._remaining = self.cached
+            time.sleep(self.seconds)
+        return True
+
+
+class OrderTest(unittest.TestCase):
+    def test_cached_expensive_condition_goes_after_cheap_one(self):
+        order = []
+        # Missing the cache once every 20 calls still costs 1ms per call on average
+        cached = TimedCondition("cached", 0.02, order, cached=19)
+        cheap = TimedCondition("cheap", 0.0002, order)
+        for _ in range(20):
+            cached.evaluate(None, Context())
+            cheap.evaluate(None, Context())
+        self.assertAlmostEqual(cached.hit_rate, 0.95)
+
+        order.clear()
+        AllCondition([cached, cheap]).evaluate(None, Context())
+        self.assertEqual(order, ["cheap", "cached"])
+
+
+if __name__ == "__main__":
+    unittest.main()
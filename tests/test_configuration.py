@@ -0,0 +1,38 @@
+import unittest
+
+from openrgbdbus.configuration.object_factories import HookFactory, TriggerFactory
+from openrgbdbus.trigger import FileTrigger
+
+TRIGGER = {"signal": {"path": "/", "interface": "org.example.Test", "name": "Ping"}}
+UNTIL = {"sleep": {"duration": "1s"}}
+
+
+class HookFactoryTest(unittest.TestCase):
+    def test_hook_without_actions_is_rejected(self):
+        with self.assertRaisesRegex(Exception, "'test' needs 'action' or 'actions'"):
+            HookFactory.create({"trigger": TRIGGER, "until": UNTIL}, name="test")
+
+    def test_hook_with_single_action(self):
+        hook = HookFactory.create(
+            {
+                "trigger": TRIGGER,
+                "until": UNTIL,
+                "action": {"device_id": 0, "color": [255, 0, 0]},
+            },
+            name="test",
+        )
+        self.assertIsNotNone(hook.action)
+
+
+class FileTriggerFactoryTest(unittest.TestCase):
+    def test_updates_without_expression_is_rejected(self):
+        with self.assertRaisesRegex(Exception, "'updates' can only be used"):
+            TriggerFactory.create({"file": {"path": "/tmp/x", "updates": True}})
+
+    def test_existence(self):
+        trigger = TriggerFactory.create({"file": {"path": "/tmp/x"}})
+        self.assertIsInstance(trigger.source, FileTrigger)
+
+
+if __name__ == "__main__":
+    unittest.main()
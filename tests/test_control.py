@@ -0,0 +1,54 @@
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+
+from openrgbdbus.control import ControlServer, send_command
+
+
+class ControlServerTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "control.sock")
+
+    def start(self) -> ControlServer:
+        server = ControlServer(self.path)
+        server.register("ping", lambda: "pong")
+        self.loop.run_until_complete(server.start())
+        return server
+
+    def send(self, command: str):
+        future = self.loop.run_in_executor(
+            None, lambda: send_command(command, self.path, timeout=5)
+        )
+        return self.loop.run_until_complete(future)
+
+    def test_running_server_keeps_its_socket(self):
+        server = self.start()
+        self.addCleanup(server.close)
+        with self.assertRaisesRegex(Exception, "already listening"):
+            self.start()
+        self.assertEqual(self.send("ping"), "pong")
+
+    def test_stale_socket_is_replaced(self):
+        # A socket file without a listener, as left behind by a crashed connector
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+            stale.bind(self.path)
+        server = self.start()
+        self.addCleanup(server.close)
+        self.assertEqual(self.send("ping"), "pong")
+
+    def test_other_files_are_kept(self):
+        with open(self.path, "w") as f:
+            f.write("not a socket")
+        with self.assertRaisesRegex(Exception, "is not a socket"):
+            self.start()
+        self.assertTrue(os.path.isfile(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from gi.repository import Gio, GLib
+
+from benchmarks.fake_openrgb import FakeOpenRGBServer
+from openrgbdbus import Connector
+from openrgbdbus.trace import TraceRecorder, TraceReplayer
+
+COLOR_SERVICE = "org.gnome.SettingsDaemon.Color"
+COLOR_PATH = "/org/gnome/SettingsDaemon/Color"
+
+
+def night_light_changed(active: bool):
+    message = Gio.DBusMessage.new_signal(
+        COLOR_PATH, "org.freedesktop.DBus.Properties", "PropertiesChanged"
+    )
+    message.set_body(
+        GLib.Variant(
+            "(sa{sv}as)",
+            (COLOR_SERVICE, {"NightLightActive": GLib.Variant("b", active)}, []),
+        )
+    )
+    # Recorded from the owner of the service, a unique name that is gone by now
+    message.set_sender(":1.42")
+    message.set_serial(1)
+    return message
+
+
+class PropertyReplayTest(unittest.TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.trace = os.path.join(directory.name, "trace.jsonl")
+
+    def replay(self, *messages) -> int:
+        """Replays the messages into the night light hook, and returns the writes"""
+        recorder = TraceRecorder(self.trace)
+        for message in messages:
+            recorder.record("session", message)
+        recorder.close()
+
+        with FakeOpenRGBServer() as server:
+            connector = Connector.fromConfig(
+                {
+                    "version": "0.4.0",
+                    "server": {"host": "127.0.0.1", "port": server.port},
+                    "output": {"backend": "null"},
+                    "hooks": {
+                        "night_light": {
+                            "bus": "session",
+                            "actions": [
+                                {"device_id": 0, "zones": [0], "color": [255, 255, 0]}
+                            ],
+                            "trigger": {
+                                "property": {
+                                    "service": COLOR_SERVICE,
+                                    "path": COLOR_PATH,
+                                    "interface": COLOR_SERVICE,
+                                    "expression": "NightLightActive == true",
+                                }
+                            },
+                        }
+                    },
+                }
+            )
+            connector.replay(TraceReplayer(self.trace, speed=0))
+            connector.start()
+        return connector.backend.writes
+
+    def test_replayed_change_fires_hook(self):
+        self.assertGreater(self.replay(night_light_changed(True)), 0)
+
+    def test_replayed_change_to_other_value(self):
+        self.assertEqual(self.replay(night_light_changed(False)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
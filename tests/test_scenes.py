@@ -0,0 +1,78 @@
+import unittest
+
+from openrgb import OpenRGBClient
+from openrgb.utils import PacketType
+
+from benchmarks.fake_openrgb import FakeOpenRGBServer
+from openrgbdbus.actions import ActionStack, BaseAction, ZoneAction
+from openrgbdbus.backends import OpenRGBBackend
+from openrgbdbus.scenes import Scene
+from openrgbdbus.utils import Context
+
+# The motherboard of the default topology: two fans of 8 LEDs and a strip of 60
+MOTHERBOARD = 1
+
+
+class WritePacketTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRGBServer().start()
+        self.addCleanup(self.server.stop)
+        client = OpenRGBClient("127.0.0.1", self.server.port, "Scene test")
+        self.addCleanup(client.disconnect)
+        self.stack = ActionStack(OpenRGBBackend(client))
+        self.context = Context({"action_stack": self.stack})
+        self.server.settle()
+        self.server.reset_packets()
+
+    def packets(self) -> dict:
+        self.server.settle()
+        return {
+            packet_type: self.server.packet_count(packet_type)
+            for packet_type in PacketType
+            if self.server.packet_count(packet_type)
+        }
+
+    def assertWrittenOnce(self, devices: int):
+        """One packet per device, of which the motherboard's is a device update"""
+        self.server.settle()
+        self.assertEqual(self.server.packet_count(), devices)
+        with self.server.lock:
+            packets = [p for p in self.server.packets if p.device == MOTHERBOARD]
+        self.assertEqual(
+            [p.type for p in packets], [PacketType.RGBCONTROLLER_UPDATELEDS]
+        )
+
+    def test_scene_restore_writes_each_device_once(self):
+        frames = [frame.copy() for frame in self.stack.frames]
+        for frame in frames:
+            frame[:] = (255, 0, 255)
+        # Only the fans of the motherboard change, which would fit two zone updates
+        frames[MOTHERBOARD][16:] = self.stack.frames[MOTHERBOARD][16:]
+        scene = Scene.capture("test", self.stack.devices, frames)
+
+        cookie = self.stack.push_state({"scene": scene})
+        self.assertWrittenOnce(len(frames))
+        self.assertEqual(self.server.colors(MOTHERBOARD)[:16], [(255, 0, 255)] * 16)
+
+        self.server.reset_packets()
+        self.stack.remove_state(cookie)
+        self.assertWrittenOnce(len(frames))
+        self.assertEqual(self.server.colors(MOTHERBOARD), [(0, 0, 0)] * 76)
+
+    def test_small_zones_are_written_separately(self):
+        action = ZoneAction(
+            BaseAction(), zones=[0, 1], color=[255, 0, 0], device=MOTHERBOARD
+        )
+        action.act(self.context)
+        self.assertEqual(self.packets(), {PacketType.RGBCONTROLLER_UPDATEZONELEDS: 2})
+
+    def test_large_zones_are_written_at_once(self):
+        action = ZoneAction(
+            BaseAction(), zones=[0, 1, 2], color=[255, 0, 0], device=MOTHERBOARD
+        )
+        action.act(self.context)
+        self.assertEqual(self.packets(), {PacketType.RGBCONTROLLER_UPDATELEDS: 1})
+
+
+if __name__ == "__main__":
+    unittest.main()